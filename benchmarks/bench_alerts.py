@@ -0,0 +1,125 @@
+"""
+Throughput benchmark for the alert rule evaluator.
+
+Creates ``--sensors`` sensors with one sensor-scoped rule each (10k by
+default) plus a rule per sensor type in a throwaway test database, then
+feeds ``--readings`` broadcast payloads through ``AlertEngine.evaluate`` in
+batches the size the ingest buffer writes. ``--breach-rate`` of the
+readings leave their bounds, so alerts fire and resolve (and are written)
+along the way. The target is 50k readings/s; the run exits with status 1
+below ``--target``.
+
+Usage:
+    python benchmarks/bench_alerts.py
+    python benchmarks/bench_alerts.py --sensors 20000 --readings 1000000 --breach-rate 0.01
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartanom_backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from core.alerts import AlertEngine  # noqa: E402
+from core.models import Alert, AlertRule, Device, Sensor, User  # noqa: E402
+
+SENSOR_TYPES = [choice for choice, _ in Sensor.SENSOR_TYPE_CHOICES]
+DEVICE_SENSORS = 5
+
+
+def create_fixture(sensor_count):
+    """Create the sensors and rules; return the sensors as ``(sensor_id, device_id, sensor_type)``"""
+    user = User.objects.create_user(email='bench@smartanom.com', password='bench')
+    devices = Device.objects.bulk_create([
+        Device(user=user, user_email=user.email, device_name=f'Bench Device {n + 1}', status='active')
+        for n in range(-(-sensor_count // DEVICE_SENSORS))
+    ])
+    Sensor.objects.bulk_create([
+        Sensor(device=devices[n // DEVICE_SENSORS], sensor_type=SENSOR_TYPES[n % len(SENSOR_TYPES)], unit='ph_units')
+        for n in range(sensor_count)
+    ], batch_size=1000)
+    sensors = list(Sensor.objects.order_by('sensor_id').values_list('sensor_id', 'device_id', 'sensor_type'))
+    AlertRule.objects.bulk_create([
+        AlertRule(name=f'Sensor {sensor_id}', sensor_id=sensor_id, min_value=0.0, max_value=100.0,
+                  hysteresis=1.0)
+        for sensor_id, _, _ in sensors
+    ] + [
+        AlertRule(name=f'Any {sensor_type}', sensor_type=sensor_type, max_value=1000.0)
+        for sensor_type in SENSOR_TYPES
+    ], batch_size=1000)
+    return sensors
+
+
+def make_payloads(sensors, count, breach_rate, seconds):
+    """``count`` reading payloads spread over ``seconds``, ``breach_rate`` of them out of bounds"""
+    start = timezone.now()
+    payloads = []
+    for n in range(count):
+        sensor_id, device_id, sensor_type = sensors[n % len(sensors)]
+        value = 150.0 if random.random() < breach_rate else random.uniform(10.0, 90.0)
+        payloads.append({
+            'id': n + 1,
+            'sensor_id': sensor_id,
+            'sensor_type': sensor_type,
+            'device_id': device_id,
+            'device_name': 'Bench Device',
+            'value': value,
+            'unit': 'ph_units',
+            'timestamp': (start + timedelta(seconds=seconds * n / count)).isoformat(),
+        })
+    return payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sensors', type=int, default=10000, help='Sensors, each with its own rule')
+    parser.add_argument('--readings', type=int, default=200000)
+    parser.add_argument('--breach-rate', type=float, default=0.001)
+    parser.add_argument('--batch-size', type=int, default=settings.SENSOR_INGEST_BUFFER['MAX_BATCH_SIZE'])
+    parser.add_argument('--target', type=float, default=50000, help='Readings per second required')
+    args = parser.parse_args()
+
+    random.seed(42)
+    setup_test_environment()
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        sensors = create_fixture(args.sensors)
+        rule_count = AlertRule.objects.count()
+        payloads = make_payloads(sensors, args.readings, args.breach_rate, seconds=args.readings / args.target)
+        batches = [payloads[n:n + args.batch_size] for n in range(0, len(payloads), args.batch_size)]
+
+        engine = AlertEngine()
+        engine.evaluate([])  # load the rules
+        with mock.patch('core.alerts.fanout'):
+            started = time.perf_counter()
+            for batch in batches:
+                engine.evaluate(batch)
+            elapsed = time.perf_counter() - started
+        alerts = Alert.objects.count()
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+
+    rate = args.readings / elapsed
+    print(f'{rule_count} rules, {len(sensors)} sensors, {args.readings} readings in batches of {args.batch_size}, '
+          f'{alerts} alerts fired')
+    print(f'{rate:,.0f} readings/s ({elapsed / args.readings * 1e6:.2f} us per reading, '
+          f'target {args.target:,.0f}/s)')
+    if rate < args.target:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Overhead benchmark for the metrics instrumentation.
+
+Times ``MetricsMiddleware`` around a view that does nothing, the per-query
+execute wrapper, and the per-message cost of ``WebSocketMetricsMiddleware``,
+each against the same call without instrumentation. The target is under
+50 us added per request.
+
+Usage:
+    python benchmarks/bench_metrics.py
+    python benchmarks/bench_metrics.py --iterations 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartanom_backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.urls import resolve  # noqa: E402
+from core.metrics import (  # noqa: E402
+    MetricsMiddleware, RequestStats, WebSocketMetricsMiddleware, _current_request, count_queries
+)
+from core.routing import websocket_urlpatterns  # noqa: E402
+
+
+def per_call_us(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def bench_request(iterations):
+    request = RequestFactory().get('/api/sensors/1/latest_data/')
+    request.resolver_match = resolve('/api/sensors/1/latest_data/')
+    response = HttpResponse()
+
+    def view(request):
+        return response
+
+    middleware = MetricsMiddleware(view)
+    bare = per_call_us(lambda: view(request), iterations)
+    instrumented = per_call_us(lambda: middleware(request), iterations)
+    return instrumented - bare
+
+
+def bench_query(iterations):
+    def execute(sql, params, many, context):
+        return None
+
+    token = _current_request.set(RequestStats())
+    try:
+        bare = per_call_us(lambda: execute('SELECT 1', (), False, {}), iterations)
+        wrapped = per_call_us(lambda: count_queries(execute, 'SELECT 1', (), False, {}), iterations)
+    finally:
+        _current_request.reset(token)
+    return wrapped - bare
+
+
+async def bench_websocket(messages):
+    """Push ``messages`` frames through an application that echoes them, with and without the wrapper"""
+    async def echo(scope, receive, send):
+        await receive()  # websocket.connect
+        await send({'type': 'websocket.accept'})
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            await send({'type': 'websocket.send', 'text': message['text']})
+
+    async def run(application):
+        incoming = [{'type': 'websocket.connect'}] + [
+            {'type': 'websocket.receive', 'text': 'x'} for _ in range(messages)
+        ] + [{'type': 'websocket.disconnect', 'code': 1000}]
+        incoming.reverse()
+
+        async def receive():
+            return incoming.pop()
+
+        async def send(message):
+            pass
+
+        scope = {'type': 'websocket', 'path': '/ws/sensor-data/'}
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        return (time.perf_counter() - started) / messages * 1e6
+
+    bare = await run(echo)
+    instrumented = await run(WebSocketMetricsMiddleware(echo, websocket_urlpatterns))
+    return instrumented - bare
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f'{args.iterations} iterations, overhead per call')
+    print(f'{"HTTP request":<22} {bench_request(args.iterations):8.2f} us')
+    print(f'{"database query":<22} {bench_query(args.iterations):8.2f} us')
+    print(f'{"WebSocket message":<22} {asyncio.run(bench_websocket(args.iterations)):8.2f} us '
+          f'(one received and one sent)')
+
+
+if __name__ == '__main__':
+    main()
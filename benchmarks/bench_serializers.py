@@ -0,0 +1,108 @@
+"""
+Serialization benchmark for sensor reading listings.
+
+Loads N synthetic readings into a throwaway test database and times a full
+list response body both ways: model instances through
+``SensorDataSerializer`` and ``JSONRenderer`` (the old path), and
+``.values()`` rows through ``SensorDataValuesSerializer`` and
+``FastJSONRenderer``. Both bodies are checked to be byte-identical.
+
+Usage:
+    python benchmarks/bench_serializers.py --rows 10000
+    python benchmarks/bench_serializers.py --rows 10000 --sensors 50 --iterations 50
+
+``FastJSONRenderer`` uses orjson when it is installed and the stdlib encoder
+otherwise; the encoder in use is printed.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartanom_backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from core import renderers  # noqa: E402
+from core.models import User, Device, Sensor, SensorData  # noqa: E402
+from core.renderers import FastJSONRenderer  # noqa: E402
+from core.serializers import SensorDataSerializer, SensorDataValuesSerializer  # noqa: E402
+from core.views import SENSOR_DATA_READ_PLAN, apply_query_plan  # noqa: E402
+
+
+def load_rows(rows, sensors):
+    user = User.objects.create_user(email='bench@smartanom.com', password='bench')
+    device = Device.objects.create(user=user, user_email=user.email, device_name='Bench Device')
+    sensor_list = Sensor.objects.bulk_create([
+        Sensor(device=device, sensor_type='temperature', unit='celsius')
+        for _ in range(sensors)
+    ])
+    end = timezone.now()
+    readings = SensorData.objects.bulk_create([
+        SensorData(sensor=sensor_list[n % sensors], value=round(random.uniform(0, 100), 2),
+                   measured_at=end - timedelta(seconds=n))
+        for n in range(rows)
+    ], batch_size=1000)
+    # created_at is auto_now_add; spread it out like a real listing
+    SensorData.objects.filter(pk__in=[reading.pk for reading in readings[::2]]).update(
+        created_at=end - timedelta(hours=1)
+    )
+
+
+def model_path(rows):
+    queryset = apply_query_plan(SensorData.objects.all(), SENSOR_DATA_READ_PLAN)[:rows]
+    return JSONRenderer().render(SensorDataSerializer(queryset, many=True).data)
+
+
+def values_path(rows):
+    queryset = SensorDataValuesSerializer.values(SensorData.objects.all())[:rows]
+    return FastJSONRenderer().render(SensorDataValuesSerializer(queryset, many=True).data)
+
+
+def time_path(label, func, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f'{label:<28} p50 {statistics.median(samples):8.1f} ms   p95 {p95:8.1f} ms')
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--sensors', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        load_rows(args.rows, args.sensors)
+        encoder = 'orjson' if renderers.orjson is not None else 'stdlib json'
+        print(f'{connection.vendor}, {args.rows} rows, {encoder}')
+
+        if model_path(args.rows) != values_path(args.rows):
+            sys.exit('Response bodies differ')
+
+        slow = time_path('ModelSerializer + JSON', lambda: model_path(args.rows), args.iterations)
+        fast = time_path('values() + FastJSON', lambda: values_path(args.rows), args.iterations)
+        print(f'speedup {slow / fast:.1f}x')
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
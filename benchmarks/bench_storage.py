@@ -0,0 +1,133 @@
+"""
+Storage benchmark for the sensor readings table.
+
+Loads N synthetic readings into a throwaway test database and times the two
+queries the API relies on: a sensor's latest reading (``latest_data``,
+``SensorConsumer`` connect) and a one-hour range scan of a single sensor
+(``data_history``).
+
+Usage:
+    python benchmarks/bench_storage.py --rows 1000000
+    python benchmarks/bench_storage.py --rows 100000000 --sensors 1000 --partitioned --keepdb
+
+``--keepdb`` reuses the loaded test database between runs. ``--partitioned``
+converts the table with ``partition_sensor_data`` first (PostgreSQL only).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartanom_backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from core import partitioning  # noqa: E402
+from core.models import User, Device, Sensor, SensorData  # noqa: E402
+
+
+def load_rows(sensor_ids, rows, end):
+    """Insert ``rows`` readings spread round-robin over ``sensor_ids``, one second apart per sensor"""
+    table = SensorData._meta.db_table
+    sensor_count = len(sensor_ids)
+    first_sensor = sensor_ids[0]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"INSERT INTO {table} (sensor_id, value, created_at) "
+                f"SELECT %s + (n %% %s), random() * 100, %s - (n / %s) * interval '1 second' "
+                f"FROM generate_series(0, %s - 1) AS n",
+                [first_sensor, sensor_count, end, sensor_count, rows]
+            )
+            cursor.execute(f"ANALYZE {table}")
+            return
+
+        chunk = 50000
+        for offset in range(0, rows, chunk):
+            cursor.executemany(
+                f"INSERT INTO {table} (sensor_id, value, created_at) VALUES (%s, %s, %s)",
+                [
+                    (sensor_ids[n % sensor_count], random.random() * 100,
+                     end - timedelta(seconds=n // sensor_count))
+                    for n in range(offset, min(offset + chunk, rows))
+                ]
+            )
+        cursor.execute(f"ANALYZE {table}")
+
+
+def time_query(label, func, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f'{label:<28} p50 {statistics.median(samples):8.3f} ms   p95 {p95:8.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--partitioned', action='store_true')
+    parser.add_argument('--keepdb', action='store_true')
+    args = parser.parse_args()
+
+    test_db = connection.creation.create_test_db(verbosity=0, keepdb=args.keepdb)
+    try:
+        end = timezone.now().replace(microsecond=0)
+        sensor_ids = list(Sensor.objects.order_by('sensor_id').values_list('sensor_id', flat=True))
+        if not sensor_ids:
+            user = User.objects.create_user(email='bench@smartanom.com', password='bench')
+            device = Device.objects.create(user=user, user_email=user.email, device_name='Bench Device')
+            Sensor.objects.bulk_create([
+                Sensor(device=device, sensor_type='temperature', unit='celsius')
+                for _ in range(args.sensors)
+            ])
+            sensor_ids = list(Sensor.objects.order_by('sensor_id').values_list('sensor_id', flat=True))
+
+            if args.partitioned:
+                partitioning.convert_to_partitioned()
+                span = timedelta(seconds=args.rows // len(sensor_ids))
+                month = partitioning.month_start(end - span)
+                while month <= end:
+                    partitioning.create_partition(month)
+                    month = partitioning.add_months(month, 1)
+
+            started = time.perf_counter()
+            load_rows(sensor_ids, args.rows, end)
+            print(f'Loaded {args.rows} rows in {time.perf_counter() - started:.1f}s')
+
+        print(f'{connection.vendor}, {SensorData.objects.count()} rows, {len(sensor_ids)} sensors')
+        span_seconds = args.rows // len(sensor_ids)
+
+        def latest():
+            SensorData.objects.filter(sensor_id=random.choice(sensor_ids)).first()
+
+        def one_hour_range():
+            since = end - timedelta(seconds=random.randrange(max(span_seconds - 3600, 1)))
+            list(SensorData.objects.filter(
+                sensor_id=random.choice(sensor_ids),
+                created_at__gte=since - timedelta(hours=1),
+                created_at__lt=since,
+            ).values_list('created_at', 'value'))
+
+        time_query('latest reading', latest, args.iterations)
+        time_query('1h range, one sensor', one_hour_range, args.iterations)
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0, keepdb=args.keepdb)
+
+
+if __name__ == '__main__':
+    main()
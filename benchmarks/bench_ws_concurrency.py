@@ -0,0 +1,145 @@
+"""
+Connection-storm benchmark for the WebSocket consumers.
+
+Opens N device sockets at once against a throwaway test database, timing
+each connect (including its device snapshot), then opens one sensor
+socket per device, sends one acked reading on each and times each ack.
+Run it with and without a consumer DB pool to compare:
+
+Usage:
+    python benchmarks/bench_ws_concurrency.py --sockets 5000
+    python benchmarks/bench_ws_concurrency.py --sockets 5000 --pool-size 16
+
+Everything runs in one process on the in-memory channel layer (with its
+expiry sweep throttled, see ``BenchChannelLayer``), so the numbers show
+where consumers queue (the DB thread vs the database), not what a
+deployment behind Daphne would reach.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartanom_backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from channels.layers import InMemoryChannelLayer  # noqa: E402
+from channels.routing import URLRouter  # noqa: E402
+from channels.testing import WebsocketCommunicator  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from core.latest import latest_values  # noqa: E402
+from core.models import User, Device, Sensor, SensorData  # noqa: E402
+from core.routing import websocket_urlpatterns  # noqa: E402
+
+
+class BenchChannelLayer(InMemoryChannelLayer):
+    """
+    In-memory layer that sweeps expired messages at most once a second. The
+    stock layer walks every channel and group on each receive, which at
+    thousands of sockets costs more than anything being measured.
+    """
+    swept_at = 0.0
+
+    def _clean_expired(self):
+        now = time.monotonic()
+        if now - self.swept_at >= 1:
+            self.swept_at = now
+            super()._clean_expired()
+
+
+def create_devices(devices):
+    user = User.objects.create_user(email='bench@smartanom.com', password='bench')
+    device_list = Device.objects.bulk_create([
+        Device(user=user, user_email=user.email, device_name=f'Bench Device {n}', status='active')
+        for n in range(devices)
+    ])
+    sensors = Sensor.objects.bulk_create([
+        Sensor(device=device, sensor_type='temperature', unit='celsius')
+        for device in device_list
+    ])
+    return [device.device_id for device in device_list], [sensor.sensor_id for sensor in sensors]
+
+
+def summarize(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f'{label:<10} p50 {statistics.median(samples):8.1f} ms   p95 {p95:8.1f} ms   '
+          f'p99 {p99:8.1f} ms   max {samples[-1]:8.1f} ms')
+
+
+async def connect(application, path, samples):
+    communicator = WebsocketCommunicator(application, path)
+    started = time.perf_counter()
+    connected, _ = await communicator.connect(timeout=300)
+    if connected:
+        await communicator.receive_json_from(timeout=300)
+        samples.append((time.perf_counter() - started) * 1000)
+    return communicator
+
+
+async def send_reading(communicator, samples):
+    started = time.perf_counter()
+    await communicator.send_json_to({'type': 'sensor_reading', 'value': 21.5, 'ack': True})
+    while (await communicator.receive_json_from(timeout=300))['type'] != 'ack':
+        pass
+    samples.append((time.perf_counter() - started) * 1000)
+
+
+async def storm(device_ids, sensor_ids):
+    application = URLRouter(websocket_urlpatterns)
+
+    connect_samples = []
+    started = time.perf_counter()
+    devices = await asyncio.gather(*[
+        connect(application, f'/ws/device/{device_id}/', connect_samples) for device_id in device_ids
+    ])
+    print(f'{len(connect_samples)} device sockets in {time.perf_counter() - started:.1f} s')
+    summarize('connect', connect_samples)
+
+    gateways = await asyncio.gather(*[
+        connect(application, f'/ws/sensor/{sensor_id}/', []) for sensor_id in sensor_ids
+    ])
+    ingest_samples = []
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        send_reading(gateway, ingest_samples) for gateway in gateways
+    ])
+    print(f'{len(ingest_samples)} acked readings in {time.perf_counter() - started:.1f} s')
+    summarize('ingest', ingest_samples)
+
+    await asyncio.gather(*[communicator.disconnect() for communicator in devices + gateways])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sockets', type=int, default=5000)
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help="CONSUMER_DB_POOL['MAX_WORKERS'] (default: Channels' single thread)")
+    args = parser.parse_args()
+
+    settings.CONSUMER_DB_POOL = {'MAX_WORKERS': args.pool_size}
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': '__main__.BenchChannelLayer'}}
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        device_ids, sensor_ids = create_devices(args.sockets)
+        latest_values.clear()
+        pool = f'{args.pool_size}-thread pool' if args.pool_size else 'shared thread'
+        print(f'{connection.vendor}, {args.sockets} sockets, consumer DB on {pool}')
+        asyncio.run(storm(device_ids, sensor_ids))
+        if SensorData.objects.count() != args.sockets:
+            sys.exit('Not every reading was stored')
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+WebSocket ingest protocol benchmark: JSON frames vs ``smartanom.v2.struct``.
+
+Sends N readings to ``SensorDataConsumer`` in-process against a throwaway
+test database, once as one JSON ``sensor_data`` frame per reading and once
+as binary frames of ``--batch`` readings each. The last frame asks for an
+ack, so each run is timed until every reading has been committed. The
+decode step alone (``json.loads`` vs ``decode_frame``) is also timed.
+
+Usage:
+    python benchmarks/bench_ws_protocol.py --readings 20000
+    python benchmarks/bench_ws_protocol.py --readings 20000 --batch 1000 --sensors 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartanom_backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from channels.testing import WebsocketCommunicator  # noqa: E402
+from django.db import connection  # noqa: E402
+from core.binary_protocol import SUBPROTOCOL, decode_frame, encode_frame, records_to_rows  # noqa: E402
+from core.consumers import SensorDataConsumer  # noqa: E402
+from core.models import User, Device, Sensor, SensorData  # noqa: E402
+
+
+def create_sensors(sensors):
+    user = User.objects.create_user(email='bench@smartanom.com', password='bench')
+    device = Device.objects.create(user=user, user_email=user.email, device_name='Bench Device')
+    return [sensor.sensor_id for sensor in Sensor.objects.bulk_create([
+        Sensor(device=device, sensor_type='temperature', unit='celsius')
+        for _ in range(sensors)
+    ])]
+
+
+def make_readings(count, sensor_ids):
+    start = time.time() - count
+    return [
+        (random.choice(sensor_ids), start + n, round(random.uniform(0, 100), 2))
+        for n in range(count)
+    ]
+
+
+def json_frames(readings):
+    # ISO timestamps, as real clients send them
+    frames = [
+        json.dumps({
+            'type': 'sensor_data',
+            'sensor_id': sensor_id,
+            'value': value,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp)),
+        })
+        for sensor_id, timestamp, value in readings
+    ]
+    last = json.loads(frames[-1])
+    frames[-1] = json.dumps({**last, 'ack': True})
+    return frames
+
+
+def binary_frames(readings, batch):
+    chunks = [readings[start:start + batch] for start in range(0, len(readings), batch)]
+    return [
+        encode_frame(chunk, seq=seq, ack=seq == len(chunks) - 1)
+        for seq, chunk in enumerate(chunks)
+    ]
+
+
+async def send_frames(frames, binary):
+    subprotocols = [SUBPROTOCOL] if binary else None
+    communicator = WebsocketCommunicator(
+        SensorDataConsumer.as_asgi(), '/ws/sensor-data/', subprotocols=subprotocols
+    )
+    await communicator.connect()
+    await communicator.receive_json_from()  # connection_established
+
+    started = time.perf_counter()
+    for frame in frames:
+        if binary:
+            await communicator.send_to(bytes_data=frame)
+        else:
+            await communicator.send_to(text_data=frame)
+    ack_type = 'batch_ack' if binary else 'ack'
+    while (await communicator.receive_json_from(timeout=300))['type'] != ack_type:
+        pass
+    elapsed = time.perf_counter() - started
+
+    await communicator.disconnect()
+    return elapsed
+
+
+def time_decode(frames, binary):
+    started = time.perf_counter()
+    for frame in frames:
+        if binary:
+            records_to_rows(decode_frame(frame)[2])
+        else:
+            json.loads(frame)
+    return time.perf_counter() - started
+
+
+def report(label, frames, readings, elapsed, decode_elapsed):
+    size = sum(len(frame) for frame in frames)
+    print(f'{label:<22} {len(frames) / elapsed:10.0f} frames/s {readings / elapsed:10.0f} readings/s '
+          f'{size / readings:7.1f} bytes/reading   decode {readings / decode_elapsed:12.0f} readings/s')
+    return readings / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--readings', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=500, help='readings per binary frame')
+    parser.add_argument('--sensors', type=int, default=10)
+    args = parser.parse_args()
+
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        sensor_ids = create_sensors(args.sensors)
+        readings = make_readings(args.readings, sensor_ids)
+        print(f'{connection.vendor}, {args.readings} readings, {args.batch} per binary frame')
+
+        text = json_frames(readings)
+        elapsed = asyncio.run(send_frames(text, binary=False))
+        json_rate = report('JSON', text, args.readings, elapsed, time_decode(text, binary=False))
+
+        SensorData.objects.all().delete()
+        binary = binary_frames(readings, args.batch)
+        elapsed = asyncio.run(send_frames(binary, binary=True))
+        binary_rate = report(SUBPROTOCOL, binary, args.readings, elapsed, time_decode(binary, binary=True))
+
+        if SensorData.objects.count() != args.readings:
+            sys.exit('Not every reading was stored')
+        print(f'speedup {binary_rate / json_rate:.1f}x readings/s')
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Standalone load generator for a running SmarTanom server.
+
+Logs in as an existing user, finds that user's devices and sensors through
+the REST API, and has them push readings over ``ws/sensor-data/``,
+``ws/sensor/<id>/`` and ``POST /api/sensor-data/bulk/`` while dashboard
+clients watch ``ws/sensor-data/``. Reports send and delivery throughput
+and send-to-broadcast latency; query counts and server memory are shown
+when the server is ``core.loadtest_asgi:application``.
+
+``python manage.py loadtest`` does the same against a Daphne it starts
+itself, with its own devices; use this script for a server that is
+already running.
+
+Usage:
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --email user1@smartanom.com --password password123
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --email ... --password ... \\
+        --dashboards 20 --rate 5 --duration 60 --transport ws --transport rest
+"""
+import argparse
+import asyncio
+import sys
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.loadtest import TRANSPORTS, HTTPClient, LoadTest, format_results, session_headers  # noqa: E402
+
+
+def discover_devices(base_url, headers, limit=None):
+    """Return ``{device_id: [sensor_id]}`` for every sensor the user can see"""
+    client = HTTPClient(base_url, headers)
+    devices = defaultdict(list)
+    path = '/api/sensors/'
+    try:
+        while path:
+            status, page = client.request('GET', path)
+            if status != 200:
+                sys.exit(f'GET {path} returned {status}')
+            for sensor in page['results']:
+                devices[sensor['device']].append(sensor['sensor_id'])
+            path = None
+            if page.get('next'):
+                parts = urlsplit(page['next'])
+                path = f'{parts.path}?{parts.query}'
+    finally:
+        client.close()
+    device_ids = sorted(devices)[:limit]
+    return {device_id: devices[device_id] for device_id in device_ids}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--devices', type=int, help='Only use this many of the user\'s devices')
+    parser.add_argument('--dashboards', type=int, default=5)
+    parser.add_argument('--rate', type=float, default=1.0, help='Readings per second per sensor')
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--transport', action='append', dest='transports', choices=TRANSPORTS)
+    args = parser.parse_args()
+
+    headers = session_headers(args.url, args.email, args.password)
+    if headers is None:
+        sys.exit(f'Could not log in to {args.url}/api-auth/login/')
+    devices = discover_devices(args.url, headers, args.devices)
+    if not devices:
+        sys.exit('The user has no sensors')
+
+    sensors = sum(len(sensor_ids) for sensor_ids in devices.values())
+    print(f'{len(devices)} devices, {sensors} sensors at {args.rate}/s, {args.dashboards} dashboards, '
+          f'{args.duration:.0f} s against {args.url}')
+    load = LoadTest(
+        args.url, devices,
+        transports=tuple(args.transports or TRANSPORTS),
+        rate=args.rate,
+        duration=args.duration,
+        dashboards=args.dashboards,
+        rest_headers=headers,
+    )
+    for line in format_results(asyncio.run(load.run())):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+"""
+Settings for running the benchmarks against PostgreSQL:
+
+    DJANGO_SETTINGS_MODULE=benchmarks.settings_postgresql python benchmarks/suite.py
+
+The connection comes from DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT;
+the benchmarks create and drop their own ``test_`` database.
+"""
+import os
+
+from smartanom_backend.settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'smartanom_db'),
+        'USER': os.environ.get('DB_USER', ''),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+    }
+}
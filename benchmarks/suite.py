@@ -0,0 +1,291 @@
+"""
+Benchmark suite for the hot paths, compared against a stored baseline.
+
+Loads a fixed synthetic fixture (devices x sensors, N readings) into a
+throwaway test database and times:
+
+    latest_data, data_history (raw and rollups), by_device (page and
+    LTTB), by_sensor_type, list rendering (ModelSerializer and values()),
+    the broadcast_sensor_data signal, and WebSocket receive-to-broadcast
+
+Each case reports p50/p95/mean in milliseconds. Results are written as JSON
+and compared with ``benchmarks/baselines/<vendor>.json``: a case whose p50
+is more than ``--threshold`` slower than the baseline is a regression and
+the run exits with status 1. Baselines are machine-specific; record one on
+the machine that runs the comparison.
+
+Usage:
+    python benchmarks/suite.py                      # SQLite, compare with the baseline
+    python benchmarks/suite.py --update-baseline    # record a new baseline
+    python benchmarks/suite.py --only latest_data --only by_device --threshold 0.1
+    DJANGO_SETTINGS_MODULE=benchmarks.settings_postgresql python benchmarks/suite.py
+
+The PostgreSQL settings read DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and
+DB_PORT (see .env.example).
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartanom_backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from channels.testing import WebsocketCommunicator  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+from bench_storage import load_rows  # noqa: E402
+from core.consumers import SensorDataConsumer  # noqa: E402
+from core.models import User, Device, Sensor, SensorData  # noqa: E402
+from core.renderers import FastJSONRenderer  # noqa: E402
+from core.serializers import SensorDataSerializer, SensorDataValuesSerializer  # noqa: E402
+from core.signals import broadcast_sensor_data  # noqa: E402
+from core.views import SENSOR_DATA_READ_PLAN, apply_query_plan  # noqa: E402
+
+SENSOR_TYPES = [choice for choice, _ in Sensor.SENSOR_TYPE_CHOICES]
+
+
+def create_fixture(devices, sensors_per_device, rows, end):
+    """Create the benchmark user, devices and sensors and load ``rows`` readings ending at ``end``"""
+    user = User.objects.create_user(email='bench@smartanom.com', password='bench')
+    device_list = Device.objects.bulk_create([
+        Device(user=user, user_email=user.email, device_name=f'Bench Device {n + 1}', status='active')
+        for n in range(devices)
+    ])
+    Sensor.objects.bulk_create([
+        Sensor(device=device, sensor_type=SENSOR_TYPES[n % len(SENSOR_TYPES)], unit='celsius')
+        for device in device_list for n in range(sensors_per_device)
+    ])
+    sensor_ids = list(Sensor.objects.order_by('sensor_id').values_list('sensor_id', flat=True))
+    load_rows(sensor_ids, rows, end)
+    call_command('rebuild_rollups', stdout=io.StringIO())
+    return user, [device.device_id for device in device_list], sensor_ids
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[max(int(len(samples) * 0.95) - 1, 0)], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'iterations': len(samples),
+    }
+
+
+def time_case(func, iterations, warmup=3):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return summarize(samples)
+
+
+def api_cases(user, device_ids, sensor_ids, end):
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def get(path):
+        def request():
+            response = client.get(path() if callable(path) else path)
+            if response.status_code != 200:
+                raise RuntimeError(f'{response.status_code} from {response.request["PATH_INFO"]}')
+            # Streaming and lazy responses do their work when consumed
+            response.content
+        return request
+
+    hour_ago = (end - timedelta(hours=1)).isoformat().replace('+00:00', 'Z')
+    day_ago = (end - timedelta(days=1)).isoformat().replace('+00:00', 'Z')
+    return {
+        'latest_data': get(lambda: f'/api/sensors/{random.choice(sensor_ids)}/latest_data/'),
+        'data_history_raw': get(
+            lambda: f'/api/sensors/{random.choice(sensor_ids)}/data_history/?since={hour_ago}'
+        ),
+        'data_history_rollup': get(
+            lambda: f'/api/sensors/{random.choice(sensor_ids)}/data_history/?resolution=auto&since={day_ago}'
+        ),
+        'by_device': get(lambda: f'/api/sensor-data/by_device/?device_id={random.choice(device_ids)}'),
+        'by_device_lttb': get(
+            lambda: f'/api/sensor-data/by_device/?device_id={random.choice(device_ids)}'
+                    f'&method=lttb&points=300&since={day_ago}'
+        ),
+        'by_sensor_type': get(lambda: f'/api/sensor-data/by_sensor_type/?type={random.choice(SENSOR_TYPES)}'),
+    }
+
+
+def rendering_cases(rows=1000):
+    def model_serializer():
+        queryset = apply_query_plan(SensorData.objects.all(), SENSOR_DATA_READ_PLAN)[:rows]
+        JSONRenderer().render(SensorDataSerializer(queryset, many=True).data)
+
+    def values_serializer():
+        queryset = SensorDataValuesSerializer.values(SensorData.objects.all())[:rows]
+        FastJSONRenderer().render(SensorDataValuesSerializer(queryset, many=True).data)
+
+    return {
+        f'render_model_{rows}': model_serializer,
+        f'render_values_{rows}': values_serializer,
+    }
+
+
+def signal_cases(sensor_ids):
+    readings = list(SensorData.objects.filter(sensor_id__in=sensor_ids[:10])[:100])
+
+    def broadcast():
+        broadcast_sensor_data(SensorData, instance=random.choice(readings), created=True)
+
+    return {'broadcast_signal': broadcast}
+
+
+async def receive_to_broadcast(sensor_ids, iterations, warmup=3):
+    """Time a ``sensor_data`` frame from one socket until its broadcast reaches another"""
+    dashboard = WebsocketCommunicator(SensorDataConsumer.as_asgi(), '/ws/sensor-data/')
+    producer = WebsocketCommunicator(SensorDataConsumer.as_asgi(), '/ws/sensor-data/')
+    for communicator in (dashboard, producer):
+        await communicator.connect()
+        await communicator.receive_json_from()  # connection_established
+    await producer.send_json_to({'type': 'subscribe', 'sensor_ids': []})
+    await producer.receive_json_from()  # subscribed
+
+    samples = []
+    for n in range(warmup + iterations):
+        value = float(n)
+        started = time.perf_counter()
+        await producer.send_json_to({'type': 'sensor_data', 'sensor_id': random.choice(sensor_ids), 'value': value})
+        while True:
+            frame = await dashboard.receive_json_from(timeout=30)
+            if any(reading['value'] == value for reading in frame.get('data', [])):
+                break
+        if n >= warmup:
+            samples.append((time.perf_counter() - started) * 1000)
+
+    for communicator in (dashboard, producer):
+        await communicator.disconnect()
+    return summarize(samples)
+
+
+def compare(results, baseline, threshold):
+    """Return ``(lines, regressions)`` comparing p50s with the baseline"""
+    lines = []
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            lines.append(f'{name:<26} {current["p50_ms"]:10.3f} ms   (no baseline)')
+            continue
+        change = current['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        lines.append(f'{name:<26} {current["p50_ms"]:10.3f} ms   baseline {base["p50_ms"]:10.3f} ms   '
+                     f'{change:+7.1%}{flag}')
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--sensors', type=int, default=6, help='Sensors per device')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', action='append', help='Run only this case (repeatable)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed p50 slowdown against the baseline (0.25 = 25%%)')
+    parser.add_argument('--baseline', help='Baseline file (default benchmarks/baselines/<vendor>.json)')
+    parser.add_argument('--output', help='Results file (default benchmarks/results/<vendor>.json)')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results as the new baseline')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    vendor = connection.vendor
+    baseline_path = Path(args.baseline) if args.baseline else BENCH_DIR / 'baselines' / f'{vendor}.json'
+    output_path = Path(args.output) if args.output else BENCH_DIR / 'results' / f'{vendor}.json'
+    fixture = {'rows': args.rows, 'devices': args.devices, 'sensors_per_device': args.sensors}
+
+    setup_test_environment()
+    test_db = connection.creation.create_test_db(verbosity=0)
+    try:
+        end = timezone.now().replace(microsecond=0)
+        started = time.perf_counter()
+        user, device_ids, sensor_ids = create_fixture(args.devices, args.sensors, args.rows, end)
+        print(f'{vendor}, {args.rows} rows, {len(sensor_ids)} sensors '
+              f'(loaded in {time.perf_counter() - started:.1f}s)')
+
+        cases = {
+            **api_cases(user, device_ids, sensor_ids, end),
+            **rendering_cases(),
+            **signal_cases(sensor_ids),
+        }
+        results = {}
+        for name, func in cases.items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = time_case(func, args.iterations)
+            print(f'{name:<26} p50 {results[name]["p50_ms"]:10.3f} ms   p95 {results[name]["p95_ms"]:10.3f} ms')
+        if not args.only or 'receive_to_broadcast' in args.only:
+            results['receive_to_broadcast'] = asyncio.run(receive_to_broadcast(sensor_ids, args.iterations))
+            print(f'{"receive_to_broadcast":<26} p50 {results["receive_to_broadcast"]["p50_ms"]:10.3f} ms   '
+                  f'p95 {results["receive_to_broadcast"]["p95_ms"]:10.3f} ms')
+    finally:
+        connection.creation.destroy_test_db(test_db, verbosity=0)
+
+    report = {
+        'meta': {
+            'vendor': vendor,
+            'fixture': fixture,
+            'iterations': args.iterations,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'machine': platform.machine(),
+            'recorded_at': timezone.now().isoformat(),
+        },
+        'results': results,
+    }
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=2) + '\n')
+    print(f'Results written to {output_path}')
+
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2) + '\n')
+        print(f'Baseline written to {baseline_path}')
+        return
+
+    if not baseline_path.exists():
+        print(f'No baseline at {baseline_path}; record one with --update-baseline')
+        return
+    baseline = json.loads(baseline_path.read_text())
+    if baseline['meta']['fixture'] != fixture:
+        sys.exit(f'Baseline fixture {baseline["meta"]["fixture"]} differs from this run\'s {fixture}')
+
+    print(f'\nCompared with {baseline_path} (threshold {args.threshold:.0%})')
+    lines, regressions = compare(results, baseline['results'], args.threshold)
+    for line in lines:
+        print(line)
+    if regressions:
+        sys.exit(f'{len(regressions)} regression(s): {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Device, QrCode, Hydroponic, Sensor, SensorData
+from django.db import transaction
+from .latest import latest_values
+from .models import User, Device, QrCode, Hydroponic, Sensor, SensorData, SensorDataRollup, RetentionPolicy, AlertRule, Alert
+from .rollups import rebuild_buckets
 
 
 @admin.register(User)
@@ -52,5 +55,59 @@ class SensorDataAdmin(admin.ModelAdmin):
     list_display = ('data_id', 'sensor', 'value', 'created_at')
     list_filter = ('sensor__sensor_type', 'created_at')
     search_fields = ('sensor__device__device_name', 'sensor__sensor_type')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at',)
     date_hierarchy = 'created_at'
+
+    # Edits and deletes here bypass the ingest paths, so the rollups of the
+    # readings' buckets are recomputed from what is left
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            rebuild_buckets([(form.initial['sensor'], obj.created_at), (obj.sensor_id, obj.created_at)])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_buckets([(obj.sensor_id, obj.created_at)])
+        transaction.on_commit(lambda: latest_values.invalidate_sensor(obj.sensor_id))
+
+    def delete_queryset(self, request, queryset):
+        readings = list(queryset.values_list('sensor_id', 'created_at'))
+        super().delete_queryset(request, queryset)
+        rebuild_buckets(readings)
+        sensor_ids = {sensor_id for sensor_id, _ in readings}
+        transaction.on_commit(lambda: latest_values.invalidate_sensors(sensor_ids))
+
+
+@admin.register(SensorDataRollup)
+class SensorDataRollupAdmin(admin.ModelAdmin):
+    list_display = ('sensor', 'resolution', 'bucket', 'min_value', 'max_value', 'avg_value', 'count')
+    list_filter = ('resolution', 'sensor__sensor_type')
+    search_fields = ('sensor__device__device_name', 'sensor__sensor_type')
+    date_hierarchy = 'bucket'
+
+
+@admin.register(RetentionPolicy)
+class RetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ('policy_id', 'device', 'sensor_type', 'raw_days', 'rollup_1m_days', 'rollup_1h_days',
+                    'rollup_1d_days', 'updated_at')
+    list_filter = ('sensor_type',)
+    search_fields = ('device__device_name',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'sensor', 'device', 'sensor_type', 'min_value', 'max_value', 'hysteresis',
+                    'min_duration', 'enabled')
+    list_filter = ('enabled', 'sensor_type')
+    search_fields = ('name', 'device__device_name')
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(Alert)
+class AlertAdmin(admin.ModelAdmin):
+    list_display = ('alert_id', 'rule', 'sensor', 'value', 'started_at', 'resolved_at')
+    list_filter = ('rule', 'resolved_at')
+    search_fields = ('rule__name', 'sensor__device__device_name')
+    readonly_fields = ('created_at',)
+    date_hierarchy = 'started_at'
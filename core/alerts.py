@@ -0,0 +1,271 @@
+"""
+Streaming threshold alerting: ``AlertRule`` bounds evaluated against new
+readings as they are ingested, without polling the database
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .fanout import fanout
+from .models import Alert, AlertRule
+
+logger = logging.getLogger(__name__)
+
+# Rule states per (rule, sensor)
+OK, PENDING, FIRING = 'ok', 'pending', 'firing'
+# State pushed when a firing alert clears
+RESOLVED = 'resolved'
+
+
+class CompiledRule:
+    """The fields of an ``AlertRule`` the evaluator needs, as plain attributes"""
+    __slots__ = ('rule_id', 'name', 'sensor_id', 'device_id', 'sensor_type', 'low', 'high', 'hysteresis',
+                 'min_duration')
+
+    def __init__(self, rule):
+        self.rule_id = rule.rule_id
+        self.name = rule.name
+        self.sensor_id = rule.sensor_id
+        self.device_id = rule.device_id
+        self.sensor_type = rule.sensor_type
+        self.low = rule.min_value
+        self.high = rule.max_value
+        self.hysteresis = rule.hysteresis
+        self.min_duration = rule.min_duration
+
+    def matches(self, sensor_id, device_id, sensor_type):
+        return ((self.sensor_id is None or self.sensor_id == sensor_id)
+                and (self.device_id is None or self.device_id == device_id)
+                and (not self.sensor_type or self.sensor_type == sensor_type))
+
+    def breached(self, value):
+        return (self.low is not None and value < self.low) or (self.high is not None and value > self.high)
+
+    def cleared(self, value):
+        """Whether ``value`` is back inside the bounds by at least the hysteresis"""
+        return ((self.low is None or value >= self.low + self.hysteresis)
+                and (self.high is None or value <= self.high - self.hysteresis))
+
+
+def alert_message(alert_id, rule, payload, state, started_at, resolved_at=None):
+    """The item pushed to the device's WebSocket group when an alert fires or resolves"""
+    return {
+        'alert_id': alert_id,
+        'state': state,
+        'rule_id': rule.rule_id,
+        'rule': rule.name,
+        'sensor_id': payload['sensor_id'],
+        'sensor_type': payload['sensor_type'],
+        'device_id': payload['device_id'],
+        'value': payload['value'],
+        'min_value': rule.low,
+        'max_value': rule.high,
+        'started_at': started_at.isoformat(),
+        'resolved_at': resolved_at.isoformat() if resolved_at else None,
+    }
+
+
+class AlertEngine:
+    """
+    Evaluates enabled ``AlertRule`` rows against the broadcast payloads of
+    committed readings.
+
+    Rules are indexed by the scope field that narrows them most, and the
+    rules of each sensor are resolved from that index on its first reading
+    and kept, so a reading costs one dict lookup plus a comparison per rule
+    of its sensor. Per (rule, sensor) the engine moves between ok, pending
+    (breached, waiting out ``min_duration``) and firing; only firing and
+    resolving touch the database. Rules are reloaded every
+    ``RELOAD_INTERVAL`` seconds and at once after a change in this process.
+    State is per process: readings of one sensor ingested by different
+    workers are evaluated separately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._index = {}
+        self._sensor_rules = {}
+        # (rule_id, sensor_id) -> [state, breach started at, alert_id]
+        self._states = {}
+
+    def invalidate(self):
+        """Reload the rules before the next evaluation"""
+        self._loaded_at = None
+
+    def clear(self):
+        with self._lock:
+            self._loaded_at = None
+            self._index = {}
+            self._sensor_rules = {}
+            self._states = {}
+
+    def _load(self):
+        index = {}
+        rule_ids = set()
+        for rule in AlertRule.objects.filter(enabled=True).order_by('rule_id'):
+            compiled = CompiledRule(rule)
+            rule_ids.add(compiled.rule_id)
+            if compiled.sensor_id is not None:
+                key = ('sensor', compiled.sensor_id)
+            elif compiled.device_id is not None:
+                key = ('device', compiled.device_id)
+            elif compiled.sensor_type:
+                key = ('type', compiled.sensor_type)
+            else:
+                key = ('all', None)
+            index.setdefault(key, []).append(compiled)
+
+        # Keep the state of rules that still apply, and pick up alerts left
+        # open by an earlier process
+        states = {key: state for key, state in self._states.items() if key[0] in rule_ids}
+        for alert_id, rule_id, sensor_id, started_at in Alert.objects.filter(
+                resolved_at__isnull=True, rule_id__in=rule_ids).values_list(
+                'alert_id', 'rule_id', 'sensor_id', 'started_at'):
+            states[(rule_id, sensor_id)] = [FIRING, started_at, alert_id]
+
+        self._index = index
+        self._sensor_rules = {}
+        self._states = states
+        self._loaded_at = time.monotonic()
+
+    def rules_for(self, sensor_id, device_id, sensor_type):
+        """The enabled rules applying to a sensor, resolved once per sensor"""
+        rules = self._sensor_rules.get(sensor_id)
+        if rules is None:
+            index = self._index
+            candidates = (index.get(('sensor', sensor_id), []) + index.get(('device', device_id), [])
+                          + index.get(('type', sensor_type), []) + index.get(('all', None), []))
+            rules = self._sensor_rules[sensor_id] = tuple(
+                rule for rule in candidates if rule.matches(sensor_id, device_id, sensor_type)
+            )
+        return rules
+
+    def evaluate(self, payloads):
+        """
+        Feed the broadcast payloads of committed readings (None entries are
+        skipped) through the rules, then persist and push the alerts that
+        fired or resolved
+        """
+        config = settings.ALERTS
+        if not config['ENABLED']:
+            return
+        # (state, (rule_id, sensor_id), rule, payload, breach started at, alert_id), in reading order
+        events = []
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= config['RELOAD_INTERVAL']:
+                self._load()
+            if not self._index:
+                return
+            states = self._states
+            for payload in payloads:
+                if payload is None:
+                    continue
+                sensor_id = payload['sensor_id']
+                rules = self._sensor_rules.get(sensor_id)
+                if rules is None:
+                    rules = self.rules_for(sensor_id, payload['device_id'], payload['sensor_type'])
+                if not rules:
+                    continue
+                value = payload['value']
+                for rule in rules:
+                    key = (rule.rule_id, sensor_id)
+                    state = states.get(key)
+                    if state is None or state[0] == OK:
+                        if not rule.breached(value):
+                            continue
+                        moment = datetime.fromisoformat(payload['timestamp'])
+                        state = states[key] = [PENDING, moment, None]
+                    elif state[0] == PENDING:
+                        if not rule.breached(value):
+                            state[0] = OK
+                            continue
+                        moment = datetime.fromisoformat(payload['timestamp'])
+                    else:
+                        if rule.cleared(value):
+                            state[0] = OK
+                            events.append((RESOLVED, key, rule, payload, state[1], state[2]))
+                        continue
+                    if (moment - state[1]).total_seconds() >= rule.min_duration:
+                        state[0] = FIRING
+                        state[2] = None
+                        events.append((FIRING, key, rule, payload, state[1], None))
+
+        if events:
+            self._record(events)
+
+    def _record(self, events):
+        """
+        Write the alerts that fired or resolved and push them. Events are
+        written in rounds touching each (rule, sensor) at most once, so one
+        that resolves and fires again within a batch is written in order.
+        """
+        alert_ids = {}
+        messages = []
+        batch = {}
+        for event in events:
+            if event[1] in batch:
+                self._write(list(batch.values()), alert_ids, messages)
+                batch = {}
+            batch[event[1]] = event
+        self._write(list(batch.values()), alert_ids, messages)
+
+        with self._lock:
+            for key, alert_id in alert_ids.items():
+                state = self._states.get(key)
+                if state is not None and state[0] == FIRING:
+                    state[2] = alert_id
+        fanout.publish_alerts(messages)
+
+    def _write(self, events, alert_ids, messages):
+        resolves = [event for event in events if event[0] == RESOLVED]
+        fires = [event for event in events if event[0] == FIRING]
+        try:
+            for _, key, rule, payload, _, alert_id in resolves:
+                alert_id = alert_ids.get(key, alert_id)
+                opened = Alert.objects.filter(pk=alert_id) if alert_id else Alert.objects.filter(
+                    rule_id=rule.rule_id, sensor_id=key[1], resolved_at__isnull=True)
+                opened.update(resolved_at=datetime.fromisoformat(payload['timestamp']))
+            if fires:
+                alerts = self._create_alerts(fires)
+                for (_, key, _, _, _, _), alert in zip(fires, alerts):
+                    alert_ids[key] = alert.alert_id
+        except Exception:
+            logger.exception('Failed to record %d alert changes', len(events))
+            return
+
+        for state, key, rule, payload, started_at, alert_id in events:
+            if state == FIRING:
+                messages.append(alert_message(alert_ids[key], rule, payload, FIRING, started_at))
+            else:
+                resolved_at = datetime.fromisoformat(payload['timestamp'])
+                messages.append(alert_message(alert_ids.get(key, alert_id), rule, payload, RESOLVED,
+                                              started_at, resolved_at))
+
+    @staticmethod
+    def _create_alerts(fires):
+        alerts = [
+            Alert(rule_id=rule.rule_id, sensor_id=key[1], value=payload['value'], started_at=started_at)
+            for _, key, rule, payload, started_at, _ in fires
+        ]
+        try:
+            with transaction.atomic():
+                return Alert.objects.bulk_create(alerts)
+        except IntegrityError:
+            # Another process opened some of these already; keep its alerts
+            return [
+                Alert.objects.get_or_create(
+                    rule_id=alert.rule_id, sensor_id=alert.sensor_id, resolved_at=None,
+                    defaults={'value': alert.value, 'started_at': alert.started_at},
+                )[0]
+                for alert in alerts
+            ]
+
+    def evaluate_on_commit(self, payloads):
+        """Evaluate ``payloads`` once the current transaction commits"""
+        transaction.on_commit(lambda: self.evaluate(payloads))
+
+
+alert_engine = AlertEngine()
@@ -0,0 +1,77 @@
+"""
+Compact binary WebSocket protocol for device gateways
+
+Negotiated with the ``smartanom.v2.struct`` subprotocol. Each binary frame
+is a 12-byte header followed by ``count`` fixed-size records, all
+little-endian:
+
+    header:  magic b'SB' | version u8 | flags u8 | seq u32 | count u32
+    record:  sensor_id u32 | timestamp f64 (Unix seconds, NaN = now) | value f64
+
+Flag bit 0 asks for a ``batch_ack`` once the frame's readings are committed;
+``seq`` is echoed in it.
+"""
+import struct
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+
+SUBPROTOCOL = 'smartanom.v2.struct'
+MAGIC = b'SB'
+VERSION = 1
+FLAG_ACK = 0x01
+
+HEADER = struct.Struct('<2sBBII')
+RECORD_DTYPE = np.dtype([('sensor_id', '<u4'), ('timestamp', '<f8'), ('value', '<f8')])
+
+
+def encode_frame(readings, seq=0, ack=False):
+    """Pack ``(sensor_id, timestamp or None, value)`` tuples into one frame"""
+    records = np.array(
+        [(sensor_id, np.nan if timestamp is None else timestamp, value) for sensor_id, timestamp, value in readings],
+        dtype=RECORD_DTYPE
+    )
+    header = HEADER.pack(MAGIC, VERSION, FLAG_ACK if ack else 0, seq, len(records))
+    return header + records.tobytes()
+
+
+def decode_frame(data):
+    """
+    Return ``(seq, ack, records)`` for a binary frame.
+
+    ``records`` is a structured array viewing ``data`` without copying.
+    Raises ValueError for a malformed frame.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError('Frame is shorter than its header')
+    magic, version, flags, seq, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Unknown frame format')
+    if len(data) != HEADER.size + count * RECORD_DTYPE.itemsize:
+        raise ValueError(f'Frame length does not match its {count} records')
+    records = np.frombuffer(data, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)
+    return seq, bool(flags & FLAG_ACK), records
+
+
+def record_moment(timestamp):
+    """
+    The measurement time of a record: None for NaN (the server's time), or
+    the raw float, which ingest rejects, if it is infinite or out of range
+    """
+    if timestamp != timestamp:
+        return None
+    try:
+        return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+    except (OverflowError, OSError, ValueError):
+        return timestamp
+
+
+def records_to_rows(records):
+    """Turn decoded records into ingest rows (``{sensor, value, timestamp}``)"""
+    timestamps = records['timestamp']
+    sensor_ids = records['sensor_id'].tolist()
+    values = records['value'].tolist()
+    moments = [record_moment(timestamp) for timestamp in timestamps.tolist()]
+    return [
+        {'sensor': sensor_id, 'value': value, 'timestamp': moment}
+        for sensor_id, value, moment in zip(sensor_ids, values, moments)
+    ]
@@ -1,16 +1,49 @@
 """
 WebSocket consumers for real-time data streaming
 """
+import asyncio
 import json
+from collections import deque
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from .models import Device, Sensor, SensorData
+from .binary_protocol import SUBPROTOCOL, decode_frame, records_to_rows
+from .dbpool import database_sync_to_async
+from .device_status import device_statuses, last_seen_tracker
+from .ingest import ingest_buffer
+from .latest import latest_values
+from .outbound import QueuedSendMixin, merge_reading_frames
+from .subscriptions import Subscription
 
 
-class SensorDataConsumer(AsyncWebsocketConsumer):
-    """Consumer for streaming all sensor data"""
-    
+def ack_message(data, sensor_data):
+    """Acknowledge a reading frame once its batch has been committed"""
+    return {
+        'type': 'ack',
+        'ref': data.get('ref'),
+        'status': 'accepted' if sensor_data else 'rejected',
+        'id': sensor_data['id'] if sensor_data else None,
+    }
+
+
+class SensorDataConsumer(QueuedSendMixin, AsyncWebsocketConsumer):
+    """Consumer for streaming all sensor data
+
+    Clients can narrow the stream and cap its rate with a ``subscribe``
+    frame; readings are filtered before they are serialized. Gateways that
+    negotiate the ``smartanom.v2.struct`` subprotocol may also send binary
+    frames of many readings each (see ``core.binary_protocol``).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.subscription = Subscription()
+        self.pending = deque(maxlen=settings.SENSOR_SUBSCRIPTION['MAX_PENDING'])
+        self.latest = {}
+        self.last_sent_at = None
+        self.delivery = None
+        self.binary = False
+
     async def connect(self):
         # Join sensor data group
         self.group_name = 'sensor_data'
@@ -18,7 +51,8 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
             self.group_name,
             self.channel_name
         )
-        await self.accept()
+        self.binary = SUBPROTOCOL in self.scope.get('subprotocols', [])
+        await self.accept(subprotocol=SUBPROTOCOL if self.binary else None)
         
         # Send welcome message
         await self.send(text_data=json.dumps({
@@ -27,14 +61,19 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
         }))
 
     async def disconnect(self, close_code):
+        if self.delivery is not None:
+            self.delivery.cancel()
         # Leave sensor data group
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle incoming WebSocket messages"""
+        if bytes_data is not None:
+            await self.handle_binary_frame(bytes_data)
+            return
         try:
             text_data_json = json.loads(text_data)
             message_type = text_data_json.get('type')
@@ -42,6 +81,8 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
             if message_type == 'sensor_data':
                 # Handle new sensor data
                 await self.handle_sensor_data(text_data_json)
+            elif message_type == 'subscribe':
+                await self.handle_subscribe(text_data_json)
             elif message_type == 'ping':
                 # Respond to ping
                 await self.send(text_data=json.dumps({
@@ -59,68 +100,119 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
         try:
             sensor_id = data.get('sensor_id')
             value = data.get('value')
-            
+
             if sensor_id and value is not None:
-                # Save to database
-                sensor_data = await self.save_sensor_data(sensor_id, value)
-                
-                if sensor_data:
-                    # Broadcast to all clients in the group
-                    await self.channel_layer.group_send(
-                        self.group_name,
-                        {
-                            'type': 'sensor_data_message',
-                            'sensor_data': {
-                                'id': sensor_data['id'],
-                                'sensor_id': sensor_data['sensor_id'],
-                                'sensor_type': sensor_data['sensor_type'],
-                                'device_id': sensor_data['device_id'],
-                                'device_name': sensor_data['device_name'],
-                                'value': sensor_data['value'],
-                                'unit': sensor_data['unit'],
-                                'timestamp': sensor_data['timestamp'],
-                            }
-                        }
-                    )
+                # Queue for batched persistence; the buffer broadcasts once written
+                ack = bool(data.get('ack'))
+                sensor_data = await ingest_buffer.submit(
+                    sensor_id, value, data.get('timestamp'), wait=ack
+                )
+                if ack:
+                    await self.send(text_data=json.dumps(ack_message(data, sensor_data)))
         except Exception as e:
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'message': f'Error processing sensor data: {str(e)}'
             }))
 
-    async def sensor_data_message(self, event):
-        """Send sensor data to WebSocket"""
+    async def handle_binary_frame(self, data):
+        """Queue every reading of a binary frame for batched persistence"""
+        if not self.binary:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Binary frames require the {SUBPROTOCOL} subprotocol'
+            }))
+            return
+        try:
+            seq, ack, records = decode_frame(data)
+        except ValueError as e:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Invalid binary frame: {e}'
+            }))
+            return
+
+        sensor_data = await ingest_buffer.submit_many(records_to_rows(records), wait=ack)
+        if ack:
+            accepted = sum(1 for item in sensor_data if item)
+            await self.send(text_data=json.dumps({
+                'type': 'batch_ack',
+                'seq': seq,
+                'accepted': accepted,
+                'rejected': len(sensor_data) - accepted,
+            }))
+
+    async def handle_subscribe(self, data):
+        """Replace the connection's filters, rate limit and conflation mode"""
+        try:
+            subscription = Subscription.from_message(data)
+        except ValueError as e:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Invalid subscription: {e}'
+            }))
+            return
+
+        self.subscription = subscription
+        # Drop what was queued under the old filters
+        self.pending.clear()
+        self.latest.clear()
         await self.send(text_data=json.dumps({
-            'type': 'sensor_data',
-            'data': event['sensor_data']
+            'type': 'subscribed',
+            'subscription': subscription.describe()
         }))
 
-    @database_sync_to_async
-    def save_sensor_data(self, sensor_id, value):
-        """Save sensor data to database"""
-        try:
-            sensor = Sensor.objects.get(sensor_id=sensor_id)
-            sensor_data = SensorData.objects.create(
-                sensor=sensor,
-                value=float(value)
-            )
-            return {
-                'id': sensor_data.data_id,
-                'sensor_id': sensor.sensor_id,
-                'sensor_type': sensor.sensor_type,
-                'device_id': sensor.device.device_id,
-                'device_name': sensor.device.device_name,
-                'value': sensor_data.value,
-                'unit': sensor.unit,
-                'timestamp': sensor_data.created_at.isoformat(),
-            }
-        except Sensor.DoesNotExist:
-            return None
-        except Exception:
-            return None
+    async def sensor_data_batch(self, event):
+        """Send a batch of new readings to WebSocket in one frame
+
+        Readings outside the subscription are dropped here. With a
+        ``max_rate`` they are held until the next frame is due; in
+        ``latest_only`` mode a newer reading replaces the held one of its
+        sensor.
+        """
+        readings = self.subscription.filter(event['readings'])
+        if not readings:
+            return
+        if self.subscription.latest_only:
+            for reading in readings:
+                self.latest.pop(reading['sensor_id'], None)
+                self.latest[reading['sensor_id']] = reading
+        else:
+            self.pending.extend(readings)
+
+        if self.delivery is not None:
+            return
+        delay = 0
+        if self.subscription.max_rate and self.last_sent_at is not None:
+            loop = asyncio.get_running_loop()
+            delay = self.last_sent_at + 1 / self.subscription.max_rate - loop.time()
+        if delay <= 0:
+            await self.deliver_pending()
+        else:
+            self.delivery = asyncio.get_running_loop().create_task(self.deliver_later(delay))
 
+    async def deliver_later(self, delay):
+        await asyncio.sleep(delay)
+        self.delivery = None
+        await self.deliver_pending()
 
-class DeviceConsumer(AsyncWebsocketConsumer):
+    async def deliver_pending(self):
+        if self.subscription.latest_only:
+            readings = list(self.latest.values())
+            self.latest.clear()
+        else:
+            readings = list(self.pending)
+            self.pending.clear()
+        if not readings:
+            return
+        self.last_sent_at = asyncio.get_running_loop().time()
+        await self.send_queued({
+            'type': 'sensor_data_batch',
+            'data': readings
+        }, key='sensor_data_batch', merge=merge_reading_frames)
+
+
+class DeviceConsumer(QueuedSendMixin, AsyncWebsocketConsumer):
     """Consumer for device-specific data streaming"""
     
     def __init__(self, *args, **kwargs):
@@ -132,9 +224,9 @@ class DeviceConsumer(AsyncWebsocketConsumer):
         self.device_id = self.scope['url_route']['kwargs']['device_id']
         self.group_name = f'device_{self.device_id}'
         
-        # Check if device exists
-        device_exists = await self.check_device_exists(self.device_id)
-        if not device_exists:
+        # Snapshot of the device and its sensors' latest readings; None if it does not exist
+        device_info = await self.get_device_info(self.device_id)
+        if device_info is None:
             await self.close()
             return
         
@@ -146,7 +238,6 @@ class DeviceConsumer(AsyncWebsocketConsumer):
         await self.accept()
         
         # Send device info
-        device_info = await self.get_device_info(self.device_id)
         await self.send(text_data=json.dumps({
             'type': 'device_connected',
             'device': device_info
@@ -166,6 +257,8 @@ class DeviceConsumer(AsyncWebsocketConsumer):
             
             if message_type == 'device_status':
                 await self.handle_device_status(text_data_json)
+            elif message_type == 'heartbeat':
+                last_seen_tracker.touch(int(self.device_id))
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
                 'type': 'error',
@@ -173,10 +266,16 @@ class DeviceConsumer(AsyncWebsocketConsumer):
             }))
 
     async def handle_device_status(self, data):
-        """Handle device status updates"""
+        """Handle device status updates
+
+        Only a changed status is written and broadcast; every frame counts
+        as a heartbeat.
+        """
         status = data.get('status')
         if status:
-            await self.update_device_status(self.device_id, status)
+            last_seen_tracker.touch(int(self.device_id))
+            if not await device_statuses.update(int(self.device_id), status):
+                return
             
             # Broadcast status update
             await self.channel_layer.group_send(
@@ -190,44 +289,35 @@ class DeviceConsumer(AsyncWebsocketConsumer):
 
     async def device_status_message(self, event):
         """Send device status to WebSocket"""
-        await self.send(text_data=json.dumps({
+        await self.send_queued({
             'type': 'device_status',
             'device_id': event['device_id'],
             'status': event['status']
-        }))
+        }, key='device_status')
 
-    @database_sync_to_async
-    def check_device_exists(self, device_id):
-        """Check if device exists"""
-        return Device.objects.filter(device_id=device_id).exists()
+    async def sensor_data_batch(self, event):
+        """Send a batch of the device's new readings to WebSocket in one frame"""
+        await self.send_queued({
+            'type': 'sensor_data_batch',
+            'data': event['readings']
+        }, key='sensor_data_batch', merge=merge_reading_frames)
+
+    async def alert_batch(self, event):
+        """Send alerts on the device's sensors that fired or resolved"""
+        await self.send_queued({
+            'type': 'alert_batch',
+            'alerts': event['alerts']
+        }, droppable=False)
 
     @database_sync_to_async
     def get_device_info(self, device_id):
-        """Get device information"""
-        try:
-            device = Device.objects.get(device_id=device_id)
-            return {
-                'device_id': device.device_id,
-                'device_name': device.device_name,
-                'status': device.status,
-                'user_email': device.user_email
-            }
-        except Device.DoesNotExist:
+        """Get device information with every sensor's latest reading"""
+        if not str(device_id).isdigit():
             return None
-
-    @database_sync_to_async
-    def update_device_status(self, device_id, status):
-        """Update device status"""
-        try:
-            device = Device.objects.get(device_id=device_id)
-            device.status = status
-            device.save()
-            return True
-        except Device.DoesNotExist:
-            return False
+        return latest_values.device_snapshot(int(device_id))
 
 
-class SensorConsumer(AsyncWebsocketConsumer):
+class SensorConsumer(QueuedSendMixin, AsyncWebsocketConsumer):
     """Consumer for sensor-specific data streaming"""
     
     def __init__(self, *args, **kwargs):
@@ -239,9 +329,9 @@ class SensorConsumer(AsyncWebsocketConsumer):
         self.sensor_id = self.scope['url_route']['kwargs']['sensor_id']
         self.group_name = f'sensor_{self.sensor_id}'
         
-        # Check if sensor exists
-        sensor_exists = await self.check_sensor_exists(self.sensor_id)
-        if not sensor_exists:
+        # Sensor info and latest reading; None if the sensor does not exist
+        sensor_info = await self.get_sensor_info(self.sensor_id)
+        if sensor_info is None:
             await self.close()
             return
         
@@ -253,7 +343,6 @@ class SensorConsumer(AsyncWebsocketConsumer):
         await self.accept()
         
         # Send sensor info and latest data
-        sensor_info = await self.get_sensor_info(self.sensor_id)
         await self.send(text_data=json.dumps({
             'type': 'sensor_connected',
             'sensor': sensor_info
@@ -283,72 +372,27 @@ class SensorConsumer(AsyncWebsocketConsumer):
         """Handle new sensor reading"""
         value = data.get('value')
         if value is not None:
-            # Save sensor data
-            sensor_data = await self.save_sensor_reading(self.sensor_id, value)
-            
-            if sensor_data:
-                # Broadcast to sensor group
-                await self.channel_layer.group_send(
-                    self.group_name,
-                    {
-                        'type': 'sensor_reading_message',
-                        'sensor_data': sensor_data
-                    }
-                )
+            # Queue for batched persistence; the buffer broadcasts to the sensor group
+            ack = bool(data.get('ack'))
+            sensor_data = await ingest_buffer.submit(
+                self.sensor_id, value, data.get('timestamp'), wait=ack
+            )
+            if ack:
+                await self.send(text_data=json.dumps(ack_message(data, sensor_data)))
 
-    async def sensor_reading_message(self, event):
-        """Send sensor reading to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'sensor_reading',
-            'data': event['sensor_data']
-        }))
+    async def sensor_reading_batch(self, event):
+        """Send a batch of the sensor's new readings to WebSocket in one frame"""
+        await self.send_queued({
+            'type': 'sensor_reading_batch',
+            'data': event['readings']
+        }, key='sensor_reading_batch', merge=self.merge_reading_frames)
 
-    @database_sync_to_async
-    def check_sensor_exists(self, sensor_id):
-        """Check if sensor exists"""
-        return Sensor.objects.filter(sensor_id=sensor_id).exists()
+    def merge_reading_frames(self, queued, frame):
+        return merge_reading_frames(queued, frame, stream_sensor_id=self.sensor_id)
 
     @database_sync_to_async
     def get_sensor_info(self, sensor_id):
         """Get sensor information with latest reading"""
-        try:
-            sensor = Sensor.objects.get(sensor_id=sensor_id)
-            latest_reading = sensor.readings.first()
-            
-            sensor_info = {
-                'sensor_id': sensor.sensor_id,
-                'sensor_type': sensor.sensor_type,
-                'unit': sensor.unit,
-                'device_id': sensor.device.device_id,
-                'device_name': sensor.device.device_name,
-                'latest_reading': None
-            }
-            
-            if latest_reading:
-                sensor_info['latest_reading'] = {
-                    'value': latest_reading.value,
-                    'timestamp': latest_reading.created_at.isoformat()
-                }
-            
-            return sensor_info
-        except Sensor.DoesNotExist:
-            return None
-
-    @database_sync_to_async
-    def save_sensor_reading(self, sensor_id, value):
-        """Save sensor reading to database"""
-        try:
-            sensor = Sensor.objects.get(sensor_id=sensor_id)
-            sensor_data = SensorData.objects.create(
-                sensor=sensor,
-                value=float(value)
-            )
-            return {
-                'id': sensor_data.data_id,
-                'value': sensor_data.value,
-                'timestamp': sensor_data.created_at.isoformat(),
-                'sensor_type': sensor.sensor_type,
-                'unit': sensor.unit
-            }
-        except (Sensor.DoesNotExist, ValueError):
+        if not str(sensor_id).isdigit():
             return None
+        return latest_values.sensor_snapshot(int(sensor_id))
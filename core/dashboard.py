@@ -0,0 +1,102 @@
+"""
+Device dashboards: a device with its hydroponics, its sensors, each
+sensor's latest reading and recent stats, built for any number of devices
+with a fixed number of queries
+"""
+from datetime import timedelta
+from django.db.models import F, Max, Min, Prefetch, Sum, prefetch_related_objects
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+from .latest import latest_values
+from .models import Hydroponic, Sensor, SensorDataRollup
+from .rollups import RESOLUTIONS, bucket_start, choose_resolution
+from .serializers import DeviceSerializer, HydroponicSerializer, SensorSerializer
+
+# Rollup buckets per sensor the stats may span; longer windows are taken
+# from a coarser resolution
+STATS_MAX_BUCKETS = 1440
+
+_datetime_field = serializers.DateTimeField()
+
+
+def latest_reading(entry):
+    """The ``latest_reading`` of a dashboard sensor for a latest-value store entry"""
+    if not entry:
+        return None
+    return {
+        'data_id': entry['id'],
+        'value': entry['value'],
+        'measured_at': _datetime_field.to_representation(parse_datetime(entry['measured_at']))
+        if entry['measured_at'] else None,
+        'created_at': _datetime_field.to_representation(parse_datetime(entry['created_at'])),
+    }
+
+
+def window_stats(sensor_ids, since, until):
+    """
+    Return ``(bucket start, {sensor_id: {min, max, avg, count}})`` for the
+    readings of ``sensor_ids`` from ``since`` on, aggregated from the
+    rollups in one query. The window is widened to the start of its first
+    bucket.
+    """
+    resolution = choose_resolution(since, until, STATS_MAX_BUCKETS)
+    start = bucket_start(since, RESOLUTIONS[resolution])
+    rows = SensorDataRollup.objects.filter(
+        sensor_id__in=sensor_ids, resolution=resolution, bucket__gte=start
+    ).order_by().values('sensor_id').annotate(
+        low=Min('min_value'), high=Max('max_value'),
+        total=Sum(F('avg_value') * F('count')), readings=Sum('count'),
+    )
+    stats = {
+        row['sensor_id']: {
+            'min': row['low'],
+            'max': row['high'],
+            'avg': row['total'] / row['readings'],
+            'count': row['readings'],
+        }
+        for row in rows
+    }
+    return start, stats
+
+
+def device_dashboards(devices, window, now):
+    """
+    Return the dashboard of each of ``devices`` (``Device`` instances), with
+    stats over the ``window`` seconds before ``now``.
+
+    Sensors and hydroponics are prefetched for every device at once and the
+    stats are one aggregate over the rollups, so the query count does not
+    grow with the number of devices or sensors. Latest readings come from
+    the latest-value store.
+    """
+    devices = list(devices)
+    prefetch_related_objects(
+        devices,
+        Prefetch('sensors', queryset=Sensor.objects.order_by('sensor_id')),
+        Prefetch('hydroponics', queryset=Hydroponic.objects.order_by('hydroponic_id')),
+    )
+
+    sensor_ids = [sensor.sensor_id for device in devices for sensor in device.sensors.all()]
+    readings, stats = {}, {}
+    start = None
+    if sensor_ids:
+        readings = latest_values.latest_readings(sensor_ids)
+        start, stats = window_stats(sensor_ids, now - timedelta(seconds=window), now)
+    since = _datetime_field.to_representation(start) if start else None
+    empty = {'min': None, 'max': None, 'avg': None, 'count': 0}
+
+    dashboards = []
+    for device in devices:
+        sensors = []
+        for sensor in device.sensors.all():
+            sensors.append({
+                **SensorSerializer(sensor).data,
+                'latest_reading': latest_reading(readings[sensor.sensor_id]),
+                'stats': {'since': since, **stats.get(sensor.sensor_id, empty)},
+            })
+        dashboards.append({
+            **DeviceSerializer(device).data,
+            'hydroponics': HydroponicSerializer(device.hydroponics.all(), many=True).data,
+            'sensors': sensors,
+        })
+    return dashboards
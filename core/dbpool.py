@@ -0,0 +1,43 @@
+"""
+Thread pool for the database work of the WebSocket consumers
+"""
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+
+_executor = None
+_executor_size = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The shared consumer DB pool, or None when ``CONSUMER_DB_POOL`` is not sized"""
+    global _executor, _executor_size
+    max_workers = settings.CONSUMER_DB_POOL['MAX_WORKERS']
+    if not max_workers:
+        return None
+    with _executor_lock:
+        if _executor_size != max_workers:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='consumer-db')
+            _executor_size = max_workers
+        return _executor
+
+
+def database_sync_to_async(func):
+    """
+    Drop-in for ``channels.db.database_sync_to_async``.
+
+    Channels runs every wrapped call on one shared thread, so under a
+    connection storm consumers queue for that thread rather than for the
+    database. With ``CONSUMER_DB_POOL['MAX_WORKERS']`` set, calls run on a
+    pool of that many threads instead, each with its own connection.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        executor = get_executor()
+        if executor is None:
+            return await DatabaseSyncToAsync(func)(*args, **kwargs)
+        return await DatabaseSyncToAsync(func, thread_sensitive=False, executor=executor)(*args, **kwargs)
+    return wrapper
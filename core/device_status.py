@@ -0,0 +1,116 @@
+"""
+Device status change detection and batched last-seen tracking for the
+device WebSocket stream
+"""
+import asyncio
+import logging
+import time
+from django.conf import settings
+from django.utils import timezone
+from .dbpool import database_sync_to_async
+from .http_cache import DEVICE_LAST_SEEN, bump_versions
+from .latest import latest_values
+from .models import Device
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceStatusCache:
+    """
+    Last known status of each device, so repeated ``device_status`` frames
+    cost nothing.
+
+    A status equal to the cached one is skipped while the entry is younger
+    than ``ttl`` seconds. Anything else is written with a conditional
+    ``UPDATE ... WHERE status <> %s``, so a stale entry (the status changed
+    through another worker) costs one query, never a wrong skip for longer
+    than ``ttl``. ``update()`` bypasses ``Device.save()`` and its signals, so
+    it invalidates the caches itself; callers broadcast the change.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else settings.DEVICE_STATUS['STATUS_TTL']
+        self._entries = {}
+
+    async def update(self, device_id, status):
+        """Store ``status`` for ``device_id``; return True if it changed"""
+        cached = self._entries.get(device_id)
+        now = time.monotonic()
+        if cached is not None and cached[0] == status and now - cached[1] < self.ttl:
+            return False
+
+        changed = await Device.objects.filter(device_id=device_id).exclude(status=status).aupdate(
+            status=status, updated_at=timezone.now()
+        )
+        self._entries[device_id] = (status, now)
+        if changed:
+            # Connect snapshots and device API responses carry the status
+            await database_sync_to_async(latest_values.invalidate_device)(device_id)
+            await database_sync_to_async(bump_versions)(Device)
+        return bool(changed)
+
+    def forget(self, device_id):
+        self._entries.pop(device_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def save_last_seen(moments):
+    """
+    Write ``{device_id: datetime}`` to ``Device.last_seen`` in one query.
+
+    Only the ``DEVICE_LAST_SEEN`` version is bumped, not ``Device``'s: the
+    sensor, hydroponic and QR code responses do not show it.
+    """
+    Device.objects.bulk_update(
+        [Device(device_id=device_id, last_seen=moment) for device_id, moment in moments.items()],
+        ['last_seen']
+    )
+    bump_versions(DEVICE_LAST_SEEN)
+
+
+class LastSeenTracker:
+    """
+    Records when each device was last heard from and writes it to
+    ``Device.last_seen`` in batches.
+
+    ``touch`` only updates a dict; a task on the running loop flushes every
+    device touched since the last flush every ``interval`` seconds, so each
+    device is written at most once per interval however often it reports.
+    A falsy ``interval`` turns tracking off. Touches not yet flushed are lost
+    if the process exits.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval if interval is not None else settings.DEVICE_STATUS['LAST_SEEN_INTERVAL']
+        self._pending = {}
+        self._loop = None
+        self._worker = None
+
+    def touch(self, device_id, moment=None):
+        if not self.interval:
+            return
+        self._pending[device_id] = moment or timezone.now()
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            await database_sync_to_async(save_last_seen)(pending)
+        except Exception:
+            logger.exception('Failed to write last_seen for %d devices', len(pending))
+
+
+device_statuses = DeviceStatusCache()
+last_seen_tracker = LastSeenTracker()
@@ -0,0 +1,198 @@
+"""
+Server-side downsampling of sensor reading series for charting
+
+Readings are streamed from the database in chunks of ``(created_at, value)``
+pairs and reduced into ``points`` equal-width time buckets with NumPy, so
+memory use depends on ``points`` and the chunk size, never on the size of the
+requested range.
+"""
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.db.models import Max, Min
+
+METHODS = ('lttb', 'minmax', 'avg')
+CHUNK_SIZE = 10000
+
+
+def _iter_chunks(queryset, chunk_size):
+    """Yield ``(timestamps, values)`` float64 arrays in ascending time order"""
+    rows = queryset.order_by('created_at').values_list('created_at', 'value').iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield _to_arrays(chunk)
+            chunk = []
+    if chunk:
+        yield _to_arrays(chunk)
+
+
+def _to_arrays(chunk):
+    timestamps = np.fromiter((row[0].timestamp() for row in chunk), dtype=np.float64, count=len(chunk))
+    values = np.fromiter((row[1] for row in chunk), dtype=np.float64, count=len(chunk))
+    return timestamps, values
+
+
+def _segments(timestamps, start, width, points):
+    """
+    Map timestamps to bucket indices and split the (sorted) chunk into runs
+    of equal bucket. Returns ``(buckets, starts, ends)`` for each run.
+    """
+    indices = ((timestamps - start) // width).astype(np.int64)
+    np.clip(indices, 0, points - 1, out=indices)
+    starts = np.flatnonzero(np.r_[True, indices[1:] != indices[:-1]])
+    ends = np.r_[starts[1:], len(indices)]
+    return indices[starts], starts, ends
+
+
+def _bucket_means(chunks, start, width, points):
+    """Per-bucket mean timestamp, mean value and count"""
+    time_sums = np.zeros(points)
+    value_sums = np.zeros(points)
+    counts = np.zeros(points, dtype=np.int64)
+    for timestamps, values in chunks:
+        indices = ((timestamps - start) // width).astype(np.int64)
+        np.clip(indices, 0, points - 1, out=indices)
+        time_sums += np.bincount(indices, weights=timestamps, minlength=points)
+        value_sums += np.bincount(indices, weights=values, minlength=points)
+        counts += np.bincount(indices, minlength=points)
+    filled = counts > 0
+    mean_times = np.divide(time_sums, counts, out=np.zeros(points), where=filled)
+    mean_values = np.divide(value_sums, counts, out=np.zeros(points), where=filled)
+    return mean_times, mean_values, counts
+
+
+def _first_match(mask, starts):
+    """Index of the first True in ``mask`` at or after each of ``starts``"""
+    positions = np.flatnonzero(mask)
+    return positions[np.searchsorted(positions, starts)]
+
+
+def _minmax(chunks, start, width, points):
+    """Keep the minimum and maximum reading of every bucket"""
+    min_values = np.full(points, np.inf)
+    max_values = np.full(points, -np.inf)
+    min_times = np.zeros(points)
+    max_times = np.zeros(points)
+    for timestamps, values in chunks:
+        buckets, starts, ends = _segments(timestamps, start, width, points)
+        lengths = ends - starts
+
+        chunk_min = np.minimum.reduceat(values, starts)
+        chunk_min_at = timestamps[_first_match(values == np.repeat(chunk_min, lengths), starts)]
+        better = chunk_min < min_values[buckets]
+        min_values[buckets[better]] = chunk_min[better]
+        min_times[buckets[better]] = chunk_min_at[better]
+
+        chunk_max = np.maximum.reduceat(values, starts)
+        chunk_max_at = timestamps[_first_match(values == np.repeat(chunk_max, lengths), starts)]
+        better = chunk_max > max_values[buckets]
+        max_values[buckets[better]] = chunk_max[better]
+        max_times[buckets[better]] = chunk_max_at[better]
+
+    filled = np.isfinite(min_values)
+    times = np.concatenate([min_times[filled], max_times[filled]])
+    values = np.concatenate([min_values[filled], max_values[filled]])
+    order = np.argsort(times, kind='stable')
+    times, values = times[order], values[order]
+    # A bucket whose min and max are the same reading yields it only once
+    keep = np.r_[True, (times[1:] != times[:-1]) | (values[1:] != values[:-1])]
+    return times[keep], values[keep]
+
+
+def _avg(chunks, start, width, points):
+    """One point per bucket at its mean timestamp and mean value"""
+    mean_times, mean_values, counts = _bucket_means(chunks, start, width, points)
+    filled = counts > 0
+    return mean_times[filled], mean_values[filled]
+
+
+def _lttb(make_chunks, start, width, points):
+    """
+    Largest-Triangle-Three-Buckets over time buckets, in two streaming passes.
+
+    The first pass computes every bucket's mean; the second picks, in each
+    bucket, the reading forming the largest triangle with the reading picked
+    in the previous bucket and the mean of the next non-empty bucket.
+    """
+    mean_times, mean_values, counts = _bucket_means(make_chunks(), start, width, points)
+    filled = np.flatnonzero(counts)
+    next_filled = {bucket: following for bucket, following in zip(filled[:-1], filled[1:])}
+
+    selected_times = []
+    selected_values = []
+    current = None  # bucket being scanned
+    best = None  # (area, time, value) of its best candidate so far
+    previous = None  # (time, value) picked in the previous bucket
+
+    def finish():
+        selected_times.append(best[1])
+        selected_values.append(best[2])
+        return best[1], best[2]
+
+    for timestamps, values in make_chunks():
+        buckets, starts, ends = _segments(timestamps, start, width, points)
+        for bucket, begin, end in zip(buckets.tolist(), starts.tolist(), ends.tolist()):
+            if bucket != current:
+                if best is not None:
+                    previous = finish()
+                current, best = bucket, None
+            bucket_times = timestamps[begin:end]
+            bucket_values = values[begin:end]
+            if previous is None:
+                # Always keep the first reading of the series
+                previous = (bucket_times[0], bucket_values[0])
+                best = (np.inf, bucket_times[0], bucket_values[0])
+                continue
+            following = next_filled.get(bucket)
+            if following is None:
+                # Last bucket: anchor on the latest reading instead of a mean
+                target_time, target_value = bucket_times[-1], bucket_values[-1]
+            else:
+                target_time, target_value = mean_times[following], mean_values[following]
+            areas = np.abs(
+                (previous[0] - target_time) * (bucket_values - previous[1])
+                - (previous[0] - bucket_times) * (target_value - previous[1])
+            )
+            index = int(np.argmax(areas))
+            if best is None or areas[index] > best[0]:
+                best = (areas[index], bucket_times[index], bucket_values[index])
+    if best is not None:
+        finish()
+    return np.array(selected_times), np.array(selected_values)
+
+
+def downsample(queryset, points, method='lttb', since=None, until=None, chunk_size=CHUNK_SIZE):
+    """
+    Reduce the readings in ``queryset`` to about ``points`` points.
+
+    ``since``/``until`` bound the bucket grid; when omitted they are taken
+    from the oldest and newest reading. ``minmax`` returns up to two points
+    per bucket. Returns ``(timestamp, value)`` pairs in ascending time order.
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown downsampling method: {method}')
+
+    if since is None or until is None:
+        bounds = queryset.aggregate(first=Min('created_at'), last=Max('created_at'))
+        if bounds['first'] is None:
+            return []
+        since = since or bounds['first']
+        until = until or bounds['last']
+    start = since.timestamp()
+    width = max((until.timestamp() - start) / points, 1e-6)
+
+    def make_chunks():
+        return _iter_chunks(queryset, chunk_size)
+
+    if method == 'lttb':
+        times, values = _lttb(make_chunks, start, width, points)
+    elif method == 'minmax':
+        times, values = _minmax(make_chunks(), start, width, points)
+    else:
+        times, values = _avg(make_chunks(), start, width, points)
+
+    return [
+        (datetime.fromtimestamp(moment, tz=dt_timezone.utc), float(value))
+        for moment, value in zip(times.tolist(), values.tolist())
+    ]
@@ -0,0 +1,150 @@
+"""
+Coalesced WebSocket fan-out of new sensor readings
+"""
+import asyncio
+import logging
+import threading
+from django.conf import settings
+from django.db import transaction
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+# The ASGI server's event loop, recorded by ServerLoopMiddleware
+_server_loop = None
+
+
+def sensor_data_routes(sensor_data):
+    """
+    Return the ``(group, batch type, item)`` triples a new reading is
+    broadcast as: the general stream, its device group and its sensor group.
+    """
+    return [
+        ('sensor_data', 'sensor_data_batch', sensor_data),
+        (f"device_{sensor_data['device_id']}", 'sensor_data_batch', sensor_data),
+        (f"sensor_{sensor_data['sensor_id']}", 'sensor_reading_batch', {
+            'id': sensor_data['id'],
+            'value': sensor_data['value'],
+            'timestamp': sensor_data['timestamp'],
+            'sensor_type': sensor_data['sensor_type'],
+            'unit': sensor_data['unit']
+        }),
+    ]
+
+
+def alert_routes(alert):
+    """An alert that fired or resolved goes to its device group"""
+    return [(f"device_{alert['device_id']}", 'alert_batch', alert)]
+
+
+# The key holding a batch frame's items, per batch type
+BATCH_ITEMS = {
+    'alert_batch': 'alerts',
+}
+
+
+class FanoutDispatcher:
+    """
+    Collects reading broadcasts and sends them per group as batch frames.
+
+    Payloads published within ``interval`` seconds of each other are
+    coalesced into one ``{'type': <batch type>, 'readings': [...]}`` message
+    per group (split every ``max_batch_size`` readings), so a burst of N
+    inserts costs a handful of ``group_send`` calls instead of 3N. Callers on
+    an event loop are flushed by a task on that loop. Sync callers hand their
+    payloads over without blocking: to the server's event loop when the
+    process serves ASGI (a view under Daphne), so the channel layer is only
+    used from that loop, otherwise to the dispatcher's own loop thread.
+    """
+
+    def __init__(self, interval=None, max_batch_size=None):
+        config = settings.SENSOR_FANOUT
+        self.interval = interval or config['INTERVAL']
+        self.max_batch_size = max_batch_size or config['MAX_BATCH_SIZE']
+        self._pending = {}
+        self._thread_loop = None
+        self._thread_lock = threading.Lock()
+
+    def publish(self, payloads, routes=sensor_data_routes):
+        """Queue the broadcast payloads of new readings; None entries are skipped"""
+        payloads = [payload for payload in payloads if payload is not None]
+        if not payloads:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = get_server_loop() or self._get_thread_loop()
+            loop.call_soon_threadsafe(self._enqueue, loop, payloads, routes)
+        else:
+            self._enqueue(loop, payloads, routes)
+
+    def publish_alerts(self, alerts):
+        """Queue alerts that fired or resolved for their device groups"""
+        self.publish(alerts, routes=alert_routes)
+
+    def publish_on_commit(self, payloads):
+        """Queue ``payloads`` once the current transaction commits"""
+        transaction.on_commit(lambda: self.publish(payloads))
+
+    def _enqueue(self, loop, payloads, routes=sensor_data_routes):
+        pending = self._pending.get(loop)
+        if pending is None:
+            pending = self._pending[loop] = {}
+            loop.call_later(self.interval, lambda: loop.create_task(self._flush(loop)))
+        for payload in payloads:
+            for group, batch_type, item in routes(payload):
+                pending.setdefault((group, batch_type), []).append(item)
+
+    async def _flush(self, loop):
+        pending = self._pending.pop(loop, {})
+        channel_layer = get_channel_layer()
+        for (group, batch_type), items in pending.items():
+            for start in range(0, len(items), self.max_batch_size):
+                try:
+                    await channel_layer.group_send(group, {
+                        'type': batch_type,
+                        BATCH_ITEMS.get(batch_type, 'readings'): items[start:start + self.max_batch_size],
+                    })
+                except Exception:
+                    logger.exception('Failed to broadcast %d %s items to %s', len(items), batch_type, group)
+
+    def _get_thread_loop(self):
+        with self._thread_lock:
+            if self._thread_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name='sensor-fanout', daemon=True
+                ).start()
+                self._thread_loop = loop
+            return self._thread_loop
+
+
+def get_server_loop():
+    """The ASGI server's event loop, while it runs"""
+    loop = _server_loop
+    return loop if loop is not None and loop.is_running() and not loop.is_closed() else None
+
+
+def set_server_loop(loop):
+    global _server_loop
+    _server_loop = loop
+
+
+class ServerLoopMiddleware:
+    """
+    Records the event loop the ASGI server calls the application on, so
+    sync code it runs in worker threads (views, ``post_save``) publishes on
+    that loop
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        if _server_loop is not loop:
+            set_server_loop(loop)
+        return await self.application(scope, receive, send)
+
+
+fanout = FanoutDispatcher()
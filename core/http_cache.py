@@ -0,0 +1,121 @@
+"""
+Conditional GET and response caching for slow-changing API resources
+
+Every cached model has a version in the API cache: the time it last
+changed, bumped by ``core.signals`` and by the device status paths, which
+bypass ``save()``. ``Device.last_seen``, written every few seconds while
+devices report, has a version of its own (``DEVICE_LAST_SEEN``) so that
+only the responses showing it depend on it. A response's ETag is a hash of the user, the request and
+the versions of the models it is built from, so it can be checked, and a
+stored body found, without touching the database.
+"""
+import functools
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+VERSION_PREFIX = 'api:version:'
+RESPONSE_PREFIX = 'api:response:'
+
+# Version name for Device.last_seen, used in place of a model
+DEVICE_LAST_SEEN = 'core.device.last_seen'
+
+
+def api_cache():
+    return caches[settings.API_CACHE['CACHE']]
+
+
+def version_key(model):
+    """The key of the version of ``model``, a model class or a version name such as ``DEVICE_LAST_SEEN``"""
+    name = model if isinstance(model, str) else model._meta.label_lower
+    return f'{VERSION_PREFIX}{name}'
+
+
+def bump_versions(*models):
+    """Mark ``models`` (or version names) as changed now, invalidating every response built from them"""
+    now = time.time()
+    api_cache().set_many({version_key(model): now for model in models}, timeout=None)
+
+
+def model_versions(models):
+    """Return the version of each of ``models``; a model without one (a cold cache) starts now"""
+    cache = api_cache()
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = cache.get_or_set(key, time.time(), timeout=None)
+    return [versions[key] for key in keys]
+
+
+def not_modified(request, etag, last_modified):
+    """Whether the client's copy is current: If-None-Match if sent, else If-Modified-Since"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags or f'W/{etag}' in etags
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def cached_response(view_method):
+    """
+    Serve a GET view method of a viewset with ``cache_models`` from the API
+    cache, answering 304 when the client's ETag is current. Only 200 JSON
+    responses are stored; the browsable API is always built fresh.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        config = settings.API_CACHE
+        if not config['ENABLED'] or not isinstance(request.accepted_renderer, JSONRenderer):
+            return view_method(self, request, *args, **kwargs)
+
+        versions = model_versions(self.cache_models)
+        identity = (f'{request.user.pk}:{request.accepted_media_type}:{request.build_absolute_uri()}:'
+                    f'{":".join(map(repr, versions))}')
+        etag = f'"{hashlib.md5(identity.encode(), usedforsecurity=False).hexdigest()}"'
+        last_modified = max(versions)
+
+        if not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cache = api_cache()
+            stored = cache.get(RESPONSE_PREFIX + etag)
+            if stored is not None:
+                response = Response(stored)
+            else:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(RESPONSE_PREFIX + etag, response.data, timeout=config['TIMEOUT'])
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Per user, and clients must revalidate
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+        return response
+    return wrapper
+
+
+class CachedReadMixin:
+    """
+    Serve ``list`` and ``retrieve`` through ``cached_response``.
+    ``cache_models`` lists every model (or version name) the responses are
+    built from, including those of ``@cached_response`` extra actions.
+    """
+    cache_models = ()
+
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
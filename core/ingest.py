@@ -0,0 +1,272 @@
+"""
+Batched sensor data ingestion shared by the bulk REST endpoint and the
+WebSocket consumers
+"""
+import asyncio
+import logging
+import math
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .alerts import alert_engine
+from .dbpool import database_sync_to_async
+from .fanout import fanout
+from .latest import latest_values
+from .metadata import sensor_metadata
+from .models import Sensor, SensorData
+from .rollups import update_rollups
+from .signals import sensor_data_payload
+from .utils import parse_moment
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_sensor_id(raw):
+    """Return the sensor id as an int, or None if it is not a valid pk"""
+    if isinstance(raw, bool):
+        return None
+    if isinstance(raw, int):
+        return raw
+    if isinstance(raw, str) and raw.strip().isdigit():
+        return int(raw)
+    return None
+
+
+def _parse_value(raw):
+    """Return the reading as a finite float, or None if it is not numeric"""
+    if isinstance(raw, bool) or raw is None:
+        return None
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def validate_reading(row, known_sensor_ids):
+    """
+    Validate a single ``{sensor, value, timestamp}`` row.
+
+    Returns a ``(SensorData, errors)`` tuple where exactly one side is set.
+    """
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': ['Expected an object.']}
+
+    errors = {}
+    sensor_id = _parse_sensor_id(row.get('sensor'))
+    if 'sensor' not in row:
+        errors['sensor'] = ['This field is required.']
+    elif sensor_id is None:
+        errors['sensor'] = ['Incorrect type. Expected pk value.']
+    elif sensor_id not in known_sensor_ids:
+        errors['sensor'] = [f'Invalid pk "{sensor_id}" - object does not exist.']
+
+    value = _parse_value(row.get('value'))
+    if 'value' not in row:
+        errors['value'] = ['This field is required.']
+    elif value is None:
+        errors['value'] = ['A valid number is required.']
+
+    measured_at = None
+    if row.get('timestamp') is not None:
+        measured_at = parse_moment(row['timestamp'])
+        if measured_at is None:
+            errors['timestamp'] = ['Datetime has wrong format. Use ISO 8601.']
+
+    if errors:
+        return None, errors
+    return SensorData(sensor_id=sensor_id, value=value, measured_at=measured_at), None
+
+
+def _create_readings(rows, chunk_size=None):
+    """
+    Validate ``rows`` and insert the accepted ones.
+
+    Returns ``(results, accepted, sensors)`` where ``accepted`` holds
+    ``(index, SensorData)`` pairs and ``sensors`` maps id to cached metadata.
+    Rows for a cached sensor that another process has deleted are rejected
+    rather than failing the whole write.
+    """
+    chunk_size = chunk_size or settings.SENSOR_DATA_BULK_CHUNK_SIZE
+
+    referenced = set()
+    for row in rows:
+        if isinstance(row, dict):
+            sensor_id = _parse_sensor_id(row.get('sensor'))
+            if sensor_id is not None:
+                referenced.add(sensor_id)
+    sensors = sensor_metadata.get_many(referenced)
+
+    results, accepted = _validate_readings(rows, sensors)
+    if accepted:
+        try:
+            _insert_readings(accepted, chunk_size)
+        except IntegrityError:
+            # A cached sensor was deleted by another process; forget the
+            # sensors that are gone and write the rows that are still valid
+            existing = set(Sensor.objects.filter(sensor_id__in=sensors).values_list('sensor_id', flat=True))
+            gone = set(sensors) - existing
+            if not gone:
+                raise
+            for sensor_id in gone:
+                sensor_metadata.invalidate_sensor(sensor_id)
+                del sensors[sensor_id]
+            results, accepted = _validate_readings(rows, sensors)
+            if accepted:
+                _insert_readings(accepted, chunk_size)
+        for index, reading in accepted:
+            results[index]['data_id'] = reading.data_id
+
+    return results, accepted, sensors
+
+
+def _validate_readings(rows, sensors):
+    results = []
+    accepted = []
+    for index, row in enumerate(rows):
+        reading, errors = validate_reading(row, sensors)
+        if errors:
+            results.append({'index': index, 'status': 'rejected', 'errors': errors})
+        else:
+            results.append({'index': index, 'status': 'accepted'})
+            accepted.append((index, reading))
+    return results, accepted
+
+
+def _insert_readings(accepted, chunk_size):
+    with transaction.atomic():
+        readings = SensorData.objects.bulk_create(
+            [reading for _, reading in accepted],
+            batch_size=chunk_size
+        )
+        update_rollups(readings)
+        transaction.on_commit(lambda: latest_values.record(readings))
+
+
+def ingest_readings(rows, chunk_size=None):
+    """
+    Validate and insert a batch of readings with ``bulk_create``.
+
+    Sensor ids are checked against the metadata cache, which loads any
+    misses in a single query no matter how many rows are sent. Accepted
+    readings are broadcast and checked against the alert rules once
+    committed. Returns one result dict per input row, in input order.
+    """
+    results, accepted, sensors = _create_readings(rows, chunk_size)
+    payloads = [sensor_data_payload(reading, sensors[reading.sensor_id]) for _, reading in accepted]
+    fanout.publish_on_commit(payloads)
+    alert_engine.evaluate_on_commit(payloads)
+    return results
+
+
+def save_readings(rows):
+    """
+    Insert a batch of readings, check them against the alert rules once
+    committed and return their broadcast payloads.
+
+    The returned list is aligned with ``rows``; rejected rows map to None.
+    """
+    payloads = [None] * len(rows)
+    _, accepted, sensors = _create_readings(rows)
+    for index, reading in accepted:
+        payloads[index] = sensor_data_payload(reading, sensors[reading.sensor_id])
+    alert_engine.evaluate_on_commit(payloads)
+    return payloads
+
+
+class IngestBuffer:
+    """
+    Write-behind buffer for readings received over WebSockets.
+
+    Consumers ``submit`` frames; a worker task on the running event loop
+    collects them and writes them with one ``bulk_create`` once
+    ``max_batch_size`` rows are queued or ``max_latency`` seconds have passed
+    since the first one. ``submit`` blocks while the queue is full, which
+    pushes back on the sending socket. With ``wait=True`` it returns the
+    reading's broadcast payload (or None if it was rejected) after the batch
+    has been committed.
+    """
+
+    def __init__(self, max_batch_size=None, max_latency=None, max_queue_size=None):
+        config = settings.SENSOR_INGEST_BUFFER
+        self.max_batch_size = max_batch_size or config['MAX_BATCH_SIZE']
+        self.max_latency = max_latency or config['MAX_LATENCY']
+        self.max_queue_size = max_queue_size or config['MAX_QUEUE_SIZE']
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # asyncio queues are bound to one loop; start over on a new one
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, sensor_id, value, timestamp=None, wait=False):
+        """Queue one reading, optionally waiting until it is committed"""
+        self._ensure_worker()
+        future = self._loop.create_future() if wait else None
+        row = {'sensor': sensor_id, 'value': value, 'timestamp': timestamp}
+        await self._queue.put((row, future))
+        if future is not None:
+            return await future
+        return None
+
+    async def submit_many(self, rows, wait=False):
+        """
+        Queue ``{sensor, value, timestamp}`` rows, optionally waiting until
+        all of them are committed and returning their payloads (None where
+        rejected)
+        """
+        self._ensure_worker()
+        futures = []
+        for row in rows:
+            future = self._loop.create_future() if wait else None
+            await self._queue.put((row, future))
+            futures.append(future)
+        if wait:
+            return await asyncio.gather(*futures)
+        return None
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+            # Exit while idle; the next submit starts a fresh worker
+            if self._queue.empty():
+                return
+
+    async def _flush(self, batch):
+        rows = [row for row, _ in batch]
+        try:
+            payloads = await database_sync_to_async(save_readings)(rows)
+        except Exception as exc:
+            logger.exception('Failed to write %d buffered sensor readings', len(rows))
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_, future), payload in zip(batch, payloads):
+            if future is not None and not future.done():
+                future.set_result(payload)
+
+        fanout.publish(payloads)
+
+
+ingest_buffer = IngestBuffer()
@@ -0,0 +1,343 @@
+"""
+Latest-value store: each sensor's newest reading and each device's sensor
+list, for connect-time snapshots and ``latest_data``
+"""
+import json
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import OuterRef, Subquery
+from .metadata import sensor_metadata
+from .models import Device, Sensor, SensorData
+
+# Stored for sensors known to have no readings yet
+EMPTY = {}
+
+# Key of the memory backend's shared invalidation generation
+GENERATION_KEY = 'latest:generation'
+
+
+def reading_entry(reading):
+    """The stored form of a ``SensorData`` row"""
+    return {
+        'id': reading.data_id,
+        'value': reading.value,
+        'measured_at': reading.measured_at.isoformat() if reading.measured_at else None,
+        'created_at': reading.created_at.isoformat(),
+    }
+
+
+def reading_summary(entry):
+    """The ``latest_reading`` sent to WebSocket clients for a stored reading"""
+    if not entry:
+        return None
+    return {'id': entry['id'], 'value': entry['value'], 'timestamp': entry['created_at']}
+
+
+def _is_newer(entry, current):
+    if not current:
+        return True
+    return (entry['created_at'], entry['id']) > (current['created_at'], current['id'])
+
+
+class MemoryBackend:
+    """
+    Per-process backend; every worker keeps its own copy.
+
+    Entries expire ``ttl`` seconds after they were stored (never if None),
+    which bounds how long a change made by another process goes unseen.
+    Writes given the ``generation`` read before their database load are
+    skipped when an invalidation ran in between.
+
+    With a ``cache`` alias, every delete also stores a new token under
+    ``GENERATION_KEY`` in that Django cache, and every read compares it with
+    the last one seen, dropping all entries when it changed. If the cache is
+    shared, an invalidation in any process (a management command deleting
+    readings, another worker) reaches every worker on its next read.
+    """
+
+    def __init__(self, ttl=None, cache=None, **options):
+        self.ttl = ttl
+        self.cache_alias = cache
+        # key -> (entry, expires at)
+        self._entries = {}
+        self._generation = 0
+        self._shared_generation = None
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def _expires_at(self):
+        return time.monotonic() + self.ttl if self.ttl is not None else None
+
+    def _get(self, key, now):
+        cached = self._entries.get(key)
+        if cached is None:
+            return None
+        if cached[1] is not None and cached[1] <= now:
+            del self._entries[key]
+            return None
+        return cached[0]
+
+    def _sync(self):
+        """Drop every entry if another process invalidated since the last read"""
+        if self.cache_alias is None:
+            return
+        shared = caches[self.cache_alias].get(GENERATION_KEY)
+        with self._lock:
+            if shared != self._shared_generation:
+                self._generation += 1
+                self._entries.clear()
+                self._shared_generation = shared
+
+    def _publish(self):
+        """Make the other processes drop their entries on their next read"""
+        if self.cache_alias is None:
+            return
+        token = uuid.uuid4().hex
+        caches[self.cache_alias].set(GENERATION_KEY, token, timeout=None)
+        with self._lock:
+            self._shared_generation = token
+
+    def get_many(self, keys):
+        self._sync()
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._get(key, now)
+                if entry is not None:
+                    found[key] = entry
+        return found
+
+    def set_many(self, entries, generation=None):
+        expires_at = self._expires_at()
+        with self._lock:
+            if generation is None or generation == self._generation:
+                self._entries.update((key, (entry, expires_at)) for key, entry in entries.items())
+
+    def add_many(self, entries, generation=None):
+        """Set entries whose key is not stored yet"""
+        now = time.monotonic()
+        expires_at = self._expires_at()
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            for key, entry in entries.items():
+                if self._get(key, now) is None:
+                    self._entries[key] = (entry, expires_at)
+
+    def set_newer_many(self, entries, generation=None):
+        """Set reading entries unless the stored reading is at least as new"""
+        now = time.monotonic()
+        expires_at = self._expires_at()
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            for key, entry in entries.items():
+                if _is_newer(entry, self._get(key, now)):
+                    self._entries[key] = (entry, expires_at)
+
+    def delete_many(self, keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+        self._publish()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+        self._publish()
+
+
+class RedisBackend:
+    """
+    Backend shared by every worker through Redis (or anything that speaks
+    its protocol). Entries are JSON strings under ``KEY_PREFIX``; deletes
+    reach every worker at once, so writes have no generation to check.
+    """
+    generation = None
+    SET_NEWER = """
+    for index, key in ipairs(KEYS) do
+        local entry = cjson.decode(ARGV[index])
+        local raw = redis.call('GET', key)
+        local current = raw and cjson.decode(raw)
+        if not current or not current['created_at']
+                or entry['created_at'] > current['created_at']
+                or (entry['created_at'] == current['created_at'] and entry['id'] > current['id']) then
+            redis.call('SET', key, ARGV[index])
+        end
+    end
+    """
+
+    def __init__(self, location, key_prefix='', **options):
+        import redis
+
+        self.client = redis.Redis.from_url(location)
+        self.key_prefix = key_prefix
+        self._set_newer = self.client.register_script(self.SET_NEWER)
+
+    def _key(self, key):
+        return f'{self.key_prefix}{key}'
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([self._key(key) for key in keys])
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, entries, generation=None):
+        if entries:
+            self.client.mset({self._key(key): json.dumps(entry) for key, entry in entries.items()})
+
+    def add_many(self, entries, generation=None):
+        if entries:
+            with self.client.pipeline(transaction=False) as pipe:
+                for key, entry in entries.items():
+                    pipe.set(self._key(key), json.dumps(entry), nx=True)
+                pipe.execute()
+
+    def set_newer_many(self, entries, generation=None):
+        if entries:
+            keys = list(entries)
+            self._set_newer(keys=[self._key(key) for key in keys],
+                            args=[json.dumps(entries[key]) for key in keys])
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        if keys:
+            self.client.delete(*[self._key(key) for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f'{self.key_prefix}*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'redis': RedisBackend,
+}
+
+
+class LatestValueStore:
+    """
+    Newest reading per sensor, updated by the ingest paths once their rows
+    commit, plus the sensor list of each device.
+
+    Anything missing (a cold process, a sensor that has not reported since)
+    is loaded from the database and kept, for ``TTL`` seconds with the
+    memory backend; sensor metadata comes from ``sensor_metadata``. Device
+    entries are dropped by the ``Device`` and ``Sensor`` signals in
+    ``core.signals``.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            config = settings.SENSOR_LATEST_STORE
+            self._backend = BACKENDS[config['BACKEND']](
+                location=config.get('LOCATION'), key_prefix=config.get('KEY_PREFIX', ''),
+                ttl=config.get('TTL'), cache=config.get('CACHE'),
+            )
+        return self._backend
+
+    def record(self, readings):
+        """Store ``readings`` (committed ``SensorData`` rows) where they are the newest"""
+        entries = {}
+        for reading in readings:
+            entry = reading_entry(reading)
+            key = f'reading:{reading.sensor_id}'
+            if _is_newer(entry, entries.get(key)):
+                entries[key] = entry
+        self.backend.set_newer_many(entries)
+
+    def latest_readings(self, sensor_ids):
+        """Return ``{sensor_id: reading entry or None}`` for ``sensor_ids``"""
+        sensor_ids = list(sensor_ids)
+        generation = self.backend.generation
+        stored = self.backend.get_many(f'reading:{sensor_id}' for sensor_id in sensor_ids)
+        found = {sensor_id: stored.get(f'reading:{sensor_id}') for sensor_id in sensor_ids}
+
+        missing = [sensor_id for sensor_id, entry in found.items() if entry is None]
+        if missing:
+            latest_ids = Sensor.objects.filter(sensor_id__in=missing).annotate(
+                latest_id=Subquery(
+                    SensorData.objects.filter(sensor=OuterRef('pk'))
+                    .order_by('-created_at', '-data_id').values('data_id')[:1]
+                )
+            ).values_list('latest_id', flat=True)
+            loaded = {
+                f'reading:{reading.sensor_id}': reading_entry(reading)
+                for reading in SensorData.objects.filter(data_id__in=[pk for pk in latest_ids if pk])
+            }
+            self.backend.set_newer_many(loaded, generation)
+            self.backend.add_many({f'reading:{sensor_id}': EMPTY for sensor_id in missing
+                                   if f'reading:{sensor_id}' not in loaded}, generation)
+            for sensor_id in missing:
+                found[sensor_id] = loaded.get(f'reading:{sensor_id}', EMPTY)
+
+        return {sensor_id: entry or None for sensor_id, entry in found.items()}
+
+    def sensor_snapshot(self, sensor_id):
+        """Return a sensor's metadata and latest reading, or None if it does not exist"""
+        metadata = sensor_metadata.get(sensor_id)
+        if metadata is None:
+            return None
+        return {**metadata, 'latest_reading': reading_summary(self.latest_readings([sensor_id])[sensor_id])}
+
+    def device_snapshot(self, device_id):
+        """Return a device with every sensor's latest reading, or None if it does not exist"""
+        key = f'device:{device_id}'
+        generation = self.backend.generation
+        device = self.backend.get_many([key]).get(key)
+        if device is None:
+            device = Device.objects.filter(device_id=device_id).values(
+                'device_id', 'device_name', 'status', 'user_email'
+            ).first()
+            if device is None:
+                return None
+            device['sensor_ids'] = list(
+                Sensor.objects.filter(device_id=device_id).order_by('sensor_id').values_list('sensor_id', flat=True)
+            )
+            self.backend.set_many({key: device}, generation)
+
+        sensor_ids = device['sensor_ids']
+        metadata = sensor_metadata.get_many(sensor_ids)
+        readings = self.latest_readings(sensor_ids)
+        snapshot = {name: value for name, value in device.items() if name != 'sensor_ids'}
+        snapshot['sensors'] = [
+            {
+                'sensor_id': sensor_id,
+                'sensor_type': metadata[sensor_id]['sensor_type'],
+                'unit': metadata[sensor_id]['unit'],
+                'latest_reading': reading_summary(readings[sensor_id]),
+            }
+            for sensor_id in sensor_ids if sensor_id in metadata
+        ]
+        return snapshot
+
+    def invalidate_device(self, device_id):
+        self.backend.delete_many([f'device:{device_id}'])
+
+    def invalidate_sensor(self, sensor_id):
+        self.backend.delete_many([f'reading:{sensor_id}'])
+
+    def invalidate_sensors(self, sensor_ids):
+        self.backend.delete_many([f'reading:{sensor_id}' for sensor_id in sensor_ids])
+
+    def clear(self):
+        self.backend.clear()
+
+
+latest_values = LatestValueStore()
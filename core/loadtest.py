@@ -0,0 +1,423 @@
+"""
+Load generator for the sensor ingest paths
+
+Simulates devices pushing readings over ``ws/sensor-data/``,
+``ws/sensor/<id>/`` and ``POST /api/sensor-data/bulk/`` while dashboard
+clients watch ``ws/sensor-data/``. Used by the ``loadtest`` management
+command and ``benchmarks/loadtest.py``; needs the ``websockets`` package
+(see requirements-dev.txt).
+"""
+import asyncio
+import base64
+import http.client
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+from django.db.backends.signals import connection_created
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+TRANSPORTS = ('ws', 'sensor-ws', 'rest')
+
+# Served by ``instrument()`` next to the application
+STATS_PATH = '/__loadtest__/stats'
+
+
+def rss_bytes():
+    """Current resident set size of this process (peak RSS where /proc is missing)"""
+    if resource is None:
+        return 0
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return max_rss_bytes()
+
+
+def max_rss_bytes():
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class QueryCounter:
+    """Database execute wrapper counting every query on the connections it is installed on"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def instrument(application):
+    """
+    Wrap an ASGI application so every database connection it opens counts
+    its queries, and ``GET STATS_PATH`` returns the query count and memory
+    use of the server process as JSON.
+    """
+    counter = QueryCounter()
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(counter)
+
+    connection_created.connect(install, weak=False)
+
+    async def instrumented(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == STATS_PATH:
+            body = json.dumps({
+                'queries': counter.count,
+                'rss_bytes': rss_bytes(),
+                'max_rss_bytes': max_rss_bytes(),
+            }).encode()
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [(b'content-type', b'application/json')],
+            })
+            await send({'type': 'http.response.body', 'body': body})
+            return
+        await application(scope, receive, send)
+
+    return instrumented
+
+
+def percentiles(samples):
+    """p50/p95/p99/max of ``samples`` in milliseconds, or None if there are none"""
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return {
+        'p50': statistics.median(samples),
+        'p95': samples[max(int(len(samples) * 0.95) - 1, 0)],
+        'p99': samples[max(int(len(samples) * 0.99) - 1, 0)],
+        'max': samples[-1],
+    }
+
+
+class HTTPClient:
+    """Keep-alive JSON client for one simulated device, run in a worker thread"""
+
+    def __init__(self, base_url, headers=None):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+        self.connection = None
+
+    def request(self, method, path, payload=None):
+        """Return ``(status, decoded JSON body or None)``"""
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        body = json.dumps(payload) if payload is not None else None
+        try:
+            self.connection.request(method, path, body=body, headers=self.headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def basic_auth_headers(email, password):
+    """
+    REST headers for HTTP Basic auth. The server hashes the password on every
+    request, which caps REST throughput long before ingest does; prefer
+    ``session_headers()``.
+    """
+    token = base64.b64encode(f'{email}:{password}'.encode()).decode()
+    return {'Authorization': f'Basic {token}'}
+
+
+def session_headers(base_url, email, password):
+    """
+    Log in through ``/api-auth/login/`` and return REST headers carrying the
+    session and CSRF token, or None if the login failed
+    """
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    try:
+        connection.request('GET', '/api-auth/login/')
+        response = connection.getresponse()
+        response.read()
+        cookies = SimpleCookie()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            cookies.load(header)
+        if 'csrftoken' not in cookies:
+            return None
+        csrf_token = cookies['csrftoken'].value
+
+        body = urlencode({'username': email, 'password': password, 'csrfmiddlewaretoken': csrf_token})
+        connection.request('POST', '/api-auth/login/', body=body, headers={
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Cookie': f'csrftoken={csrf_token}',
+        })
+        response = connection.getresponse()
+        response.read()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            cookies.load(header)
+    finally:
+        connection.close()
+
+    if response.status != 302 or 'sessionid' not in cookies:
+        return None
+    csrf_token = cookies['csrftoken'].value
+    return {
+        'Cookie': f"sessionid={cookies['sessionid'].value}; csrftoken={csrf_token}",
+        'X-CSRFToken': csrf_token,
+    }
+
+
+def fetch_server_stats(base_url):
+    """Query/memory stats of an instrumented server, or None if it has none"""
+    client = HTTPClient(base_url)
+    try:
+        status, stats = client.request('GET', STATS_PATH)
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        client.close()
+    return stats if status == 200 else None
+
+
+class LoadTest:
+    """
+    One load run against a server at ``base_url``.
+
+    ``devices`` maps device id to its sensor ids. Devices are spread
+    round-robin over ``transports``; each sensor reports ``rate`` readings
+    per second for ``duration`` seconds, and ``dashboards`` clients receive
+    the full ``ws/sensor-data/`` stream. Every reading carries a unique
+    value, so dashboards can time it from send to broadcast. REST requests
+    send ``rest_headers`` (authentication).
+    """
+
+    def __init__(self, base_url, devices, transports=TRANSPORTS, rate=1.0, duration=10.0,
+                 dashboards=1, rest_headers=None, drain=2.0):
+        if websockets is None:
+            raise RuntimeError('The load generator needs the websockets package (pip install websockets)')
+        self.base_url = base_url.rstrip('/')
+        self.ws_url = 'ws' + self.base_url[len('http'):]
+        self.devices = devices
+        self.transports = transports
+        self.rate = rate
+        self.duration = duration
+        self.dashboards = dashboards
+        self.rest_headers = rest_headers
+        self.drain = drain
+
+        self._next_value = 0
+        self._sent_at = {}
+        self.sent = dict.fromkeys(transports, 0)
+        self.errors = dict.fromkeys(transports, 0)
+        self.latencies = []
+        self.delivered = set()
+        self.dashboard_frames = 0
+
+    def new_reading(self):
+        """A unique reading value, with its send time recorded"""
+        value = float(self._next_value)
+        self._next_value += 1
+        self._sent_at[value] = time.perf_counter()
+        return value
+
+    async def tick(self, started, send_tick):
+        """Call ``send_tick`` every ``1 / rate`` seconds, starting at a random offset"""
+        interval = 1 / self.rate
+        next_at = started + random.uniform(0, interval)
+        while next_at < started + self.duration:
+            await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+            await send_tick()
+            next_at += interval
+
+    async def discard_incoming(self, socket):
+        try:
+            async for _ in socket:
+                pass
+        except websockets.ConnectionClosed:
+            pass
+
+    async def run_ws_device(self, sensor_ids, started):
+        async with websockets.connect(f'{self.ws_url}/ws/sensor-data/', max_queue=None) as socket:
+            # Producers do not want the broadcast stream
+            await socket.send(json.dumps({'type': 'subscribe', 'sensor_ids': []}))
+            drain = asyncio.create_task(self.discard_incoming(socket))
+
+            async def send_tick():
+                for sensor_id in sensor_ids:
+                    await socket.send(json.dumps({
+                        'type': 'sensor_data', 'sensor_id': sensor_id, 'value': self.new_reading()
+                    }))
+                    self.sent['ws'] += 1
+
+            await self.tick(started, send_tick)
+            drain.cancel()
+
+    async def run_sensor_ws(self, sensor_id, started):
+        async with websockets.connect(f'{self.ws_url}/ws/sensor/{sensor_id}/', max_queue=None) as socket:
+            drain = asyncio.create_task(self.discard_incoming(socket))
+
+            async def send_tick():
+                await socket.send(json.dumps({'type': 'sensor_reading', 'value': self.new_reading()}))
+                self.sent['sensor-ws'] += 1
+
+            await self.tick(started, send_tick)
+            drain.cancel()
+
+    async def run_rest_device(self, sensor_ids, started):
+        client = HTTPClient(self.base_url, self.rest_headers)
+
+        async def send_tick():
+            rows = [{'sensor': sensor_id, 'value': self.new_reading()} for sensor_id in sensor_ids]
+            try:
+                status, _ = await asyncio.to_thread(client.request, 'POST', '/api/sensor-data/bulk/', rows)
+            except (OSError, http.client.HTTPException):
+                status = None
+            if status == 201:
+                self.sent['rest'] += len(rows)
+            else:
+                self.errors['rest'] += 1
+
+        try:
+            await self.tick(started, send_tick)
+        finally:
+            client.close()
+
+    async def run_dashboard(self, ready, stop):
+        async with websockets.connect(f'{self.ws_url}/ws/sensor-data/', max_queue=None) as socket:
+            await socket.recv()  # connection_established
+            ready.release()
+            receiving = asyncio.create_task(self.receive_dashboard(socket))
+            await stop.wait()
+            receiving.cancel()
+
+    async def receive_dashboard(self, socket):
+        async for message in socket:
+            received_at = time.perf_counter()
+            frame = json.loads(message)
+            if frame.get('type') != 'sensor_data_batch':
+                continue
+            self.dashboard_frames += 1
+            for reading in frame['data']:
+                sent_at = self._sent_at.get(reading['value'])
+                if sent_at is not None:
+                    self.latencies.append((received_at - sent_at) * 1000)
+                    self.delivered.add(reading['value'])
+
+    async def guarded(self, transport, coroutine):
+        try:
+            await coroutine
+        except (OSError, websockets.WebSocketException, asyncio.TimeoutError):
+            self.errors[transport] += 1
+
+    async def run(self):
+        """Run the load and return the results as a dict"""
+        server_before = await asyncio.to_thread(fetch_server_stats, self.base_url)
+
+        ready = asyncio.Semaphore(0)
+        stop = asyncio.Event()
+        dashboards = [
+            asyncio.create_task(self.run_dashboard(ready, stop)) for _ in range(self.dashboards)
+        ]
+        for _ in range(self.dashboards):
+            await asyncio.wait_for(ready.acquire(), timeout=30)
+
+        started = time.perf_counter()
+        producers = []
+        for index, (device_id, sensor_ids) in enumerate(sorted(self.devices.items())):
+            transport = self.transports[index % len(self.transports)]
+            if transport == 'ws':
+                producers.append(self.guarded('ws', self.run_ws_device(sensor_ids, started)))
+            elif transport == 'sensor-ws':
+                producers.extend(self.guarded('sensor-ws', self.run_sensor_ws(sensor_id, started))
+                                 for sensor_id in sensor_ids)
+            else:
+                producers.append(self.guarded('rest', self.run_rest_device(sensor_ids, started)))
+        await asyncio.gather(*producers)
+        elapsed = time.perf_counter() - started
+
+        # Let in-flight readings reach the dashboards
+        await asyncio.sleep(self.drain)
+        stop.set()
+        await asyncio.gather(*dashboards, return_exceptions=True)
+
+        server_after = await asyncio.to_thread(fetch_server_stats, self.base_url)
+        sent = sum(self.sent.values())
+        results = {
+            'elapsed': elapsed,
+            'sent': sent,
+            'sent_by_transport': self.sent,
+            'errors': self.errors,
+            'send_rate': sent / elapsed if elapsed else 0.0,
+            'delivered': len(self.delivered),
+            'delivered_rate': len(self.delivered) / elapsed if elapsed else 0.0,
+            'dashboard_frames': self.dashboard_frames,
+            'latency_ms': percentiles(self.latencies),
+            'client_max_rss_bytes': max_rss_bytes(),
+            'server': None,
+        }
+        if server_before and server_after:
+            results['server'] = {
+                'queries': server_after['queries'] - server_before['queries'],
+                'rss_bytes': server_after['rss_bytes'],
+                'max_rss_bytes': server_after['max_rss_bytes'],
+            }
+        return results
+
+
+def format_results(results):
+    """Human-readable report lines for ``LoadTest.run()`` results"""
+    mb = 1024 * 1024
+    by_transport = ', '.join(f'{name} {count}' for name, count in results['sent_by_transport'].items())
+    lines = [
+        f"sent       {results['sent']} readings in {results['elapsed']:.1f} s "
+        f"({results['send_rate']:.0f}/s; {by_transport})",
+        f"delivered  {results['delivered']} readings to dashboards ({results['delivered_rate']:.0f}/s) "
+        f"in {results['dashboard_frames']} frames",
+    ]
+    errors = {name: count for name, count in results['errors'].items() if count}
+    if errors:
+        lines.append('errors     ' + ', '.join(f'{name} {count}' for name, count in errors.items()))
+    latency = results['latency_ms']
+    if latency:
+        lines.append(f"latency    p50 {latency['p50']:.1f} ms   p95 {latency['p95']:.1f} ms   "
+                     f"p99 {latency['p99']:.1f} ms   max {latency['max']:.1f} ms")
+    if 'stored' in results:
+        lines.append(f"stored     {results['stored']} readings")
+    server = results['server']
+    if server:
+        per_reading = server['queries'] / results['sent'] if results['sent'] else 0.0
+        lines.append(f"queries    {server['queries']} ({per_reading:.2f} per reading)")
+        lines.append(f"memory     server {server['rss_bytes'] / mb:.0f} MB (peak {server['max_rss_bytes'] / mb:.0f} MB), "
+                     f"client peak {results['client_max_rss_bytes'] / mb:.0f} MB")
+    else:
+        lines.append(f"memory     client peak {results['client_max_rss_bytes'] / mb:.0f} MB "
+                     f"(server stats need the loadtest command's server)")
+    return lines
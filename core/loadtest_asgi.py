@@ -0,0 +1,8 @@
+"""
+ASGI application served by ``manage.py loadtest``: the project application
+plus the load generator's query and memory stats endpoint
+"""
+from smartanom_backend.asgi import application as project_application
+from .loadtest import instrument
+
+application = instrument(project_application)
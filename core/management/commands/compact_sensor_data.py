@@ -0,0 +1,78 @@
+"""
+Management command to delete readings and rollups past their retention policy
+Usage: python manage.py compact_sensor_data [--dry-run] [--tier raw] [--batch-size 2000] [--pause 0.1]
+"""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core import partitioning, retention
+from core.models import SensorData, SensorDataRollup
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = 'Delete sensor readings and rollups older than their retention policy keeps them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be deleted without deleting')
+        parser.add_argument('--tier', action='append', dest='tiers', choices=list(retention.TIERS),
+                            help='Only compact this tier (repeatable; default all)')
+        parser.add_argument('--batch-size', type=int, default=settings.SENSOR_DATA_RETENTION['BATCH_SIZE'],
+                            help='Rows deleted per statement')
+        parser.add_argument('--pause', type=float, default=settings.SENSOR_DATA_RETENTION['BATCH_PAUSE'],
+                            help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        policies = retention.sensor_policies()
+        if not policies:
+            self.stdout.write(self.style.WARNING('No retention policies apply to any sensor; nothing to compact'))
+            return
+
+        now = timezone.now()
+        dry_run = options['dry_run']
+        for tier in options['tiers'] or retention.TIERS:
+            cutoffs = retention.tier_cutoffs(policies, tier, now)
+            if not cutoffs:
+                self.stdout.write(f'{tier}: kept forever')
+                continue
+            for cutoff, sensor_ids in cutoffs:
+                self.stdout.write(f'{tier}: before {cutoff:%Y-%m-%d} for {len(sensor_ids)} sensors')
+
+            row_bytes = retention.bytes_per_row(SensorData if tier == 'raw' else SensorDataRollup)
+            started = time.perf_counter()
+            dropped, dropped_bytes = 0, 0
+            if tier == 'raw':
+                dropped, dropped_bytes = self.drop_partitions(cutoffs, dry_run)
+            rows = retention.compact_tier(tier, cutoffs, options['batch_size'], options['pause'], dry_run,
+                                          partitions_dropped=bool(dropped) and not dry_run)
+            elapsed = time.perf_counter() - started
+
+            # A dry run counts the rows of expired partitions among the rows
+            reclaimed = (0 if dry_run else dropped_bytes) + (rows * row_bytes if row_bytes else 0)
+            size = f', ~{reclaimed / MB:.1f} MB' if reclaimed else ''
+            if dry_run:
+                self.stdout.write(f'{tier}: would delete {rows} rows{size}')
+            else:
+                rate = rows / elapsed if elapsed else 0.0
+                self.stdout.write(self.style.SUCCESS(
+                    f'{tier}: deleted {rows} rows in {elapsed:.1f} s ({rate:.0f} rows/s){size} reclaimed'
+                ))
+
+    def drop_partitions(self, cutoffs, dry_run):
+        """
+        Drop the monthly partitions every sensor's raw retention has passed;
+        return how many there were and their size in bytes
+        """
+        partitions = retention.expired_partitions(cutoffs)
+        dropped = 0
+        for name, start, end in partitions:
+            rows, size = partitioning.partition_stats(name)
+            if dry_run:
+                self.stdout.write(f'raw: would drop partition {name} (~{rows} rows, {size / MB:.1f} MB)')
+            else:
+                partitioning.drop_partition(name)
+                self.stdout.write(f'raw: dropped partition {name} (~{rows} rows, {size / MB:.1f} MB)')
+            dropped += size
+        return len(partitions), dropped
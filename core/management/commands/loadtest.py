@@ -0,0 +1,111 @@
+"""
+Management command to load-test the ingest paths against a local Daphne
+Usage: python manage.py loadtest [--devices 20] [--sensors 3] [--dashboards 5] [--rate 1] [--duration 30]
+"""
+import asyncio
+import os
+import secrets
+import subprocess
+import sys
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from core.loadtest import (
+    TRANSPORTS, LoadTest, fetch_server_stats, format_results, session_headers, websockets
+)
+from core.models import Device, Sensor, SensorData
+
+User = get_user_model()
+
+LOADTEST_EMAIL = 'loadtest@smartanom.local'
+
+
+class Command(BaseCommand):
+    help = ('Simulate devices pushing readings over WebSockets and REST while dashboards watch, '
+            'and report throughput, broadcast latency, query counts and memory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=20, help='Simulated devices')
+        parser.add_argument('--sensors', type=int, default=3, help='Sensors per device')
+        parser.add_argument('--dashboards', type=int, default=5, help='ws/sensor-data/ subscribers')
+        parser.add_argument('--rate', type=float, default=1.0, help='Readings per second per sensor')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds of load')
+        parser.add_argument('--transport', action='append', dest='transports', choices=TRANSPORTS,
+                            help='Ingest path to use (repeatable; default all)')
+        parser.add_argument('--port', type=int, default=8765, help='Port for the local Daphne')
+        parser.add_argument('--url', help='Load an already running server instead of starting Daphne '
+                                          '(it must use this database)')
+        parser.add_argument('--keep-data', action='store_true', help='Keep the load test user, devices and readings')
+
+    def handle(self, *args, **options):
+        if websockets is None:
+            raise CommandError('The load generator needs the websockets package (pip install websockets)')
+
+        password = secrets.token_urlsafe(16)
+        devices = self.create_devices(options['devices'], options['sensors'], password)
+        server = None
+        try:
+            base_url = options['url']
+            if not base_url:
+                base_url = f"http://127.0.0.1:{options['port']}"
+                server = self.start_server(options['port'], base_url)
+
+            rest_headers = session_headers(base_url, LOADTEST_EMAIL, password)
+            if rest_headers is None:
+                raise CommandError(f'Could not log in to {base_url}/api-auth/login/')
+
+            self.stdout.write(
+                f"{options['devices']} devices x {options['sensors']} sensors at {options['rate']}/s, "
+                f"{options['dashboards']} dashboards, {options['duration']:.0f} s against {base_url}"
+            )
+            load = LoadTest(
+                base_url, devices,
+                transports=tuple(options['transports'] or TRANSPORTS),
+                rate=options['rate'],
+                duration=options['duration'],
+                dashboards=options['dashboards'],
+                rest_headers=rest_headers,
+            )
+            results = asyncio.run(load.run())
+            results['stored'] = SensorData.objects.filter(sensor__device__user__email=LOADTEST_EMAIL).count()
+            for line in format_results(results):
+                self.stdout.write(line)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+            if not options['keep_data']:
+                User.objects.filter(email=LOADTEST_EMAIL).delete()
+
+    def create_devices(self, devices, sensors, password):
+        """Create a fresh load test user with its devices and sensors; return ``{device_id: [sensor_id]}``"""
+        User.objects.filter(email=LOADTEST_EMAIL).delete()
+        user = User.objects.create_user(email=LOADTEST_EMAIL, password=password, name='Load Test')
+        device_list = Device.objects.bulk_create([
+            Device(user=user, user_email=user.email, device_name=f'Load Test Device {n + 1}', status='active')
+            for n in range(devices)
+        ])
+        sensor_list = Sensor.objects.bulk_create([
+            Sensor(device=device, sensor_type='temperature', unit='celsius')
+            for device in device_list for _ in range(sensors)
+        ])
+        layout = {device.device_id: [] for device in device_list}
+        for sensor in sensor_list:
+            layout[sensor.device_id].append(sensor.sensor_id)
+        return layout
+
+    def start_server(self, port, base_url):
+        """Start Daphne on ``core.loadtest_asgi`` and wait until it answers"""
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), '-v', '0',
+             'core.loadtest_asgi:application'],
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get(
+                'DJANGO_SETTINGS_MODULE', 'smartanom_backend.settings')},
+        )
+        deadline = time.monotonic() + 30
+        while fetch_server_stats(base_url) is None:
+            if server.poll() is not None or time.monotonic() > deadline:
+                server.terminate()
+                raise CommandError(f'Daphne did not start on port {port}')
+            time.sleep(0.2)
+        return server
@@ -0,0 +1,44 @@
+"""
+Management command to manage monthly partitions of the sensor readings table
+Usage: python manage.py partition_sensor_data [--convert] [--months 3]
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core import partitioning
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly partitions of the sensor readings table (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Convert the readings table to a partitioned table first (one-time)'
+        )
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=3,
+            help='Number of months after the current one to create partitions for'
+        )
+
+    def handle(self, *args, **options):
+        if not partitioning.supports_partitioning():
+            raise CommandError('Sensor data partitioning requires PostgreSQL')
+
+        if not partitioning.is_partitioned():
+            if not options['convert']:
+                raise CommandError('The readings table is not partitioned yet; run with --convert')
+            self.stdout.write('Converting the readings table to a partitioned table...')
+            partitioning.convert_to_partitioned()
+            self.stdout.write(self.style.SUCCESS('Readings table converted'))
+
+        start = partitioning.month_start(timezone.now())
+        for offset in range(options['months'] + 1):
+            month = partitioning.add_months(start, offset)
+            name = partitioning.partition_name(month)
+            if partitioning.create_partition(month):
+                self.stdout.write(self.style.SUCCESS(f'Created partition {name}'))
+            else:
+                self.stdout.write(f'Skipped {name} (exists or rows already in the default partition)')
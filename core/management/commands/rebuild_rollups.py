@@ -0,0 +1,82 @@
+"""
+Management command to rebuild sensor data rollups from raw readings
+Usage: python manage.py rebuild_rollups [--since 2025-09-01] [--until 2025-09-30] [--sensor 1]
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from core.models import SensorData, SensorDataRollup
+from core.rollups import RESOLUTIONS, aggregate_readings, bucket_start, upsert_rollups
+from core.utils import parse_moment
+
+DAY = timedelta(seconds=RESOLUTIONS['1d'])
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the 1m/1h/1d sensor data rollups from raw readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Start date/datetime (defaults to the oldest reading)')
+        parser.add_argument('--until', help='End date/datetime (defaults to now)')
+        parser.add_argument('--sensor', type=int, action='append', dest='sensors',
+                            help='Only rebuild this sensor (repeatable)')
+        parser.add_argument('--flush-every', type=int, default=100000,
+                            help='Readings folded in memory before merging into the table')
+
+    def handle(self, *args, **options):
+        readings = SensorData.objects.order_by()
+        rollups = SensorDataRollup.objects.all()
+        if options['sensors']:
+            readings = readings.filter(sensor_id__in=options['sensors'])
+            rollups = rollups.filter(sensor_id__in=options['sensors'])
+
+        since = self.parse_option(options, 'since')
+        until = self.parse_option(options, 'until') or timezone.now()
+        if since is None:
+            oldest = readings.order_by('created_at').values_list('created_at', flat=True).first()
+            if oldest is None:
+                self.stdout.write(self.style.WARNING('No sensor readings to roll up'))
+                return
+            since = oldest
+
+        # Work in whole days so no rebuilt bucket is left half-filled
+        day = bucket_start(since, RESOLUTIONS['1d'])
+        total = 0
+        while day < until:
+            next_day = day + DAY
+            # Days whose raw readings compact_sensor_data deleted only live on in their rollups
+            day_rollups = rollups.exclude(sensor__compacted_until__gt=day)
+            day_readings = readings.exclude(sensor__compacted_until__gt=day)
+            with transaction.atomic():
+                day_rollups.filter(bucket__gte=day, bucket__lt=next_day).delete()
+                total += self.rebuild_range(day_readings, day, next_day, options['flush_every'])
+            day = next_day
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups from {total} readings'))
+
+    def parse_option(self, options, name):
+        if not options[name]:
+            return None
+        moment = parse_moment(options[name])
+        if moment is None:
+            raise CommandError(f'Invalid date or datetime for --{name}: {options[name]}')
+        return moment
+
+    def rebuild_range(self, readings, start, end, flush_every):
+        rows = readings.filter(created_at__gte=start, created_at__lt=end).values_list(
+            'sensor_id', 'created_at', 'value'
+        ).iterator(chunk_size=10000)
+
+        count = 0
+        pending = []
+        for row in rows:
+            pending.append(row)
+            if len(pending) >= flush_every:
+                upsert_rollups(aggregate_readings(pending))
+                count += len(pending)
+                pending = []
+        if pending:
+            upsert_rollups(aggregate_readings(pending))
+            count += len(pending)
+        return count
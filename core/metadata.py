@@ -0,0 +1,133 @@
+"""
+In-process cache of sensor metadata for the ingest and broadcast paths
+"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from .models import Sensor
+
+METADATA_FIELDS = ('sensor_id', 'sensor_type', 'unit', 'device_id', 'device__device_name')
+
+
+class SensorMetadataCache:
+    """
+    LRU cache of ``sensor_id -> {sensor_id, sensor_type, unit, device_id,
+    device_name}``.
+
+    Misses are loaded from the database in one query per call. Entries are
+    dropped by the ``Sensor``/``Device`` save and delete signals in
+    ``core.signals`` and expire ``ttl`` seconds after they were loaded; the
+    cache is per process, so other workers only see a change once their own
+    copy is invalidated or expires. Rows loaded while an invalidation ran
+    are returned but not cached.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        config = settings.SENSOR_METADATA_CACHE
+        self.max_size = max_size or config['MAX_SIZE']
+        self.ttl = ttl or config['TTL']
+        # sensor_id -> (entry, expires at)
+        self._entries = OrderedDict()
+        self._device_sensors = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, sensor_id):
+        """Return metadata for one sensor, or None if it does not exist"""
+        return self.get_many([sensor_id]).get(sensor_id)
+
+    def get_many(self, sensor_ids):
+        """Return a dict of metadata for the given sensor ids that exist"""
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for sensor_id in sensor_ids:
+                cached = self._entries.get(sensor_id)
+                if cached is None or cached[1] <= now:
+                    missing.append(sensor_id)
+                else:
+                    self._entries.move_to_end(sensor_id)
+                    found[sensor_id] = cached[0]
+            self.hits += len(found)
+            self.misses += len(missing)
+            generation = self._generation
+
+        if missing:
+            loaded = []
+            for row in Sensor.objects.filter(sensor_id__in=missing).values(*METADATA_FIELDS):
+                entry = {
+                    'sensor_id': row['sensor_id'],
+                    'sensor_type': row['sensor_type'],
+                    'unit': row['unit'],
+                    'device_id': row['device_id'],
+                    'device_name': row['device__device_name'],
+                }
+                found[entry['sensor_id']] = entry
+                loaded.append(entry)
+            self._store(loaded, generation, now + self.ttl)
+        return found
+
+    def _store(self, entries, generation, expires_at):
+        with self._lock:
+            if generation != self._generation:
+                return
+            for entry in entries:
+                sensor_id = entry['sensor_id']
+                previous = self._entries.pop(sensor_id, None)
+                if previous is not None:
+                    self._forget_device_link(previous[0])
+                self._entries[sensor_id] = (entry, expires_at)
+                self._device_sensors.setdefault(entry['device_id'], set()).add(sensor_id)
+            while len(self._entries) > self.max_size:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._forget_device_link(evicted)
+                self.evictions += 1
+
+    def _forget_device_link(self, entry):
+        sensor_ids = self._device_sensors.get(entry['device_id'])
+        if sensor_ids is not None:
+            sensor_ids.discard(entry['sensor_id'])
+            if not sensor_ids:
+                del self._device_sensors[entry['device_id']]
+
+    def invalidate_sensor(self, sensor_id):
+        """Drop a single sensor's entry"""
+        with self._lock:
+            self._generation += 1
+            cached = self._entries.pop(sensor_id, None)
+            if cached is not None:
+                self._forget_device_link(cached[0])
+
+    def invalidate_device(self, device_id):
+        """Drop the entries of every cached sensor on a device"""
+        with self._lock:
+            self._generation += 1
+            for sensor_id in self._device_sensors.pop(device_id, ()):
+                self._entries.pop(sensor_id, None)
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._device_sensors.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+sensor_metadata = SensorMetadataCache()
@@ -0,0 +1,397 @@
+"""
+Request, query and WebSocket metrics in the Prometheus text format
+
+``MetricsMiddleware`` times every HTTP request per route and counts the
+database queries and serializer time spent in it, the latter as measured
+by ``SerializerTimingMixin`` and ``ValuesSerializer``; ``with_metrics()`` wraps
+the ASGI application to count WebSocket connections and messages per
+consumer class. ``GET /metrics`` renders the registry for staff users,
+bearer ``METRICS['TOKEN']`` and ``METRICS['ALLOWED_IPS']``. Every process
+keeps its own counters, so scrape each worker. ``METRICS['ENABLED']`` turns
+all of it off.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+def metrics_enabled():
+    return settings.METRICS['ENABLED']
+
+
+def metrics_allowed(request):
+    """Whether ``request`` may read the metrics: a staff user, the bearer token or an allowed address"""
+    config = settings.METRICS
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = config.get('TOKEN')
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+        return True
+    return request.META.get('REMOTE_ADDR') in config.get('ALLOWED_IPS', ())
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds (``le``), in seconds"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (the last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def count(self, labels=()):
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        bounds = self.buckets + (float('inf'),)
+        for labels, counts, total in sorted(values):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       _format_labels(self.labelnames + ('le',), labels + (_format_value(bound),)),
+                       cumulative)
+            label_text = _format_labels(self.labelnames, labels)
+            yield f'{self.name}_sum', label_text, total
+            yield f'{self.name}_count', label_text, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=()):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+    def render(self):
+        """The registry in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    'smartanom_http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status'))
+http_request_duration = registry.histogram(
+    'smartanom_http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route'),
+    buckets=settings.METRICS['BUCKETS'])
+http_db_queries = registry.counter(
+    'smartanom_http_db_queries_total', 'Database queries run by HTTP requests', ('method', 'route'))
+http_db_seconds = registry.counter(
+    'smartanom_http_db_query_seconds_total', 'Time spent in database queries by HTTP requests',
+    ('method', 'route'))
+http_serializer_seconds = registry.counter(
+    'smartanom_http_serializer_seconds_total', 'Time spent building serializer data by HTTP requests',
+    ('method', 'route'))
+websocket_connections = registry.counter(
+    'smartanom_websocket_connections_total', 'Accepted WebSocket connections', ('consumer',))
+websocket_open = registry.gauge(
+    'smartanom_websocket_open_connections', 'Open WebSocket connections', ('consumer',))
+websocket_messages = registry.counter(
+    'smartanom_websocket_messages_total', 'WebSocket messages by consumer and direction',
+    ('consumer', 'direction'))
+
+
+class RequestStats:
+    """Database and serializer time of the request being handled"""
+    __slots__ = ('queries', 'query_time', 'serializer_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+
+_current_request = ContextVar('smartanom_request_stats', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """Execute wrapper adding each query to the current request's stats, if any"""
+    stats = _current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.query_time += time.perf_counter() - started
+        stats.queries += 1
+
+
+def install_query_counter(sender, connection, **kwargs):
+    # Installed once per connection rather than per request: pushing a
+    # wrapper with connection.execute_wrapper() costs more than the rest of
+    # the middleware together
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def route_name(request):
+    """A bounded label for the view that handled ``request``"""
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    """
+    Record latency, status, query count and time, and serializer time of
+    each request against its route.
+    """
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        elapsed = time.perf_counter() - started
+
+        labels = (request.method, route_name(request))
+        http_requests.inc(labels + (response.status_code,))
+        http_request_duration.observe(labels, elapsed)
+        http_db_queries.inc(labels, stats.queries)
+        http_db_seconds.inc(labels, stats.query_time)
+        http_serializer_seconds.inc(labels, stats.serializer_time)
+        return response
+
+
+@contextmanager
+def serializer_timing():
+    """
+    Count the block towards the current request's serializer time. Lazy
+    querysets are evaluated while building data, so their queries count as
+    serializer time too.
+    """
+    stats = _current_request.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += time.perf_counter() - started
+        stats.serializing = False
+
+
+def timed_data(data):
+    """A copy of the ``data`` property ``data`` that runs under ``serializer_timing()``"""
+    def get_data(self):
+        with serializer_timing():
+            return data.fget(self)
+
+    return property(get_data, doc=data.__doc__)
+
+
+_timed_classes = {}
+
+
+def timed_serializer_class(serializer_class):
+    """
+    A subclass of ``serializer_class`` whose ``data`` is timed, as is that
+    of the list serializer it builds for ``many=True``
+    """
+    timed = _timed_classes.get(serializer_class)
+    if timed is None:
+        from rest_framework.serializers import ListSerializer
+
+        attrs = {'__module__': serializer_class.__module__, '__doc__': serializer_class.__doc__,
+                 'data': timed_data(serializer_class.data)}
+        if not issubclass(serializer_class, ListSerializer):
+            meta = getattr(serializer_class, 'Meta', None)
+            list_serializer_class = getattr(meta, 'list_serializer_class', ListSerializer)
+            attrs['Meta'] = type('Meta', (meta,) if meta else (), {
+                'list_serializer_class': timed_serializer_class(list_serializer_class),
+            })
+        timed = _timed_classes[serializer_class] = type(serializer_class.__name__, (serializer_class,), attrs)
+    return timed
+
+
+class SerializerTimingMixin:
+    """
+    Count the ``data`` of the serializers a viewset builds through
+    ``get_serializer()`` towards the request's serializer time. List it
+    after mixins that build their own serializers in ``get_serializer()``.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        if metrics_enabled():
+            serializer_class = timed_serializer_class(serializer_class)
+        kwargs.setdefault('context', self.get_serializer_context())
+        return serializer_class(*args, **kwargs)
+
+
+def install():
+    """Count queries on every database connection, unless metrics are off"""
+    if not metrics_enabled():
+        return
+    connection_created.connect(install_query_counter, dispatch_uid='smartanom_metrics')
+    for connection in connections.all(initialized_only=True):
+        install_query_counter(None, connection)
+
+
+def consumer_name(path, urlpatterns):
+    """Class name of the consumer ``path`` routes to, the way ``URLRouter`` matches it"""
+    path = path.lstrip('/')
+    for route in urlpatterns:
+        if route.pattern.match(path):
+            consumer_class = getattr(route.callback, 'consumer_class', None)
+            return consumer_class.__name__ if consumer_class else route.callback.__name__
+    return 'unmatched'
+
+
+class WebSocketMetricsMiddleware:
+    """Count WebSocket connections and messages in each direction per consumer class"""
+
+    def __init__(self, application, urlpatterns):
+        self.application = application
+        self.urlpatterns = urlpatterns
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket':
+            return await self.application(scope, receive, send)
+
+        consumer = consumer_name(scope['path'], self.urlpatterns)
+        received = (consumer, 'received')
+        sent = (consumer, 'sent')
+        accepted = False
+
+        async def counting_receive():
+            message = await receive()
+            if message['type'] == 'websocket.receive':
+                websocket_messages.inc(received)
+            return message
+
+        async def counting_send(message):
+            nonlocal accepted
+            if message['type'] == 'websocket.send':
+                websocket_messages.inc(sent)
+            elif message['type'] == 'websocket.accept' and not accepted:
+                accepted = True
+                websocket_connections.inc((consumer,))
+                websocket_open.inc((consumer,))
+            await send(message)
+
+        try:
+            return await self.application(scope, counting_receive, counting_send)
+        finally:
+            if accepted:
+                websocket_open.dec((consumer,))
+
+
+def with_metrics(application, urlpatterns):
+    """Wrap the project's ASGI application, unless metrics are off"""
+    if not metrics_enabled():
+        return application
+    return WebSocketMetricsMiddleware(application, urlpatterns)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+            ],
+        ),
+        migrations.AddField(
+            model_name='sensordata',
+            name='measured_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:14
+
+from django.db import migrations, models
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    ``AddIndex`` built with ``CREATE INDEX CONCURRENTLY`` on PostgreSQL, so
+    writes to the readings table carry on during the build. Other databases
+    build it as usual.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.add_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.add_index(model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.remove_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, self.index)
+
+
+class Migration(migrations.Migration):
+
+    # CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0002_sensordata_measured_at'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='sensordata',
+            name='updated_at',
+        ),
+        AddIndexConcurrently(
+            model_name='sensordata',
+            index=models.Index(fields=['sensor', '-created_at', '-data_id'], name='sensordata_sensor_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='sensordata',
+            index=models.Index(fields=['-created_at', '-data_id'], name='sensordata_created_idx'),
+        ),
+    ]
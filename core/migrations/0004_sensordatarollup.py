@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_sensordata_timeseries_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorDataRollup',
+            fields=[
+                ('rollup_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('resolution', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('bucket', models.DateTimeField()),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('avg_value', models.FloatField()),
+                ('count', models.PositiveIntegerField()),
+                ('last_value', models.FloatField()),
+                ('last_at', models.DateTimeField()),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='core.sensor')),
+            ],
+            options={
+                'verbose_name': 'Sensor Data Rollup',
+                'verbose_name_plural': 'Sensor Data Rollups',
+                'ordering': ['-bucket'],
+                'constraints': [models.UniqueConstraint(fields=('sensor', 'resolution', 'bucket'), name='sensordatarollup_unique_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 16:21
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_sensordatarollup'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='sensordata',
+            options={'ordering': ['-created_at', '-data_id'], 'verbose_name': 'Sensor Data', 'verbose_name_plural': 'Sensor Data'},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_sensordata_keyset_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
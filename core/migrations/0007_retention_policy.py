@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_device_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensor',
+            name='compacted_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='RetentionPolicy',
+            fields=[
+                ('policy_id', models.AutoField(primary_key=True, serialize=False)),
+                ('sensor_type', models.CharField(blank=True, choices=[('temperature', 'Temperature'), ('humidity', 'Humidity'), ('ph', 'pH Level'), ('ec', 'Electrical Conductivity'), ('water_level', 'Water Level'), ('light', 'Light Intensity')], max_length=50)),
+                ('raw_days', models.PositiveIntegerField(blank=True, null=True)),
+                ('rollup_1m_days', models.PositiveIntegerField(blank=True, null=True)),
+                ('rollup_1h_days', models.PositiveIntegerField(blank=True, null=True)),
+                ('rollup_1d_days', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='retention_policies', to='core.device')),
+            ],
+            options={
+                'verbose_name': 'Retention Policy',
+                'verbose_name_plural': 'Retention Policies',
+                'constraints': [models.UniqueConstraint(fields=('device', 'sensor_type'), name='retentionpolicy_unique_device_type'), models.UniqueConstraint(condition=models.Q(('device__isnull', True)), fields=('sensor_type',), name='retentionpolicy_unique_type')],
+            },
+        ),
+    ]
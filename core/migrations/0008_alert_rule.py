@@ -0,0 +1,66 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_retention_policy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('rule_id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('sensor_type', models.CharField(blank=True, choices=[('temperature', 'Temperature'), ('humidity', 'Humidity'), ('ph', 'pH Level'), ('ec', 'Electrical Conductivity'), ('water_level', 'Water Level'), ('light', 'Light Intensity')], max_length=50)),
+                ('min_value', models.FloatField(blank=True, null=True)),
+                ('max_value', models.FloatField(blank=True, null=True)),
+                ('hysteresis', models.FloatField(default=0.0)),
+                ('min_duration', models.PositiveIntegerField(default=0, help_text='Seconds a breach must last before firing')),
+                ('enabled', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='core.device')),
+                ('sensor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='core.sensor')),
+            ],
+            options={
+                'verbose_name': 'Alert Rule',
+                'verbose_name_plural': 'Alert Rules',
+            },
+        ),
+        migrations.CreateModel(
+            name='Alert',
+            fields=[
+                ('alert_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('value', models.FloatField(help_text='The reading that fired the alert')),
+                ('started_at', models.DateTimeField(help_text='When the breach began')),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='core.sensor')),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='core.alertrule')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='alertrule',
+            constraint=models.CheckConstraint(condition=models.Q(('min_value__isnull', False), ('max_value__isnull', False), _connector='OR'), name='alertrule_has_bound'),
+        ),
+        migrations.AddConstraint(
+            model_name='alertrule',
+            constraint=models.CheckConstraint(condition=models.Q(('hysteresis__gte', 0)), name='alertrule_hysteresis_gte_0'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['sensor', '-started_at'], name='alert_sensor_started_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='alert',
+            constraint=models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('rule', 'sensor'), name='alert_one_open_per_rule_sensor'),
+        ),
+    ]
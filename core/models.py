@@ -50,6 +50,7 @@ class Device(models.Model):
     user_email = models.EmailField()
     device_name = models.CharField(max_length=255)
     status = models.CharField(max_length=20, choices=DEVICE_STATUS_CHOICES, default='inactive')
+    last_seen = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -120,6 +121,9 @@ class Sensor(models.Model):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='sensors')
     sensor_type = models.CharField(max_length=50, choices=SENSOR_TYPE_CHOICES)
     unit = models.CharField(max_length=20, choices=UNIT_CHOICES)
+    # Raw readings before this moment were deleted by compact_sensor_data;
+    # only their rollups are left
+    compacted_until = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -128,17 +132,160 @@ class Sensor(models.Model):
 
 
 class SensorData(models.Model):
-    """Sensor data readings model"""
+    """Sensor data readings model
+
+    Readings are immutable, so there is no ``updated_at`` column. On
+    PostgreSQL the table can be range-partitioned on ``created_at`` with the
+    ``partition_sensor_data`` management command.
+    """
     data_id = models.AutoField(primary_key=True)
     sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='readings')
     value = models.FloatField()
+    measured_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-data_id']
+        indexes = [
+            models.Index(fields=['sensor', '-created_at', '-data_id'], name='sensordata_sensor_created_idx'),
+            models.Index(fields=['-created_at', '-data_id'], name='sensordata_created_idx'),
+        ]
         verbose_name = "Sensor Data"
         verbose_name_plural = "Sensor Data"
 
     def __str__(self):
         return f"{self.sensor.sensor_type}: {self.value} {self.sensor.unit} at {self.created_at}"
+
+
+class SensorDataRollup(models.Model):
+    """Pre-aggregated sensor readings per sensor and time bucket
+
+    Maintained incrementally by the ingest paths (see ``core.rollups``) and
+    rebuilt from raw readings with the ``rebuild_rollups`` command.
+    """
+    RESOLUTION_CHOICES = [
+        ('1m', '1 minute'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+
+    rollup_id = models.BigAutoField(primary_key=True)
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='rollups')
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    avg_value = models.FloatField()
+    count = models.PositiveIntegerField()
+    last_value = models.FloatField()
+    last_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'resolution', 'bucket'],
+                                    name='sensordatarollup_unique_bucket'),
+        ]
+        verbose_name = "Sensor Data Rollup"
+        verbose_name_plural = "Sensor Data Rollups"
+
+    def __str__(self):
+        return f"{self.sensor.sensor_type} {self.resolution} rollup at {self.bucket}"
+
+
+class RetentionPolicy(models.Model):
+    """How many days of raw readings and of each rollup resolution to keep
+
+    A policy applies to the sensors of its device and/or sensor type; one
+    with neither applies to every sensor. The most specific match wins:
+    device and type, then device, then type, then the catch-all. An empty
+    number of days keeps that tier forever. Applied by the
+    ``compact_sensor_data`` management command.
+    """
+    policy_id = models.AutoField(primary_key=True)
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='retention_policies')
+    sensor_type = models.CharField(max_length=50, choices=Sensor.SENSOR_TYPE_CHOICES, blank=True)
+    raw_days = models.PositiveIntegerField(null=True, blank=True)
+    rollup_1m_days = models.PositiveIntegerField(null=True, blank=True)
+    rollup_1h_days = models.PositiveIntegerField(null=True, blank=True)
+    rollup_1d_days = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'sensor_type'], name='retentionpolicy_unique_device_type'),
+            models.UniqueConstraint(fields=['sensor_type'], condition=models.Q(device__isnull=True),
+                                    name='retentionpolicy_unique_type'),
+        ]
+        verbose_name = "Retention Policy"
+        verbose_name_plural = "Retention Policies"
+
+    def __str__(self):
+        scope = ' '.join(filter(None, [
+            self.device.device_name if self.device_id else '', self.sensor_type
+        ])) or 'all sensors'
+        return f"Retention for {scope}: raw {self.raw_days or 'forever'} days"
+
+
+class AlertRule(models.Model):
+    """Safe bounds for sensor readings, evaluated as readings are ingested
+
+    A rule applies to the sensors matching every scope field it sets (a
+    sensor, a device, a sensor type); one with none applies to every
+    sensor. A reading below ``min_value`` or above ``max_value`` breaches
+    it; once breaches have lasted ``min_duration`` seconds an ``Alert``
+    fires, and it resolves when a reading is back inside the bounds by at
+    least ``hysteresis``. Evaluated by ``core.alerts``.
+    """
+    rule_id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=100)
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='alert_rules')
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, null=True, blank=True,
+                               related_name='alert_rules')
+    sensor_type = models.CharField(max_length=50, choices=Sensor.SENSOR_TYPE_CHOICES, blank=True)
+    min_value = models.FloatField(null=True, blank=True)
+    max_value = models.FloatField(null=True, blank=True)
+    hysteresis = models.FloatField(default=0.0)
+    min_duration = models.PositiveIntegerField(default=0, help_text='Seconds a breach must last before firing')
+    enabled = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=models.Q(min_value__isnull=False) | models.Q(max_value__isnull=False),
+                                   name='alertrule_has_bound'),
+            models.CheckConstraint(condition=models.Q(hysteresis__gte=0), name='alertrule_hysteresis_gte_0'),
+        ]
+        verbose_name = "Alert Rule"
+        verbose_name_plural = "Alert Rules"
+
+    def __str__(self):
+        return self.name
+
+
+class Alert(models.Model):
+    """A breach of an ``AlertRule`` by one sensor; open until ``resolved_at`` is set"""
+    alert_id = models.BigAutoField(primary_key=True)
+    rule = models.ForeignKey(AlertRule, on_delete=models.CASCADE, related_name='alerts')
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='alerts')
+    value = models.FloatField(help_text='The reading that fired the alert')
+    started_at = models.DateTimeField(help_text='When the breach began')
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['sensor', '-started_at'], name='alert_sensor_started_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['rule', 'sensor'], condition=models.Q(resolved_at__isnull=True),
+                                    name='alert_one_open_per_rule_sensor'),
+        ]
+
+    def __str__(self):
+        return f"{self.rule.name} on {self.sensor}: {self.value} at {self.started_at}"
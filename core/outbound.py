@@ -0,0 +1,208 @@
+"""
+Bounded per-connection outbound queues for the WebSocket consumers
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('oldest', 'conflate', 'disconnect')
+
+
+def merge_reading_frames(queued, frame, stream_sensor_id=None):
+    """
+    Merge two reading batch frames, keeping only the newest reading per
+    sensor. Readings without a ``sensor_id`` (those of a sensor stream)
+    belong to ``stream_sensor_id``.
+    """
+    latest = {}
+    for reading in queued['data'] + frame['data']:
+        sensor_id = reading.get('sensor_id', stream_sensor_id)
+        latest.pop(sensor_id, None)
+        latest[sensor_id] = reading
+    return {**frame, 'data': list(latest.values())}
+
+
+class SendQueue:
+    """
+    Outbound frames of one WebSocket connection, written by a single task.
+
+    Handlers ``put`` frames without waiting for the client. When
+    ``max_size`` frames are already queued the ``policy`` applies: ``oldest``
+    drops the oldest frame, ``disconnect`` closes the connection, and
+    ``conflate`` first merges a frame into a queued one with the same key
+    (dropping the oldest if there is none). Frames put with
+    ``droppable=False`` (alerts) are never dropped: the oldest droppable
+    frame goes instead, and a queue full of them closes the connection.
+    Lag is the age of the oldest
+    unsent frame; a client that stays over ``lag_budget`` for ``lag_grace``
+    seconds is closed with ``close_code``.
+    """
+
+    def __init__(self, send, close, max_size=None, policy=None, lag_budget=None, lag_grace=None,
+                 close_code=None):
+        config = settings.WEBSOCKET_SEND_QUEUE
+        self.send = send
+        self.close = close
+        self.max_size = max_size or config['MAX_SIZE']
+        self.policy = policy or config['POLICY']
+        self.lag_budget = lag_budget or config['LAG_BUDGET']
+        self.lag_grace = lag_grace if lag_grace is not None else config['LAG_GRACE']
+        self.close_code = close_code or config['CLOSE_CODE']
+        if self.policy not in POLICIES:
+            raise ValueError(f'Unknown send queue policy: {self.policy}')
+
+        self._entries = deque()
+        self._keyed = {}
+        self._ready = asyncio.Event()
+        self._writer = None
+        self._closing = False
+        self._over_budget_since = None
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.max_depth = 0
+        self.max_lag = 0.0
+
+    async def put(self, frame, key=None, merge=None, droppable=True):
+        """
+        Queue ``frame``; ``key``/``merge`` let the conflate policy fold it
+        into a queued frame, and ``droppable=False`` keeps it from being
+        dropped when the queue is full
+        """
+        if self._closing:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        full = len(self._entries) >= self.max_size
+        if full and self.policy == 'conflate' and key is not None and key in self._keyed:
+            entry = self._keyed[key]
+            entry[1] = merge(entry[1], frame) if merge else frame
+            self.conflated += 1
+        else:
+            if full:
+                if self.policy == 'disconnect':
+                    await self.close_slow_consumer('send queue full')
+                    return
+                if not self._drop_oldest():
+                    if not droppable:
+                        await self.close_slow_consumer('send queue full of undroppable frames')
+                        return
+                    self.dropped += 1
+                    return
+            entry = [key, frame, now, droppable]
+            self._entries.append(entry)
+            if key is not None:
+                self._keyed[key] = entry
+            self.max_depth = max(self.max_depth, len(self._entries))
+
+        if self._writer is None:
+            self._writer = loop.create_task(self._run())
+        self._ready.set()
+        await self._check_lag(now)
+
+    def _drop_oldest(self):
+        """Drop the oldest droppable frame; return False if every queued frame is undroppable"""
+        for index, entry in enumerate(self._entries):
+            if entry[3]:
+                break
+        else:
+            return False
+        del self._entries[index]
+        key = entry[0]
+        if key is not None and self._keyed.get(key) is entry:
+            del self._keyed[key]
+        self.dropped += 1
+        return True
+
+    @property
+    def depth(self):
+        return len(self._entries)
+
+    def lag(self, now=None):
+        """Age in seconds of the oldest unsent frame"""
+        if not self._entries:
+            return 0.0
+        now = now if now is not None else asyncio.get_running_loop().time()
+        return now - self._entries[0][2]
+
+    async def _check_lag(self, now):
+        lag = self.lag(now)
+        self.max_lag = max(self.max_lag, lag)
+        if lag <= self.lag_budget:
+            self._over_budget_since = None
+        elif self._over_budget_since is None:
+            self._over_budget_since = now
+        elif now - self._over_budget_since >= self.lag_grace:
+            await self.close_slow_consumer(f'lag {lag:.1f}s over budget')
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._closing:
+            if not self._entries:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            await self._check_lag(loop.time())
+            if self._closing:
+                return
+            key, frame, _, _ = entry = self._entries.popleft()
+            if key is not None and self._keyed.get(key) is entry:
+                del self._keyed[key]
+            await self.send(text_data=json.dumps(frame))
+            self.sent += 1
+
+    async def close_slow_consumer(self, reason):
+        if self._closing:
+            return
+        self._closing = True
+        logger.warning('Closing slow WebSocket consumer (%s): %s', reason, self.stats())
+        self._entries.clear()
+        self._keyed.clear()
+        self._ready.set()
+        await self.close(code=self.close_code)
+
+    def stop(self):
+        """Stop the writer task and discard anything unsent"""
+        self._closing = True
+        self._entries.clear()
+        self._keyed.clear()
+        if self._writer is not None:
+            self._writer.cancel()
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'lag': round(self.lag(), 3) if self._entries else 0.0,
+            'max_lag': round(self.max_lag, 3),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'conflated': self.conflated,
+        }
+
+
+class QueuedSendMixin:
+    """
+    Give a consumer a ``SendQueue`` for broadcast frames. Handlers call
+    ``send_queued()`` instead of awaiting ``send()``; replies to the
+    client's own frames (acks, pongs, errors) are still sent directly.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.send_queue = None
+
+    async def send_queued(self, frame, key=None, merge=None, droppable=True):
+        if self.send_queue is None:
+            self.send_queue = SendQueue(self.send, self.close)
+        await self.send_queue.put(frame, key, merge, droppable)
+
+    async def websocket_disconnect(self, message):
+        if self.send_queue is not None:
+            self.send_queue.stop()
+        await super().websocket_disconnect(message)
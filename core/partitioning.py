@@ -0,0 +1,177 @@
+"""
+Monthly range partitioning of the sensor readings table on PostgreSQL
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.db import connection, transaction
+from .models import SensorData
+
+TABLE = SensorData._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def supports_partitioning():
+    """Partitioning is only available on PostgreSQL"""
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned():
+    """Return True if the readings table has already been converted"""
+    if not supports_partitioning():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def month_start(moment):
+    """Return midnight UTC on the first day of ``moment``'s month"""
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(moment, months):
+    month_index = moment.month - 1 + months
+    return moment.replace(year=moment.year + month_index // 12, month=month_index % 12 + 1)
+
+
+def partition_name(start):
+    return f'{TABLE}_p{start:%Y_%m}'
+
+
+def list_partitions():
+    """
+    Return ``(name, start, end)`` for each monthly partition, oldest first.
+    The default partition holding pre-conversion rows is not included.
+    """
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s)",
+            [TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    prefix = f'{TABLE}_p'
+    for name in names:
+        if not name.startswith(prefix):
+            continue
+        start = datetime.strptime(name[len(prefix):], '%Y_%m').replace(tzinfo=dt_timezone.utc)
+        partitions.append((name, start, add_months(start, 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def convert_to_partitioned():
+    """
+    Turn the readings table into a table partitioned by ``created_at``.
+
+    The existing table is kept, unchanged, as the DEFAULT partition, so no
+    rows are copied. The unique index the new ``(data_id, created_at)``
+    primary key needs is built concurrently first, which keeps the exclusive
+    lock short.
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {quote(DEFAULT_PARTITION + '_pkey')} "
+            f"ON {quote(TABLE)} (data_id, created_at)"
+        )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {quote(TABLE)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'f')",
+            [TABLE]
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(f"SELECT COALESCE(MAX(data_id), 0) + 1 FROM {quote(TABLE)}")
+        next_id = cursor.fetchone()[0]
+
+        cursor.execute(f"ALTER TABLE {quote(TABLE)} RENAME TO {quote(DEFAULT_PARTITION)}")
+        for name, kind, definition in constraints:
+            if kind == 'p':
+                cursor.execute(f"ALTER TABLE {quote(DEFAULT_PARTITION)} DROP CONSTRAINT {quote(name)}")
+        # Meta.indexes names are schema-wide; the partition keeps its copies
+        # under a suffixed name and they are attached to the new parent indexes
+        for index in SensorData._meta.indexes:
+            cursor.execute(f"ALTER INDEX {quote(index.name)} RENAME TO {quote(index.name + '_default')}")
+        cursor.execute(f"ALTER TABLE {quote(DEFAULT_PARTITION)} ALTER COLUMN data_id DROP IDENTITY IF EXISTS")
+
+        cursor.execute(
+            f"CREATE TABLE {quote(TABLE)} (LIKE {quote(DEFAULT_PARTITION)} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE (created_at)"
+        )
+        cursor.execute(
+            f"ALTER TABLE {quote(TABLE)} ALTER COLUMN data_id "
+            f"ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {int(next_id)})"
+        )
+        cursor.execute(f"ALTER TABLE {quote(TABLE)} ADD PRIMARY KEY (data_id, created_at)")
+        # The partition's own foreign key matches these and is reused on
+        # attach, so existing rows are not revalidated
+        for name, kind, definition in constraints:
+            if kind == 'f':
+                cursor.execute(f"ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(name)} {definition}")
+
+        with connection.schema_editor(atomic=False) as schema_editor:
+            for index in SensorData._meta.indexes:
+                schema_editor.add_index(SensorData, index)
+
+        cursor.execute(f"ALTER TABLE {quote(TABLE)} ATTACH PARTITION {quote(DEFAULT_PARTITION)} DEFAULT")
+
+
+def create_partition(start):
+    """
+    Create the partition for the month beginning at ``start``.
+
+    Returns True if it was created, False if it already existed or if rows
+    for that month are already in the default partition (attaching the
+    range would then fail).
+    """
+    quote = connection.ops.quote_name
+    end = add_months(start, 1)
+    name = partition_name(start)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+        if cursor.fetchone()[0]:
+            return False
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {quote(DEFAULT_PARTITION)} "
+            f"WHERE created_at >= %s AND created_at < %s)",
+            [start, end]
+        )
+        if cursor.fetchone()[0]:
+            return False
+        cursor.execute(
+            f"CREATE TABLE {quote(name)} PARTITION OF {quote(TABLE)} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [start, end]
+        )
+    return True
+
+
+def drop_partition(name):
+    """
+    Detach and drop a monthly partition. Dropping a whole month takes an
+    exclusive lock only for as long as the catalog change, unlike deleting
+    its rows.
+    """
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}")
+        cursor.execute(f"DROP TABLE {quote(name)}")
+
+
+def partition_stats(name):
+    """Return ``(estimated rows, bytes including indexes)`` of a partition"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT GREATEST(reltuples, 0)::bigint, pg_total_relation_size(oid) FROM pg_class "
+            "WHERE oid = to_regclass(%s)",
+            [name]
+        )
+        row = cursor.fetchone()
+    return row if row is not None else (0, 0)
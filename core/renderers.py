@@ -0,0 +1,243 @@
+"""
+Response renderers for high-volume reading endpoints
+"""
+import abc
+import csv
+import io
+import math
+from itertools import islice
+from asgiref.sync import sync_to_async
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pyarrow = None
+
+
+class ReprFloat(float):
+    """
+    A float whose JSON form must come from ``repr()``.
+
+    orjson writes very large, very small and non-finite floats differently
+    from the stdlib encoder, so ``ValuesSerializer`` wraps those values in
+    this type and ``FastJSONRenderer`` formats them itself.
+    """
+
+
+class ValuesList(list):
+    """Rows built by ``ValuesSerializer``; only these are rendered with orjson"""
+
+
+def is_values_data(data):
+    if isinstance(data, dict):
+        data = data.get('results')
+    return isinstance(data, ValuesList)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that encodes ``ValuesSerializer`` output with orjson.
+
+    The bytes are identical to ``JSONRenderer``'s. Everything else, indented
+    output, and installs without orjson go through ``JSONRenderer``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or not is_values_data(data) or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return self.dumps(data)
+
+    def dumps(self, data):
+        """Encode ``data`` as compact JSON bytes, with orjson when possible"""
+        if orjson is not None:
+            try:
+                ret = orjson.dumps(data, default=self.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+            except orjson.JSONEncodeError:
+                pass
+            else:
+                return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        # The stdlib encoder produces the same output, or the same error
+        return super().render(data)
+
+    def default(self, obj):
+        if isinstance(obj, ReprFloat):
+            if not hasattr(orjson, 'Fragment') or (self.strict and not math.isfinite(obj)):
+                raise TypeError('Float needs the stdlib encoder')
+            text = float.__repr__(obj)
+            text = {'nan': 'NaN', 'inf': 'Infinity', '-inf': '-Infinity'}.get(text, text)
+            return orjson.Fragment(text.encode())
+        return self.encoder_class().default(obj)
+
+
+async def aiter_chunks(chunks):
+    """
+    Iterate the sync iterator ``chunks`` from the event loop, advancing it
+    one chunk at a time in the request's thread, so an ASGI server sends each
+    chunk as soon as it is encoded instead of collecting the whole body
+    """
+    chunks = iter(chunks)
+    advance = sync_to_async(next)
+    try:
+        while True:
+            chunk = await advance(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class StreamingRenderer(BaseRenderer, metaclass=abc.ABCMeta):
+    """
+    Renderer for exports that ``stream()`` rows into a
+    ``StreamingHttpResponse`` one batch at a time instead of rendering a
+    complete ``Response``.
+
+    ``render()`` still handles ordinary responses (errors, single objects)
+    negotiated to the same format.
+    """
+    charset = 'utf-8'
+    filename_extension = None
+
+    @abc.abstractmethod
+    def stream(self, rows, values_serializer_class, batch_size):
+        """Yield the encoded export of ``.values()`` ``rows``"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = data.get('results', [data])
+        if not isinstance(data, list):
+            data = [{'detail': data}]
+        return b''.join(self.encode_batches(batched(data, len(data) or 1)))
+
+    @abc.abstractmethod
+    def encode_batches(self, batches):
+        """Yield the encoded export of batches of serialized items"""
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    filename_extension = 'csv'
+
+    def stream(self, rows, values_serializer_class, batch_size):
+        items = values_serializer_class.iter_representation(rows)
+        return self.encode_batches(batched(items, batch_size))
+
+    def encode_batches(self, batches):
+        header = None
+        for batch in batches:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if header is None:
+                header = list(batch[0])
+                writer.writerow(header)
+            writer.writerows([item.get(key) for key in header] for item in batch)
+            yield buffer.getvalue().encode(self.charset)
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    filename_extension = 'ndjson'
+
+    def __init__(self):
+        self.json_renderer = FastJSONRenderer()
+
+    def stream(self, rows, values_serializer_class, batch_size):
+        items = values_serializer_class.iter_representation(rows)
+        return self.encode_batches(batched(items, batch_size))
+
+    def encode_batches(self, batches):
+        for batch in batches:
+            yield b''.join(self.json_renderer.dumps(item) + b'\n' for item in batch)
+
+
+class ArrowRenderer(StreamingRenderer):
+    """
+    Apache Arrow IPC stream, one record batch per database fetch. Columns
+    keep their native types (timestamps, floats, integers, strings) rather
+    than their JSON form. Only offered when pyarrow is installed.
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    filename_extension = 'arrow'
+    charset = None
+
+    def arrow_type(self, field):
+        if isinstance(field, serializers.DateTimeField):
+            return pyarrow.timestamp('us', tz='UTC')
+        if isinstance(field, serializers.FloatField):
+            return pyarrow.float64()
+        if isinstance(field, (serializers.IntegerField, serializers.PrimaryKeyRelatedField)):
+            return pyarrow.int64()
+        return pyarrow.string()
+
+    def stream(self, rows, values_serializer_class, batch_size):
+        plan = values_serializer_class.get_plan()
+        schema = pyarrow.schema([(name, self.arrow_type(field)) for name, _, field in plan])
+        sink = _ChunkSink()
+        writer = pyarrow.ipc.new_stream(sink, schema)
+        for batch in batched(rows, batch_size):
+            writer.write_batch(pyarrow.record_batch([
+                pyarrow.array([row[lookup] for row in batch], type=schema.field(name).type)
+                for name, lookup, _ in plan
+            ], schema=schema))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+    def encode_batches(self, batches):
+        batches = list(batches)
+        rows = [row for batch in batches for row in batch]
+        columns = list(rows[0]) if rows else []
+        table = pyarrow.table({column: [row.get(column) for row in rows] for column in columns})
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        yield sink.getvalue().to_pybytes()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last ``drain()``"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+EXPORT_RENDERER_CLASSES = [CSVRenderer, NDJSONRenderer] + ([ArrowRenderer] if pyarrow is not None else [])
@@ -0,0 +1,171 @@
+"""
+Retention policies for sensor readings and rollups, and the batched
+deletes that apply them (see the ``compact_sensor_data`` command)
+"""
+import time
+from datetime import timedelta
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from . import partitioning
+from .latest import latest_values
+from .models import RetentionPolicy, Sensor, SensorData, SensorDataRollup
+from .rollups import RESOLUTIONS, bucket_start
+
+# Tier -> the RetentionPolicy field holding how many days it is kept
+TIERS = {
+    'raw': 'raw_days',
+    '1m': 'rollup_1m_days',
+    '1h': 'rollup_1h_days',
+    '1d': 'rollup_1d_days',
+}
+
+# Sensor ids per query, well under SQLite's bound parameter limit
+SENSOR_CHUNK_SIZE = 500
+
+
+def chunked(items, size):
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+def day_cutoff(now, days):
+    """
+    Start of the UTC day ``days`` days before ``now``. Cutoffs fall on whole
+    days, so no rollup bucket and no day rebuilt by ``rebuild_rollups`` is
+    ever cut in half.
+    """
+    return bucket_start(now - timedelta(days=days), RESOLUTIONS['1d'])
+
+
+def sensor_policies():
+    """Return ``[(policy, [sensor_id])]`` pairing each policy with the sensors it governs"""
+    policies = {(policy.device_id, policy.sensor_type): policy for policy in RetentionPolicy.objects.all()}
+    if not policies:
+        return []
+    governed = {}
+    sensors = Sensor.objects.order_by('sensor_id').values_list('sensor_id', 'device_id', 'sensor_type')
+    for sensor_id, device_id, sensor_type in sensors.iterator(chunk_size=10000):
+        for key in ((device_id, sensor_type), (device_id, ''), (None, sensor_type), (None, '')):
+            policy = policies.get(key)
+            if policy is not None:
+                governed.setdefault(policy.pk, (policy, []))[1].append(sensor_id)
+                break
+    return list(governed.values())
+
+
+def tier_cutoffs(policies, tier, now):
+    """Return ``[(cutoff, [sensor_id])]``, oldest cutoff first, for the policies that limit ``tier``"""
+    field = TIERS[tier]
+    groups = {}
+    for policy, sensor_ids in policies:
+        days = getattr(policy, field)
+        if days is not None:
+            groups.setdefault(day_cutoff(now, days), []).extend(sensor_ids)
+    return sorted(groups.items())
+
+
+def expired_queryset(tier, cutoff, sensor_ids):
+    if tier == 'raw':
+        return SensorData.objects.filter(sensor_id__in=sensor_ids, created_at__lt=cutoff)
+    return SensorDataRollup.objects.filter(sensor_id__in=sensor_ids, resolution=tier, bucket__lt=cutoff)
+
+
+def delete_in_batches(queryset, batch_size, pause=0.0):
+    """
+    Delete the rows of ``queryset`` ``batch_size`` at a time, yielding the
+    number deleted by each batch. Every batch is a separate short
+    statement, so concurrent writers are never held up for long; ``pause``
+    seconds between batches leave the database room for them.
+    """
+    queryset = queryset.order_by()
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        deleted, _ = queryset.filter(pk__in=pks).delete()
+        yield deleted
+        if len(pks) < batch_size:
+            return
+        if pause:
+            time.sleep(pause)
+
+
+def compact_tier(tier, cutoffs, batch_size, pause=0.0, dry_run=False, partitions_dropped=False):
+    """
+    Delete the ``tier`` rows older than each group's cutoff and return how
+    many there were. With ``dry_run`` they are only counted. Raw readings
+    removed here or by ``partitions_dropped`` mark their sensors compacted.
+    """
+    total = 0
+    for cutoff, sensor_ids in cutoffs:
+        for chunk in chunked(sensor_ids, SENSOR_CHUNK_SIZE):
+            queryset = expired_queryset(tier, cutoff, chunk)
+            if dry_run:
+                total += queryset.count()
+                continue
+            deleted = sum(delete_in_batches(queryset, batch_size, pause))
+            if tier == 'raw' and (deleted or partitions_dropped):
+                mark_compacted(cutoff, chunk)
+            total += deleted
+    return total
+
+
+def mark_compacted(cutoff, sensor_ids):
+    """
+    Record that ``sensor_ids`` have no raw readings before ``cutoff``, so
+    ``rebuild_rollups`` keeps their rollups, and drop their latest readings
+    from the store in case those were deleted
+    """
+    Sensor.objects.filter(sensor_id__in=sensor_ids).filter(
+        Q(compacted_until__isnull=True) | Q(compacted_until__lt=cutoff)
+    ).update(compacted_until=cutoff)
+    latest_values.invalidate_sensors(sensor_ids)
+
+
+def expired_partitions(cutoffs):
+    """
+    Monthly partitions of the readings table lying wholly before the raw
+    cutoff of every sensor. Dropping one is far cheaper than deleting its
+    rows; if any sensor keeps its raw readings longer, none qualify.
+    """
+    if not cutoffs or not partitioning.is_partitioned():
+        return []
+    if sum(len(sensor_ids) for _, sensor_ids in cutoffs) < Sensor.objects.count():
+        return []
+    oldest = min(cutoff for cutoff, _ in cutoffs)
+    return [partition for partition in partitioning.list_partitions() if partition[2] <= oldest]
+
+
+def bytes_per_row(model):
+    """
+    Average on-disk size of a row of ``model``'s table, indexes included,
+    or None where the database cannot tell
+    """
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # A partitioned parent has no storage of its own; sum it with its partitions
+                cursor.execute(
+                    "SELECT SUM(GREATEST(c.reltuples, 0)), SUM(pg_total_relation_size(c.oid)) FROM pg_class c "
+                    "WHERE c.oid = to_regclass(%s) "
+                    "OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))",
+                    [table, table]
+                )
+                rows, size = cursor.fetchone()
+            elif connection.vendor == 'sqlite':
+                # dbstat is only there when SQLite was built with it
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                    "(SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+                    [table]
+                )
+                size = cursor.fetchone()[0]
+                rows = model.objects.count()
+            else:
+                return None
+    except DatabaseError:
+        return None
+    if not rows or not size:
+        return None
+    return size / rows
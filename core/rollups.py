@@ -0,0 +1,146 @@
+"""
+Incremental maintenance of the 1m/1h/1d sensor data rollups
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import connection, transaction
+from .models import Sensor, SensorData, SensorDataRollup
+
+# Bucket width in seconds, finest first
+RESOLUTIONS = {
+    '1m': 60,
+    '1h': 3600,
+    '1d': 86400,
+}
+
+UPSERT_BATCH_SIZE = 500
+
+
+def bucket_start(moment, seconds):
+    """Return the start of the ``seconds``-wide UTC bucket containing ``moment``"""
+    timestamp = int(moment.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=dt_timezone.utc)
+
+
+def aggregate_readings(readings):
+    """
+    Fold ``(sensor_id, created_at, value)`` tuples into per-bucket partial
+    aggregates for every resolution.
+
+    Returns ``{(sensor_id, resolution, bucket): [min, max, sum, count, last, last_at]}``.
+    """
+    buckets = {}
+    for sensor_id, created_at, value in readings:
+        for resolution, seconds in RESOLUTIONS.items():
+            key = (sensor_id, resolution, bucket_start(created_at, seconds))
+            aggregate = buckets.get(key)
+            if aggregate is None:
+                buckets[key] = [value, value, value, 1, value, created_at]
+                continue
+            if value < aggregate[0]:
+                aggregate[0] = value
+            if value > aggregate[1]:
+                aggregate[1] = value
+            aggregate[2] += value
+            aggregate[3] += 1
+            if created_at >= aggregate[5]:
+                aggregate[4] = value
+                aggregate[5] = created_at
+    return buckets
+
+
+def _upsert_sql(row_count):
+    quote = connection.ops.quote_name
+    table = quote(SensorDataRollup._meta.db_table)
+    if connection.vendor == 'postgresql':
+        least, greatest = 'LEAST', 'GREATEST'
+    else:
+        least, greatest = 'MIN', 'MAX'
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * row_count)
+    return (
+        f"INSERT INTO {table} (sensor_id, resolution, bucket, min_value, max_value, "
+        f"avg_value, count, last_value, last_at) VALUES {values} "
+        f"ON CONFLICT (sensor_id, resolution, bucket) DO UPDATE SET "
+        f"min_value = {least}({table}.min_value, excluded.min_value), "
+        f"max_value = {greatest}({table}.max_value, excluded.max_value), "
+        f"avg_value = ({table}.avg_value * {table}.count + excluded.avg_value * excluded.count) "
+        f"/ ({table}.count + excluded.count), "
+        f"count = {table}.count + excluded.count, "
+        f"last_value = CASE WHEN excluded.last_at >= {table}.last_at "
+        f"THEN excluded.last_value ELSE {table}.last_value END, "
+        f"last_at = {greatest}({table}.last_at, excluded.last_at)"
+    )
+
+
+def upsert_rollups(buckets):
+    """
+    Merge partial aggregates into the rollup table.
+
+    Each batch is one ``INSERT ... ON CONFLICT DO UPDATE`` statement, so
+    concurrent writers merging into the same bucket cannot lose updates.
+    """
+    bucket_field = SensorDataRollup._meta.get_field('bucket')
+    items = list(buckets.items())
+    with connection.cursor() as cursor:
+        for offset in range(0, len(items), UPSERT_BATCH_SIZE):
+            batch = items[offset:offset + UPSERT_BATCH_SIZE]
+            params = []
+            for (sensor_id, resolution, bucket), (low, high, total, count, last, last_at) in batch:
+                params.extend([
+                    sensor_id, resolution, bucket_field.get_db_prep_value(bucket, connection),
+                    low, high, total / count, count, last,
+                    bucket_field.get_db_prep_value(last_at, connection),
+                ])
+            cursor.execute(_upsert_sql(len(batch)), params)
+
+
+def update_rollups(readings):
+    """Fold newly written ``SensorData`` instances into their rollups"""
+    upsert_rollups(aggregate_readings(
+        (reading.sensor_id, reading.created_at, reading.value) for reading in readings
+    ))
+
+
+def rebuild_buckets(readings):
+    """
+    Recompute from the raw readings every rollup bucket containing one of
+    ``(sensor_id, created_at)`` pairs, after readings there were edited or
+    deleted. Buckets starting before the sensor's ``compacted_until`` are
+    left alone, as ``rebuild_rollups`` does: their raw readings are gone.
+    """
+    keys = {
+        (sensor_id, resolution, bucket_start(created_at, seconds))
+        for sensor_id, created_at in readings
+        for resolution, seconds in RESOLUTIONS.items()
+    }
+    compacted_until = dict(Sensor.objects.filter(
+        sensor_id__in={sensor_id for sensor_id, _, _ in keys}
+    ).values_list('sensor_id', 'compacted_until'))
+
+    buckets = {}
+    with transaction.atomic():
+        for sensor_id, resolution, bucket in keys:
+            if sensor_id not in compacted_until:
+                continue
+            if compacted_until[sensor_id] and compacted_until[sensor_id] > bucket:
+                continue
+            SensorDataRollup.objects.filter(sensor_id=sensor_id, resolution=resolution, bucket=bucket).delete()
+            rows = SensorData.objects.filter(
+                sensor_id=sensor_id, created_at__gte=bucket,
+                created_at__lt=bucket + timedelta(seconds=RESOLUTIONS[resolution]),
+            ).values_list('sensor_id', 'created_at', 'value')
+            buckets.update(
+                (key, aggregate) for key, aggregate in aggregate_readings(rows).items() if key[1] == resolution
+            )
+        upsert_rollups(buckets)
+
+
+def choose_resolution(since, until, points):
+    """
+    Return the finest rollup resolution that covers ``since``..``until``
+    in at most ``points`` buckets, falling back to the coarsest one.
+    """
+    span = (until - since).total_seconds()
+    for resolution, seconds in RESOLUTIONS.items():
+        if span / seconds <= points:
+            return resolution
+    return list(RESOLUTIONS)[-1]
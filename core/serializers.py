@@ -1,5 +1,9 @@
 from rest_framework import serializers
-from .models import User, Device, QrCode, Hydroponic, Sensor, SensorData
+from rest_framework.fields import ISO_8601
+from rest_framework.settings import api_settings
+from .metrics import serializer_timing
+from .models import User, Device, QrCode, Hydroponic, Sensor, SensorData, SensorDataRollup
+from .renderers import ReprFloat, ValuesList
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -12,8 +16,8 @@ class UserSerializer(serializers.ModelSerializer):
 class DeviceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Device
-        fields = ['device_id', 'user', 'user_email', 'device_name', 'status', 'created_at', 'updated_at']
-        read_only_fields = ['device_id', 'created_at', 'updated_at']
+        fields = ['device_id', 'user', 'user_email', 'device_name', 'status', 'last_seen', 'created_at', 'updated_at']
+        read_only_fields = ['device_id', 'last_seen', 'created_at', 'updated_at']
 
 
 class QrCodeSerializer(serializers.ModelSerializer):
@@ -21,7 +25,7 @@ class QrCodeSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = QrCode
-        fields = ['qr_id', 'device', 'device_name', 'qr_code_data', 'method', 'created_at', 'updated_at']
+        fields = ['qr_id', 'device', 'device_name', 'qr_code_data', 'created_at', 'updated_at']
         read_only_fields = ['qr_id', 'created_at', 'updated_at']
 
 
@@ -47,10 +51,13 @@ class SensorDataSerializer(serializers.ModelSerializer):
     sensor_type = serializers.CharField(source='sensor.sensor_type', read_only=True)
     device_name = serializers.CharField(source='sensor.device.device_name', read_only=True)
     unit = serializers.CharField(source='sensor.unit', read_only=True)
-    
+    # Readings are immutable; kept for API compatibility
+    updated_at = serializers.DateTimeField(source='created_at', read_only=True)
+
     class Meta:
         model = SensorData
-        fields = ['data_id', 'sensor', 'sensor_type', 'device_name', 'value', 'unit', 'created_at', 'updated_at']
+        fields = ['data_id', 'sensor', 'sensor_type', 'device_name', 'value', 'unit', 'measured_at',
+                  'created_at', 'updated_at']
         read_only_fields = ['data_id', 'created_at', 'updated_at']
 
 
@@ -58,4 +65,123 @@ class SensorDataCreateSerializer(serializers.ModelSerializer):
     """Simplified serializer for creating sensor data"""
     class Meta:
         model = SensorData
-        fields = ['sensor', 'value']
+        fields = ['sensor', 'value', 'measured_at']
+
+
+class SensorDataRollupSerializer(serializers.ModelSerializer):
+    min = serializers.FloatField(source='min_value')
+    max = serializers.FloatField(source='max_value')
+    avg = serializers.FloatField(source='avg_value')
+    last = serializers.FloatField(source='last_value')
+
+    class Meta:
+        model = SensorDataRollup
+        fields = ['bucket', 'resolution', 'min', 'max', 'avg', 'count', 'last', 'last_at']
+        read_only_fields = fields
+
+
+class DownsampledPointSerializer(serializers.Serializer):
+    """One point of a downsampled reading series"""
+    timestamp = serializers.DateTimeField(read_only=True)
+    value = serializers.FloatField(read_only=True)
+
+
+def _float_value(value):
+    value = float(value)
+    # Outside this range orjson and the stdlib encoder format floats differently
+    if 1e-4 <= abs(value) < 1e16 or value == 0:
+        return value
+    return ReprFloat(value)
+
+
+def _datetime_converter(field):
+    """Return a converter equivalent to ``field.to_representation`` for ``.values()`` datetimes"""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.default_timezone()
+    if (output_format is None or output_format.lower() != ISO_8601 or hasattr(field, 'timezone')
+            or field_timezone is None):
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+class ValuesSerializer:
+    """
+    Read-only, ``many=True`` stand-in for ``serializer_class`` that renders
+    ``.values()`` rows instead of model instances.
+
+    The field plan (output key, ``.values()`` lookup, converter) is compiled
+    once from ``serializer_class``, so the output has the same keys, order and
+    values without instantiating models or running each field per row. Use
+    ``values()`` to shape the queryset the rows come from.
+    """
+    serializer_class = None
+
+    def __init__(self, instance, many=True, **kwargs):
+        self.instance = instance
+
+    @classmethod
+    def get_plan(cls):
+        if '_plan' not in cls.__dict__:
+            plan = []
+            for name, field in cls.serializer_class().fields.items():
+                if field.write_only:
+                    continue
+                plan.append((name, '__'.join(field.source_attrs), field))
+            cls._plan = plan
+        return cls._plan
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*dict.fromkeys(lookup for _, lookup, _ in cls.get_plan()))
+
+    @classmethod
+    def get_converters(cls):
+        """Return ``(key, lookup, converter)`` with ``None`` for values used as they are"""
+        converters = []
+        for name, lookup, field in cls.get_plan():
+            if isinstance(field, serializers.DateTimeField):
+                convert = _datetime_converter(field)
+            elif isinstance(field, serializers.FloatField):
+                convert = _float_value
+            elif isinstance(field, (serializers.IntegerField, serializers.CharField,
+                                    serializers.PrimaryKeyRelatedField)):
+                # The database already returns int / str / the related pk
+                convert = None
+            else:
+                convert = field.to_representation
+            converters.append((name, lookup, convert))
+        return converters
+
+    @classmethod
+    def iter_representation(cls, rows):
+        """Yield the representation of each ``.values()`` row in ``rows``"""
+        converters = cls.get_converters()
+        for row in rows:
+            item = {}
+            for name, lookup, convert in converters:
+                value = row[lookup]
+                if value is not None and convert is not None:
+                    value = convert(value)
+                item[name] = value
+            yield item
+
+    @property
+    def data(self):
+        with serializer_timing():
+            return ValuesList(self.iter_representation(self.instance))
+
+
+class SensorDataValuesSerializer(ValuesSerializer):
+    serializer_class = SensorDataSerializer
+
+
+class SensorValuesSerializer(ValuesSerializer):
+    serializer_class = SensorSerializer
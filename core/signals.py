@@ -1,65 +1,83 @@
 """
 Django signals for real-time WebSocket broadcasting
 """
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from .models import SensorData, Device
+from .alerts import alert_engine
+from .device_status import device_statuses
+from .fanout import fanout
+from .http_cache import bump_versions
+from .latest import latest_values
+from .metadata import sensor_metadata
+from .models import SensorData, Device, Sensor, Hydroponic, QrCode, AlertRule
+from .rollups import update_rollups
+
+
+def sensor_data_payload(reading, metadata):
+    """Build the broadcast payload for a reading from its sensor's cached metadata"""
+    return {
+        'id': reading.data_id,
+        'sensor_id': metadata['sensor_id'],
+        'sensor_type': metadata['sensor_type'],
+        'device_id': metadata['device_id'],
+        'device_name': metadata['device_name'],
+        'value': reading.value,
+        'unit': metadata['unit'],
+        'timestamp': reading.created_at.isoformat(),
+    }
 
 
 @receiver(post_save, sender=SensorData)
 def broadcast_sensor_data(sender, instance, created, **kwargs):
     """
-    Broadcast new sensor data to WebSocket consumers
+    Broadcast new sensor data to WebSocket consumers once it is committed
     """
     if created:  # Only broadcast new data
-        channel_layer = get_channel_layer()
-        
-        # Prepare sensor data for broadcasting
-        sensor_data = {
-            'id': instance.data_id,
-            'sensor_id': instance.sensor.sensor_id,
-            'sensor_type': instance.sensor.sensor_type,
-            'device_id': instance.sensor.device.device_id,
-            'device_name': instance.sensor.device.device_name,
-            'value': instance.value,
-            'unit': instance.sensor.unit,
-            'timestamp': instance.created_at.isoformat(),
-        }
-        
-        # Broadcast to general sensor data group
-        async_to_sync(channel_layer.group_send)(
-            'sensor_data',
-            {
-                'type': 'sensor_data_message',
-                'sensor_data': sensor_data
-            }
-        )
-        
-        # Broadcast to device-specific group
-        async_to_sync(channel_layer.group_send)(
-            f'device_{instance.sensor.device.device_id}',
-            {
-                'type': 'sensor_data_message',
-                'sensor_data': sensor_data
-            }
-        )
-        
-        # Broadcast to sensor-specific group
-        async_to_sync(channel_layer.group_send)(
-            f'sensor_{instance.sensor.sensor_id}',
-            {
-                'type': 'sensor_reading_message',
-                'sensor_data': {
-                    'id': instance.data_id,
-                    'value': instance.value,
-                    'timestamp': instance.created_at.isoformat(),
-                    'sensor_type': instance.sensor.sensor_type,
-                    'unit': instance.sensor.unit
-                }
-            }
-        )
+        fanout.publish_on_commit([sensor_data_payload(instance, sensor_metadata.get(instance.sensor_id))])
+
+
+@receiver(post_save, sender=SensorData)
+def record_latest_value(sender, instance, created, **kwargs):
+    """
+    Make a committed single-row insert the sensor's latest value
+    """
+    if created:
+        transaction.on_commit(lambda: latest_values.record([instance]))
+
+
+@receiver(post_save, sender=SensorData)
+def invalidate_latest_value(sender, instance, created, **kwargs):
+    """
+    Drop the sensor's latest value once an edit of one of its readings
+    commits; the next read loads it from the database again.
+
+    Deletes invalidate in the code paths that issue them (sensor and device
+    deletes, compaction, the API) rather than here: a post_delete receiver
+    would stop Django from fast-deleting a sensor's readings.
+    """
+    if not created:
+        transaction.on_commit(lambda: latest_values.invalidate_sensor(instance.sensor_id))
+
+
+@receiver(post_save, sender=SensorData)
+def evaluate_alert_rules(sender, instance, created, **kwargs):
+    """
+    Check a committed single-row insert against the alert rules
+    """
+    if created:
+        alert_engine.evaluate_on_commit([sensor_data_payload(instance, sensor_metadata.get(instance.sensor_id))])
+
+
+@receiver(post_save, sender=SensorData)
+def update_sensor_data_rollups(sender, instance, created, **kwargs):
+    """
+    Fold single-row inserts into the 1m/1h/1d rollups
+    """
+    if created:
+        update_rollups([instance])
 
 
 @receiver(post_save, sender=Device)
@@ -69,7 +87,7 @@ def broadcast_device_status(sender, instance, created, **kwargs):
     """
     if not created:  # Only broadcast updates, not new devices
         channel_layer = get_channel_layer()
-        
+
         # Broadcast to device-specific group
         async_to_sync(channel_layer.group_send)(
             f'device_{instance.device_id}',
@@ -79,3 +97,54 @@ def broadcast_device_status(sender, instance, created, **kwargs):
                 'device_id': instance.device_id
             }
         )
+
+
+@receiver(post_save, sender=Sensor)
+@receiver(post_delete, sender=Sensor)
+def invalidate_sensor_metadata(sender, instance, **kwargs):
+    """
+    Drop cached sensor metadata now and again on commit, so a concurrent
+    reload cannot keep the pre-commit row
+    """
+    sensor_metadata.invalidate_sensor(instance.sensor_id)
+    transaction.on_commit(lambda: sensor_metadata.invalidate_sensor(instance.sensor_id))
+    # The device's sensor list may have changed
+    transaction.on_commit(lambda: latest_values.invalidate_device(instance.device_id))
+    if kwargs['signal'] is post_delete:
+        transaction.on_commit(lambda: latest_values.invalidate_sensor(instance.sensor_id))
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_device_metadata(sender, instance, **kwargs):
+    """Drop cached metadata of every sensor on a changed or deleted device"""
+    sensor_metadata.invalidate_device(instance.device_id)
+    device_statuses.forget(instance.device_id)
+    transaction.on_commit(lambda: sensor_metadata.invalidate_device(instance.device_id))
+    transaction.on_commit(lambda: latest_values.invalidate_device(instance.device_id))
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+@receiver(post_save, sender=Sensor)
+@receiver(post_delete, sender=Sensor)
+@receiver(post_save, sender=Hydroponic)
+@receiver(post_delete, sender=Hydroponic)
+@receiver(post_save, sender=QrCode)
+@receiver(post_delete, sender=QrCode)
+def invalidate_api_cache(sender, **kwargs):
+    """
+    Invalidate cached API responses built from the changed model now and
+    again on commit, so a concurrent request cannot keep the pre-commit rows
+    under the new version
+    """
+    bump_versions(sender)
+    transaction.on_commit(lambda: bump_versions(sender))
+
+
+@receiver(post_save, sender=AlertRule)
+@receiver(post_delete, sender=AlertRule)
+@receiver(post_save, sender=Sensor)
+def reload_alert_rules(sender, **kwargs):
+    """Reload the alert rules (and which sensors they apply to) once the change commits"""
+    transaction.on_commit(alert_engine.invalidate)
@@ -0,0 +1,199 @@
+"""
+Windowed statistics of sensor readings: min, max, mean, standard deviation
+and optional percentiles per time bucket
+
+Aggregates are computed by the database, grouped by sensor and bucket.
+PostgreSQL computes percentiles too; elsewhere they are computed from the
+bucket's values with NumPy. A bucket that is over does not change (readings
+are stamped with their insert time), so its stats are cached and later calls
+only compute the buckets still open.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Aggregate, Avg, Count, FloatField, Max, Min, StdDev
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import SensorData
+from .rollups import RESOLUTIONS
+
+# Trunc kind lining up with each bucket resolution
+TRUNC_KINDS = {
+    '1m': 'minute',
+    '1h': 'hour',
+    '1d': 'day',
+}
+
+# Cached for closed buckets without readings
+EMPTY = {}
+
+
+class PercentileCont(Aggregate):
+    """PostgreSQL's ``percentile_cont``: the ``fraction`` quantile, interpolated"""
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def percentile_key(percentile):
+    return f'p{percentile:g}'
+
+
+def bucket_count(since, until, seconds):
+    """How many buckets overlap ``since``..``until``, without listing them"""
+    first = int(since.timestamp()) // seconds * seconds
+    return max(0, -(-(math.ceil(until.timestamp()) - first) // seconds))
+
+
+def bucket_starts(since, until, seconds):
+    """Start timestamps (UTC seconds) of the buckets overlapping ``since``..``until``"""
+    first = int(since.timestamp()) // seconds * seconds
+    return list(range(first, math.ceil(until.timestamp()), seconds))
+
+
+def _utc(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+def _cache_key(sensor_id, resolution, start, percentiles):
+    return f'stats:{sensor_id}:{resolution}:{start}:{",".join(map(percentile_key, percentiles))}'
+
+
+def numpy_percentiles(rows, first, seconds, percentiles):
+    """
+    Return ``{(sensor_id, bucket start): {pNN: value}}`` for
+    ``(sensor_id, created_at, value)`` rows, interpolating linearly between
+    the closest ranks as ``percentile_cont`` does
+    """
+    if not rows:
+        return {}
+    sensor_ids = sorted({row[0] for row in rows})
+    positions = {sensor_id: index for index, sensor_id in enumerate(sensor_ids)}
+    sensors = np.fromiter((positions[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+    timestamps = np.fromiter((row[1].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+    values = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+
+    # One group per (sensor, bucket), values sorted within each group
+    buckets = ((timestamps - first) // seconds).astype(np.int64)
+    width = int(buckets.max()) + 1
+    groups = sensors * width + buckets
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    present, offsets, sizes = np.unique(groups, return_index=True, return_counts=True)
+
+    columns = {}
+    for percentile in percentiles:
+        rank = offsets + (sizes - 1) * (percentile / 100)
+        low = np.floor(rank).astype(np.int64)
+        high = np.minimum(low + 1, offsets + sizes - 1)
+        columns[percentile_key(percentile)] = (values[low] + (values[high] - values[low]) * (rank - low)).tolist()
+
+    results = {}
+    for index, group in enumerate(present.tolist()):
+        sensor_index, bucket = divmod(group, width)
+        results[(sensor_ids[sensor_index], first + bucket * seconds)] = {
+            key: column[index] for key, column in columns.items()
+        }
+    return results
+
+
+def compute_stats(sensor_ids, since, until, resolution, percentiles=()):
+    """
+    Aggregate the readings of ``sensor_ids`` from the start of ``since``'s
+    bucket to ``until`` per ``resolution`` bucket, in the database.
+
+    Returns ``{(sensor_id, bucket start): stats}`` for the buckets holding
+    readings.
+    """
+    seconds = RESOLUTIONS[resolution]
+    first = int(since.timestamp()) // seconds * seconds
+    readings = SensorData.objects.filter(
+        sensor_id__in=sensor_ids, created_at__gte=_utc(first), created_at__lt=until
+    ).order_by()
+
+    aggregates = {
+        'low': Min('value'),
+        'high': Max('value'),
+        'mean': Avg('value'),
+        'readings': Count('data_id'),
+        'deviation': StdDev('value'),
+    }
+    in_database = bool(percentiles) and connection.vendor == 'postgresql'
+    if in_database:
+        aggregates.update({
+            percentile_key(percentile): PercentileCont('value', percentile / 100) for percentile in percentiles
+        })
+    rows = readings.annotate(
+        bucket=Trunc('created_at', TRUNC_KINDS[resolution], tzinfo=dt_timezone.utc)
+    ).values('sensor_id', 'bucket').annotate(**aggregates)
+
+    results = {}
+    for row in rows:
+        stats = {
+            'min': row['low'],
+            'max': row['high'],
+            'avg': row['mean'],
+            'count': row['readings'],
+            'stddev': row['deviation'],
+        }
+        if in_database:
+            stats.update({percentile_key(percentile): row[percentile_key(percentile)]
+                          for percentile in percentiles})
+        results[(row['sensor_id'], int(row['bucket'].timestamp()))] = stats
+
+    if percentiles and not in_database:
+        values = list(readings.values_list('sensor_id', 'created_at', 'value'))
+        for key, quantiles in numpy_percentiles(values, first, seconds, percentiles).items():
+            results[key].update(quantiles)
+    return results
+
+
+def sensor_stats(sensor_ids, since, until, resolution, percentiles=(), now=None):
+    """
+    Return ``{sensor_id: [bucket stats]}``, oldest bucket first, for the
+    ``resolution`` buckets of ``since``..``until`` holding readings.
+
+    Buckets that ended by ``until`` and at least ``SETTLE`` seconds before
+    ``now`` are closed: they are read from and written to the stats cache.
+    The rest are computed with one query from the first of them on.
+    """
+    config = settings.SENSOR_STATS
+    seconds = RESOLUTIONS[resolution]
+    starts = bucket_starts(since, until, seconds)
+    now = now or timezone.now()
+    closed_before = min(until, now - timedelta(seconds=config['SETTLE'])).timestamp()
+
+    cache = caches[config['CACHE']]
+    keys = {
+        (sensor_id, start): _cache_key(sensor_id, resolution, start, percentiles)
+        for sensor_id in sensor_ids for start in starts if start + seconds <= closed_before
+    }
+    cached = cache.get_many(keys.values()) if keys else {}
+    found = {pair: cached[key] for pair, key in keys.items() if key in cached}
+
+    missing = [(sensor_id, start) for sensor_id in sensor_ids for start in starts if (sensor_id, start) not in found]
+    if missing:
+        first = min(start for _, start in missing)
+        computed = compute_stats(sorted({sensor_id for sensor_id, _ in missing}),
+                                 max(since, _utc(first)), until, resolution, percentiles)
+        fresh = {}
+        for pair in missing:
+            found[pair] = computed.get(pair, EMPTY)
+            if pair in keys:
+                fresh[keys[pair]] = found[pair]
+        if fresh:
+            cache.set_many(fresh, timeout=config['TIMEOUT'])
+
+    return {
+        sensor_id: [
+            {'bucket': _utc(start), **found[(sensor_id, start)]}
+            for start in starts if found[(sensor_id, start)]
+        ]
+        for sensor_id in sensor_ids
+    }
@@ -0,0 +1,95 @@
+"""
+Per-connection subscriptions for the sensor data WebSocket stream
+"""
+from django.conf import settings
+from .models import Sensor
+
+SENSOR_TYPES = {choice for choice, _ in Sensor.SENSOR_TYPE_CHOICES}
+
+
+def _id_set(message, name):
+    raw = message.get(name)
+    if raw is None:
+        return None
+    if not isinstance(raw, list):
+        raise ValueError(f'{name} must be a list of ids')
+    ids = set()
+    for item in raw:
+        if isinstance(item, str) and item.isdigit():
+            item = int(item)
+        if isinstance(item, bool) or not isinstance(item, int):
+            raise ValueError(f'{name} must be a list of ids')
+        ids.add(item)
+    return ids
+
+
+class Subscription:
+    """
+    What one ``ws/sensor-data/`` client wants delivered.
+
+    ``None`` filters match everything. ``max_rate`` caps delivery at that
+    many frames per second; with ``latest_only`` only the newest pending
+    reading of each sensor is kept between frames.
+    """
+
+    def __init__(self, sensor_ids=None, device_ids=None, sensor_types=None, max_rate=None, latest_only=False):
+        self.sensor_ids = sensor_ids
+        self.device_ids = device_ids
+        self.sensor_types = sensor_types
+        self.max_rate = max_rate
+        self.latest_only = latest_only
+
+    @classmethod
+    def from_message(cls, message):
+        """Build a subscription from a ``subscribe`` frame, raising ValueError if it is invalid"""
+        sensor_types = message.get('sensor_types')
+        if sensor_types is not None:
+            if not isinstance(sensor_types, list) or not all(isinstance(item, str) for item in sensor_types):
+                raise ValueError('sensor_types must be a list of strings')
+            unknown = set(sensor_types) - SENSOR_TYPES
+            if unknown:
+                raise ValueError(f"Unknown sensor_types: {', '.join(sorted(unknown))}")
+            sensor_types = set(sensor_types)
+
+        max_rate = message.get('max_rate')
+        limit = settings.SENSOR_SUBSCRIPTION['MAX_RATE']
+        if max_rate is not None:
+            if isinstance(max_rate, bool) or not isinstance(max_rate, (int, float)) or not 0 < max_rate <= limit:
+                raise ValueError(f'max_rate must be a number of updates per second between 0 and {limit}')
+
+        latest_only = message.get('latest_only', False)
+        if not isinstance(latest_only, bool):
+            raise ValueError('latest_only must be a boolean')
+
+        return cls(
+            sensor_ids=_id_set(message, 'sensor_ids'),
+            device_ids=_id_set(message, 'device_ids'),
+            sensor_types=sensor_types,
+            max_rate=max_rate,
+            latest_only=latest_only,
+        )
+
+    @property
+    def is_filtered(self):
+        return self.sensor_ids is not None or self.device_ids is not None or self.sensor_types is not None
+
+    def filter(self, readings):
+        """Return the readings this subscription matches"""
+        if not self.is_filtered:
+            return readings
+        return [
+            reading for reading in readings
+            if (self.sensor_ids is None or reading['sensor_id'] in self.sensor_ids)
+            and (self.device_ids is None or reading['device_id'] in self.device_ids)
+            and (self.sensor_types is None or reading['sensor_type'] in self.sensor_types)
+        ]
+
+    def describe(self):
+        """The subscription as echoed back to the client"""
+        return {
+            'sensor_ids': sorted(self.sensor_ids) if self.sensor_ids is not None else None,
+            'device_ids': sorted(self.device_ids) if self.device_ids is not None else None,
+            'sensor_types': sorted(self.sensor_types) if self.sensor_types is not None else None,
+            'max_rate': self.max_rate,
+            'latest_only': self.latest_only,
+        }
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from core.alerts import alert_engine
+from core.fanout import FanoutDispatcher
+from core.ingest import ingest_readings
+from core.models import Alert, AlertRule, Device, Sensor, SensorData
+from core.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+START = datetime(2025, 9, 11, 15, 30, tzinfo=dt_timezone.utc)
+
+
+class AlertEngineTest(TestCase):
+    def setUp(self):
+        alert_engine.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.ph = Sensor.objects.create(device=self.device, sensor_type='ph', unit='ph_units')
+        self.ec = Sensor.objects.create(device=self.device, sensor_type='ec', unit='ec_units')
+        publish = mock.patch('core.alerts.fanout')
+        self.fanout = publish.start()
+        self.addCleanup(publish.stop)
+
+    def tearDown(self):
+        alert_engine.clear()
+
+    def payload(self, sensor, value, seconds=0):
+        return {
+            'id': 1,
+            'sensor_id': sensor.sensor_id,
+            'sensor_type': sensor.sensor_type,
+            'device_id': sensor.device_id,
+            'device_name': 'Test Device',
+            'value': value,
+            'unit': sensor.unit,
+            'timestamp': (START + timedelta(seconds=seconds)).isoformat(),
+        }
+
+    def pushed(self):
+        alerts = [alert for call in self.fanout.publish_alerts.call_args_list for alert in call.args[0]]
+        self.fanout.reset_mock()
+        return [(alert['state'], alert['value']) for alert in alerts]
+
+    def test_fires_once_and_resolves_past_the_hysteresis(self):
+        AlertRule.objects.create(name='pH', sensor_type='ph', min_value=5.5, max_value=6.5, hysteresis=0.2)
+
+        alert_engine.evaluate([self.payload(self.ph, 6.0), self.payload(self.ph, 7.0, 10)])
+        self.assertEqual(self.pushed(), [('firing', 7.0)])
+        alert = Alert.objects.get()
+        self.assertEqual((alert.value, alert.started_at, alert.resolved_at), (7.0, START + timedelta(seconds=10), None))
+
+        # Still out of bounds, then back in bounds but inside the hysteresis band
+        alert_engine.evaluate([self.payload(self.ph, 7.5, 20), self.payload(self.ph, 6.4, 30)])
+        self.assertEqual(self.pushed(), [])
+
+        alert_engine.evaluate([self.payload(self.ph, 6.2, 40)])
+        self.assertEqual(self.pushed(), [('resolved', 6.2)])
+        alert.refresh_from_db()
+        self.assertEqual(alert.resolved_at, START + timedelta(seconds=40))
+
+    def test_alerts_within_one_batch_are_written_in_order(self):
+        AlertRule.objects.create(name='pH', sensor=self.ph, max_value=6.5)
+
+        alert_engine.evaluate([self.payload(self.ph, 7.0), self.payload(self.ph, 6.0, 10),
+                               self.payload(self.ph, 7.1, 20)])
+
+        self.assertEqual(self.pushed(), [('firing', 7.0), ('resolved', 6.0), ('firing', 7.1)])
+        self.assertEqual(list(Alert.objects.order_by('started_at').values_list('value', 'resolved_at')),
+                         [(7.0, START + timedelta(seconds=10)), (7.1, None)])
+
+    def test_breach_must_last_min_duration(self):
+        AlertRule.objects.create(name='Water', sensor=self.ec, max_value=2.0, min_duration=60)
+
+        # A short breach is forgotten once a reading is back in bounds
+        alert_engine.evaluate([self.payload(self.ec, 2.5), self.payload(self.ec, 1.8, 50),
+                               self.payload(self.ec, 2.5, 100), self.payload(self.ec, 2.6, 130)])
+        self.assertEqual(self.pushed(), [])
+
+        alert_engine.evaluate([self.payload(self.ec, 2.7, 160)])
+        self.assertEqual(self.pushed(), [('firing', 2.7)])
+        self.assertEqual(Alert.objects.get().started_at, START + timedelta(seconds=100))
+
+    def test_rules_apply_to_their_scope(self):
+        other_device = Device.objects.create(user=self.user, user_email=self.user.email, device_name='Other')
+        other_ph = Sensor.objects.create(device=other_device, sensor_type='ph', unit='ph_units')
+        device_rule = AlertRule.objects.create(name='Device', device=self.device, max_value=10)
+        type_rule = AlertRule.objects.create(name='pH', sensor_type='ph', max_value=10)
+        device_ph_rule = AlertRule.objects.create(name='Device pH', device=self.device, sensor_type='ph', max_value=10)
+        everything = AlertRule.objects.create(name='All', max_value=10)
+        AlertRule.objects.create(name='Disabled', max_value=10, enabled=False)
+
+        alert_engine.evaluate([])
+
+        def rule_ids(sensor):
+            rules = alert_engine.rules_for(sensor.sensor_id, sensor.device_id, sensor.sensor_type)
+            return sorted(rule.rule_id for rule in rules)
+
+        self.assertEqual(rule_ids(self.ph), sorted([device_rule.pk, type_rule.pk, device_ph_rule.pk, everything.pk]))
+        self.assertEqual(rule_ids(self.ec), sorted([device_rule.pk, everything.pk]))
+        self.assertEqual(rule_ids(other_ph), sorted([type_rule.pk, everything.pk]))
+
+    def test_open_alerts_survive_a_restart(self):
+        AlertRule.objects.create(name='pH', sensor=self.ph, max_value=6.5)
+        alert_engine.evaluate([self.payload(self.ph, 7.0)])
+        self.pushed()
+
+        alert_engine.clear()
+        alert_engine.evaluate([self.payload(self.ph, 7.2, 10)])
+        self.assertEqual(self.pushed(), [])
+        alert_engine.evaluate([self.payload(self.ph, 6.0, 20)])
+        self.assertEqual(self.pushed(), [('resolved', 6.0)])
+        self.assertIsNotNone(Alert.objects.get().resolved_at)
+
+    def test_rule_changes_apply_at_once(self):
+        alert_engine.evaluate([self.payload(self.ph, 7.0)])
+        with self.captureOnCommitCallbacks(execute=True):
+            AlertRule.objects.create(name='pH', sensor=self.ph, max_value=6.5)
+        alert_engine.evaluate([self.payload(self.ph, 7.0, 10)])
+        self.assertEqual(self.pushed(), [('firing', 7.0)])
+
+    def test_ingest_paths_are_evaluated_after_commit(self):
+        AlertRule.objects.create(name='pH', sensor_type='ph', max_value=6.5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_readings([{'sensor': self.ph.sensor_id, 'value': 7.0}])
+        self.assertEqual(Alert.objects.get().value, 7.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SensorData.objects.create(sensor=self.ph, value=6.0)
+        self.assertIsNotNone(Alert.objects.get().resolved_at)
+        self.assertEqual(self.pushed(), [('firing', 7.0), ('resolved', 6.0)])
+
+
+class AlertPushTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+
+    async def test_device_consumer_receives_alerts(self):
+        application = URLRouter(websocket_urlpatterns)
+        communicator = WebsocketCommunicator(application, f'/ws/device/{self.device.device_id}/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # device_connected
+
+        FanoutDispatcher(interval=0.01).publish_alerts([
+            {'alert_id': 1, 'state': 'firing', 'device_id': self.device.device_id, 'value': 7.0},
+        ])
+
+        frame = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(frame['type'], 'alert_batch')
+        self.assertEqual([(alert['alert_id'], alert['state']) for alert in frame['alerts']], [(1, 'firing')])
+        await communicator.disconnect()
@@ -0,0 +1,97 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from core.latest import latest_values
+from core.models import Device, Hydroponic, Sensor, SensorData
+from core.rollups import update_rollups
+
+User = get_user_model()
+
+
+class DeviceDashboardTest(APITestCase):
+    def setUp(self):
+        latest_values.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.devices = [self.make_device(f'Device {number}') for number in range(3)]
+        self.device = self.devices[0]
+        self.temperature, self.ph = self.device.sensors.order_by('sensor_id')
+
+    def make_device(self, name):
+        device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name=name,
+            status='active'
+        )
+        Hydroponic.objects.create(device=device, hydroponic_name=f'{name} tank', plant_type='lettuce',
+                                  start_date=timezone.now().date(), location='Greenhouse')
+        temperature = Sensor.objects.create(device=device, sensor_type='temperature', unit='celsius')
+        Sensor.objects.create(device=device, sensor_type='ph', unit='ph_units')
+        for value in (20.0, 22.0, 27.0):
+            SensorData.objects.create(sensor=temperature, value=value)
+        return device
+
+    def test_dashboard(self):
+        response = self.client.get(reverse('device-dashboard', args=[self.device.device_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        dashboard = response.json()
+
+        self.assertEqual(dashboard['device_name'], 'Device 0')
+        self.assertEqual([tank['hydroponic_name'] for tank in dashboard['hydroponics']], ['Device 0 tank'])
+        temperature, ph = dashboard['sensors']
+        self.assertEqual((temperature['sensor_id'], temperature['device_name']),
+                         (self.temperature.sensor_id, 'Device 0'))
+        self.assertEqual(temperature['latest_reading']['value'], 27.0)
+        self.assertEqual(temperature['latest_reading']['data_id'], self.temperature.readings.first().data_id)
+        self.assertEqual({key: temperature['stats'][key] for key in ('min', 'max', 'avg', 'count')},
+                         {'min': 20.0, 'max': 27.0, 'avg': 23.0, 'count': 3})
+        self.assertIsNone(ph['latest_reading'])
+        self.assertEqual(ph['stats']['count'], 0)
+
+    def test_stats_window(self):
+        SensorData.objects.filter(sensor=self.temperature, value=20.0).update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        self.temperature.rollups.all().delete()
+        update_rollups(self.temperature.readings.all())
+
+        url = reverse('device-dashboard', args=[self.device.device_id])
+        recent = self.client.get(url).json()['sensors'][0]['stats']
+        self.assertEqual((recent['min'], recent['count']), (22.0, 2))
+        week = self.client.get(url, {'window': 7 * 86400}).json()['sensors'][0]['stats']
+        self.assertEqual((week['min'], week['count']), (20.0, 3))
+
+        self.assertEqual(self.client.get(url, {'window': 'soon'}).status_code, status.HTTP_400_BAD_REQUEST)
+        for window in (366 * 86400 + 1, 99999999999):
+            self.assertEqual(self.client.get(url, {'window': window}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('device-dashboards'), {'ids': self.device.device_id, 'window': 99999999999})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_count_does_not_grow_with_devices(self):
+        url = reverse('device-dashboards')
+        ids = ','.join(str(device.device_id) for device in self.devices)
+        self.client.get(url, {'ids': ids})
+
+        # Devices, sensors, hydroponics, stats; latest readings are in the store
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'ids': ids})
+        self.assertEqual([dashboard['device_name'] for dashboard in response.json()],
+                         ['Device 0', 'Device 1', 'Device 2'])
+        self.assertEqual([len(dashboard['sensors']) for dashboard in response.json()], [2, 2, 2])
+
+    def test_multi_device_validation(self):
+        url = reverse('device-dashboards')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'ids': '1,x'}).status_code, status.HTTP_400_BAD_REQUEST)
+        with self.settings(DEVICE_DASHBOARD={'STATS_WINDOW': 3600, 'MAX_WINDOW': 86400, 'MAX_DEVICES': 2}):
+            response = self.client.get(url, {'ids': '1,2,3'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'ids': '999'}).json(), [])
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from core.downsampling import downsample
+from core.models import Device, Sensor, SensorData
+
+User = get_user_model()
+
+START = datetime(2025, 9, 1, tzinfo=dt_timezone.utc)
+
+
+class DownsampleTestMixin:
+    def create_series(self, values):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+        readings = SensorData.objects.bulk_create([
+            SensorData(sensor=self.sensor, value=value) for value in values
+        ])
+        # created_at is auto_now_add; space the readings one minute apart
+        for offset, reading in enumerate(readings):
+            reading.created_at = START + timedelta(minutes=offset)
+        SensorData.objects.bulk_update(readings, ['created_at'])
+
+
+class DownsampleTest(DownsampleTestMixin, TestCase):
+    def setUp(self):
+        # A flat series with one spike up and one spike down
+        values = [20.0] * 1000
+        values[250] = 90.0
+        values[750] = -40.0
+        self.create_series(values)
+        self.readings = SensorData.objects.filter(sensor=self.sensor)
+
+    def test_avg_returns_one_point_per_bucket(self):
+        series = downsample(self.readings, 10, 'avg', chunk_size=64)
+        self.assertEqual(len(series), 10)
+        self.assertEqual([point[0] for point in series], sorted(point[0] for point in series))
+
+    def test_minmax_keeps_extremes(self):
+        series = downsample(self.readings, 10, 'minmax', chunk_size=64)
+        values = [value for _, value in series]
+        self.assertIn(90.0, values)
+        self.assertIn(-40.0, values)
+        self.assertLessEqual(len(series), 20)
+
+    def test_lttb_keeps_spikes_and_endpoints(self):
+        series = downsample(self.readings, 20, 'lttb', chunk_size=64)
+        values = [value for _, value in series]
+        self.assertLessEqual(len(series), 20)
+        self.assertIn(90.0, values)
+        self.assertIn(-40.0, values)
+        self.assertEqual(series[0][0], START)
+
+    def test_chunk_size_does_not_change_result(self):
+        for method in ('lttb', 'minmax', 'avg'):
+            self.assertEqual(
+                downsample(self.readings, 25, method, chunk_size=7),
+                downsample(self.readings, 25, method, chunk_size=10000),
+            )
+
+    def test_empty_series(self):
+        self.assertEqual(downsample(self.readings.none(), 10, 'lttb'), [])
+
+
+class DownsampleAPITest(DownsampleTestMixin, APITestCase):
+    def setUp(self):
+        self.create_series([float(value) for value in range(100)])
+        self.client.force_authenticate(user=self.user)
+
+    def test_data_history_downsampled(self):
+        url = reverse('sensor-data-history', kwargs={'pk': self.sensor.pk})
+        response = self.client.get(url, {'points': 10, 'method': 'avg'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(set(response.data[0]), {'timestamp', 'value'})
+
+    def test_by_device_downsampled_per_sensor(self):
+        response = self.client.get(reverse('sensordata-by-device'), {
+            'device_id': self.device.device_id, 'points': 10, 'method': 'lttb'
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['sensor_id'], self.sensor.sensor_id)
+        self.assertLessEqual(len(response.data[0]['points']), 10)
+
+    def test_unknown_method_is_rejected(self):
+        url = reverse('sensor-data-history', kwargs={'pk': self.sensor.pk})
+        response = self.client.get(url, {'method': 'median'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(SENSOR_DATA_HISTORY_MAX_POINTS=1000)
+    def test_points_above_the_limit_are_rejected(self):
+        url = reverse('sensor-data-history', kwargs={'pk': self.sensor.pk})
+        response = self.client.get(url, {'method': 'lttb', 'points': 1000000000})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'points': ['At most 1000.']})
+        self.assertEqual(self.client.get(url, {'method': 'lttb', 'points': 1000}).status_code, status.HTTP_200_OK)
@@ -0,0 +1,114 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from core.device_status import device_statuses, save_last_seen
+from core.http_cache import api_cache, model_versions
+from core.models import Device, Sensor
+
+User = get_user_model()
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        api_cache().clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        Sensor.objects.create(device=self.device, sensor_type='temperature', unit='celsius')
+
+    def test_repeat_poll_gets_304_without_queries(self):
+        url = reverse('device-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        with self.assertNumQueries(0):
+            repeat = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(repeat['ETag'], response['ETag'])
+        self.assertEqual(repeat.content, b'')
+
+        with self.assertNumQueries(0):
+            repeat = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(repeat.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cached_body_is_served_without_queries(self):
+        url = reverse('sensor-detail', args=[Sensor.objects.get().sensor_id])
+        response = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_changes_invalidate_dependent_responses(self):
+        url = reverse('device-sensors', args=[self.device.device_id])
+        response = self.client.get(url)
+
+        Sensor.objects.create(device=self.device, sensor_type='ph', unit='ph_units')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(changed.json()), 2)
+
+        # Sensors carry their device's name
+        self.device.device_name = 'Renamed'
+        self.device.save()
+        renamed = self.client.get(reverse('sensor-list'))
+        self.assertEqual(renamed.json()['results'][0]['device_name'], 'Renamed')
+
+    def test_last_seen_writes_invalidate_devices(self):
+        url = reverse('device-detail', args=[self.device.device_id])
+        response = self.client.get(url)
+        self.assertIsNone(response.json()['last_seen'])
+
+        sensors = self.client.get(reverse('sensor-list'))
+
+        save_last_seen({self.device.device_id: timezone.now()})
+        refreshed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(refreshed.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(refreshed.json()['last_seen'])
+        # Responses that do not show last_seen stay valid
+        unchanged = self.client.get(reverse('sensor-list'), HTTP_IF_NONE_MATCH=sensors['ETag'])
+        self.assertEqual(unchanged.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_only_status_changes_invalidate_devices(self):
+        device_statuses.clear()
+        version = model_versions([Device])
+        self.assertFalse(async_to_sync(device_statuses.update)(self.device.device_id, 'active'))
+        self.assertEqual(model_versions([Device]), version)
+        self.assertTrue(async_to_sync(device_statuses.update)(self.device.device_id, 'maintenance'))
+        self.assertNotEqual(model_versions([Device]), version)
+
+    def test_responses_are_per_user(self):
+        url = reverse('device-list')
+        response = self.client.get(url)
+
+        other = User.objects.create_user(email='other@example.com', password='testpass123')
+        self.client.force_authenticate(user=other)
+        self.assertNotEqual(self.client.get(url)['ETag'], response['ETag'])
+
+    def test_errors_are_not_cached(self):
+        url = reverse('device-detail', args=[self.device.device_id + 100])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ETag', self.client.get(url))
+
+    @override_settings(API_CACHE={'ENABLED': False, 'CACHE': 'api', 'TIMEOUT': 300})
+    def test_disabled_cache(self):
+        response = self.client.get(reverse('device-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
@@ -0,0 +1,207 @@
+from datetime import timedelta
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+from core.ingest import ingest_readings
+from core.latest import LatestValueStore, MemoryBackend, RedisBackend, latest_values
+from core.metadata import sensor_metadata
+from core.models import Device, Sensor, SensorData
+from core.serializers import SensorDataSerializer
+
+User = get_user_model()
+
+
+class LatestValueStoreTest(TestCase):
+    def setUp(self):
+        latest_values.clear()
+        sensor_metadata.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+        self.idle_sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='ph',
+            unit='ph_units'
+        )
+        self.old = SensorData.objects.create(sensor=self.sensor, value=1.0)
+        self.new = SensorData.objects.create(sensor=self.sensor, value=2.0)
+        SensorData.objects.filter(pk=self.old.pk).update(created_at=self.new.created_at - timedelta(minutes=1))
+
+    def test_misses_are_loaded_once(self):
+        with self.assertNumQueries(2):
+            readings = latest_values.latest_readings([self.sensor.sensor_id, self.idle_sensor.sensor_id])
+        self.assertEqual(readings[self.sensor.sensor_id]['id'], self.new.data_id)
+        self.assertIsNone(readings[self.idle_sensor.sensor_id])
+
+        with self.assertNumQueries(0):
+            again = latest_values.latest_readings([self.sensor.sensor_id, self.idle_sensor.sensor_id])
+        self.assertEqual(again, readings)
+
+    def test_older_readings_do_not_replace_newer_ones(self):
+        latest_values.record([self.new])
+        self.old.refresh_from_db()
+        latest_values.record([self.old])
+        self.assertEqual(latest_values.latest_readings([self.sensor.sensor_id])[self.sensor.sensor_id]['value'], 2.0)
+
+    def test_ingest_updates_the_store_on_commit(self):
+        latest_values.latest_readings([self.sensor.sensor_id])
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_readings([{'sensor': self.sensor.sensor_id, 'value': 9.5}])
+        with self.assertNumQueries(0):
+            latest = latest_values.latest_readings([self.sensor.sensor_id])[self.sensor.sensor_id]
+        self.assertEqual(latest['value'], 9.5)
+
+    def test_device_snapshot(self):
+        with self.assertNumQueries(5):
+            snapshot = latest_values.device_snapshot(self.device.device_id)
+        self.assertEqual(snapshot['device_name'], 'Test Device')
+        self.assertEqual(snapshot['status'], 'active')
+        self.assertEqual([(sensor['sensor_id'], sensor['latest_reading'] and sensor['latest_reading']['value'])
+                          for sensor in snapshot['sensors']],
+                         [(self.sensor.sensor_id, 2.0), (self.idle_sensor.sensor_id, None)])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(latest_values.device_snapshot(self.device.device_id), snapshot)
+        self.assertIsNone(latest_values.device_snapshot(9999))
+
+    def test_new_sensor_invalidates_device_snapshot(self):
+        latest_values.device_snapshot(self.device.device_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            sensor = Sensor.objects.create(device=self.device, sensor_type='ec', unit='ec_units')
+        snapshot = latest_values.device_snapshot(self.device.device_id)
+        self.assertIn(sensor.sensor_id, [item['sensor_id'] for item in snapshot['sensors']])
+
+    def test_redis_backend(self):
+        try:
+            import fakeredis
+        except ImportError:
+            self.skipTest('fakeredis is not installed')
+        backend = RedisBackend.__new__(RedisBackend)
+        backend.client = fakeredis.FakeRedis()
+        backend.key_prefix = 'test:'
+        try:
+            backend._set_newer = backend.client.register_script(RedisBackend.SET_NEWER)
+            store = LatestValueStore(backend)
+            store.record([self.new])
+            self.old.refresh_from_db()
+            store.record([self.old])
+        except Exception as exc:
+            if 'lua' in str(exc).lower():
+                self.skipTest('fakeredis has no Lua support')
+            raise
+        readings = store.latest_readings([self.sensor.sensor_id, self.idle_sensor.sensor_id])
+        self.assertEqual(readings[self.sensor.sensor_id]['value'], 2.0)
+        self.assertIsNone(readings[self.idle_sensor.sensor_id])
+        store.clear()
+        self.assertEqual(backend.client.keys('test:*'), [])
+
+    def test_memory_entries_expire_after_the_ttl(self):
+        store = LatestValueStore(MemoryBackend(ttl=60))
+        with mock.patch('core.latest.time.monotonic', return_value=1000.0):
+            store.latest_readings([self.sensor.sensor_id])
+        # Edited by another process: no signal reaches this store
+        SensorData.objects.filter(pk=self.new.pk).update(value=7.0)
+        with mock.patch('core.latest.time.monotonic', return_value=1059.0), self.assertNumQueries(0):
+            self.assertEqual(store.latest_readings([self.sensor.sensor_id])[self.sensor.sensor_id]['value'], 2.0)
+        with mock.patch('core.latest.time.monotonic', return_value=1060.0), self.assertNumQueries(2):
+            self.assertEqual(store.latest_readings([self.sensor.sensor_id])[self.sensor.sensor_id]['value'], 7.0)
+
+    def test_readings_loaded_during_an_invalidation_are_not_stored(self):
+        store = LatestValueStore(MemoryBackend())
+        get_many = store.backend.get_many
+
+        def invalidate_after_reading(keys):
+            found = get_many(keys)
+            store.invalidate_sensor(self.sensor.sensor_id)
+            return found
+
+        with mock.patch.object(store.backend, 'get_many', side_effect=invalidate_after_reading):
+            self.assertEqual(store.latest_readings([self.sensor.sensor_id])[self.sensor.sensor_id]['value'], 2.0)
+        self.assertEqual(store.backend.get_many([f'reading:{self.sensor.sensor_id}']), {})
+
+    def test_memory_backend_keeps_first_added_entry(self):
+        backend = MemoryBackend()
+        backend.add_many({'a': {'x': 1}})
+        backend.add_many({'a': {'x': 2}})
+        self.assertEqual(backend.get_many(['a', 'b']), {'a': {'x': 1}})
+
+
+class LatestDataEndpointTest(APITestCase):
+    def setUp(self):
+        latest_values.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+
+    def test_latest_data_matches_serializer(self):
+        url = reverse('sensor-latest-data', kwargs={'pk': self.sensor.pk})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        latest_values.clear()
+        reading = SensorData.objects.create(sensor=self.sensor, value=21.5)
+        expected = SensorDataSerializer(SensorData.objects.get(pk=reading.pk)).data
+        self.assertEqual(self.client.get(url).json(), expected)
+        # Served from the store the second time: only the sensor lookup runs
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).json(), expected)
+
+    def test_edited_and_deleted_readings_are_not_served(self):
+        url = reverse('sensor-latest-data', kwargs={'pk': self.sensor.pk})
+        older = SensorData.objects.create(sensor=self.sensor, value=1.0)
+        newer = SensorData.objects.create(sensor=self.sensor, value=2.0)
+        SensorData.objects.filter(pk=newer.pk).update(created_at=older.created_at + timedelta(seconds=1))
+        self.assertEqual(self.client.get(url).json()['value'], 2.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('sensordata-detail', args=[newer.pk]), {'value': 99.0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url).json()['value'], 99.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('sensordata-detail', args=[newer.pk]))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get(url).json()['data_id'], older.pk)
+
+    def test_deleting_a_sensor_fast_deletes_its_readings(self):
+        SensorData.objects.bulk_create(SensorData(sensor=self.sensor, value=float(i)) for i in range(50))
+        with CaptureQueriesContext(connection) as queries:
+            self.sensor.delete()
+        table = connection.ops.quote_name(SensorData._meta.db_table)
+        reading_deletes = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(f'DELETE FROM {table} ')
+        ]
+        # One delete by sensor, not one per batch of reading ids
+        self.assertEqual(len(reading_deletes), 1)
+        self.assertIn('sensor_id', reading_deletes[0])
@@ -0,0 +1,126 @@
+from unittest import mock
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.contrib.auth import get_user_model
+from core.ingest import ingest_readings
+from core.metadata import SensorMetadataCache, sensor_metadata
+from core.models import Device, Sensor, SensorData
+
+User = get_user_model()
+
+
+class MetadataTestMixin:
+    def setUp(self):
+        sensor_metadata.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+
+
+class SensorMetadataCacheTest(MetadataTestMixin, TestCase):
+    def test_hits_and_misses_are_counted(self):
+        cache = SensorMetadataCache(max_size=10)
+        with self.assertNumQueries(1):
+            entry = cache.get(self.sensor.sensor_id)
+            cache.get(self.sensor.sensor_id)
+        self.assertEqual(entry, {
+            'sensor_id': self.sensor.sensor_id,
+            'sensor_type': 'temperature',
+            'unit': 'celsius',
+            'device_id': self.device.device_id,
+            'device_name': 'Test Device',
+        })
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+
+    def test_unknown_sensor_is_not_cached(self):
+        cache = SensorMetadataCache(max_size=10)
+        self.assertIsNone(cache.get(9999))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        other = Sensor.objects.create(device=self.device, sensor_type='ph', unit='ph_units')
+        third = Sensor.objects.create(device=self.device, sensor_type='ec', unit='ec_units')
+        cache = SensorMetadataCache(max_size=2)
+        cache.get(self.sensor.sensor_id)
+        cache.get(other.sensor_id)
+        cache.get(self.sensor.sensor_id)
+        cache.get(third.sensor_id)
+
+        self.assertEqual(cache.stats()['evictions'], 1)
+        with self.assertNumQueries(0):
+            cache.get(self.sensor.sensor_id)
+        with self.assertNumQueries(1):
+            cache.get(other.sensor_id)
+
+    def test_device_rename_invalidates_its_sensors(self):
+        sensor_metadata.get(self.sensor.sensor_id)
+        self.device.device_name = 'Renamed Device'
+        self.device.save()
+        self.assertEqual(sensor_metadata.get(self.sensor.sensor_id)['device_name'], 'Renamed Device')
+
+    def test_sensor_delete_invalidates_entry(self):
+        sensor_id = self.sensor.sensor_id
+        sensor_metadata.get(sensor_id)
+        self.sensor.delete()
+        self.assertIsNone(sensor_metadata.get(sensor_id))
+
+    def test_broadcast_runs_without_metadata_queries(self):
+        sensor_metadata.get(self.sensor.sensor_id)
+        with self.assertNumQueries(2):  # the INSERT and its rollup upsert
+            SensorData.objects.create(sensor=self.sensor, value=25.5)
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = SensorMetadataCache(max_size=10, ttl=60)
+        with mock.patch('core.metadata.time.monotonic', return_value=1000.0):
+            cache.get(self.sensor.sensor_id)
+        with mock.patch('core.metadata.time.monotonic', return_value=1059.0), self.assertNumQueries(0):
+            cache.get(self.sensor.sensor_id)
+        with mock.patch('core.metadata.time.monotonic', return_value=1060.0), self.assertNumQueries(1):
+            cache.get(self.sensor.sensor_id)
+
+    def test_rows_loaded_during_an_invalidation_are_not_cached(self):
+        cache = SensorMetadataCache(max_size=10)
+        values = Sensor.objects.filter(sensor_id__in=[self.sensor.sensor_id]).values
+
+        def invalidate_while_loading(*fields):
+            cache.invalidate_sensor(self.sensor.sensor_id)
+            return values(*fields)
+
+        with mock.patch('core.metadata.Sensor.objects.filter') as queryset:
+            queryset.return_value.values.side_effect = invalidate_while_loading
+            self.assertEqual(cache.get(self.sensor.sensor_id)['sensor_type'], 'temperature')
+        self.assertEqual(cache.stats()['size'], 0)
+
+
+class DeletedSensorIngestTest(MetadataTestMixin, TransactionTestCase):
+    def test_rows_for_a_sensor_deleted_elsewhere_are_rejected(self):
+        other = Sensor.objects.create(device=self.device, sensor_type='ph', unit='ph_units')
+        sensor_metadata.get_many([self.sensor.sensor_id, other.sensor_id])
+        # Deleted by another process: no signal reaches this cache
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {Sensor._meta.db_table} WHERE sensor_id = %s', [other.sensor_id])
+
+        results = ingest_readings([
+            {'sensor': self.sensor.sensor_id, 'value': 1.0},
+            {'sensor': other.sensor_id, 'value': 2.0},
+            {'sensor': self.sensor.sensor_id, 'value': 3.0},
+        ])
+
+        self.assertEqual([result['status'] for result in results], ['accepted', 'rejected', 'accepted'])
+        self.assertIn('sensor', results[1]['errors'])
+        self.assertEqual(sorted(SensorData.objects.values_list('value', flat=True)), [1.0, 3.0])
+        self.assertIsNone(sensor_metadata.get(other.sensor_id))
@@ -0,0 +1,131 @@
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APITestCase
+from core.metrics import (
+    MetricsRegistry, WebSocketMetricsMiddleware, http_db_queries, http_request_duration, http_requests,
+    http_serializer_seconds, registry, websocket_connections, websocket_messages, websocket_open
+)
+from core.models import Device, Sensor, SensorData
+from core.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+class MetricsRegistryTest(TestCase):
+    def test_render_uses_the_prometheus_text_format(self):
+        metrics = MetricsRegistry()
+        requests = metrics.counter('requests_total', 'Requests', ('route',))
+        latency = metrics.histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+        requests.inc(('say "hi"',))
+        for value in (0.05, 0.5, 5.0):
+            latency.observe(('a',), value)
+
+        self.assertEqual(metrics.render().splitlines(), [
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{route="say \\"hi\\""} 1.0',
+            '# HELP latency_seconds Latency',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{route="a",le="0.1"} 1.0',
+            'latency_seconds_bucket{route="a",le="1.0"} 2.0',
+            'latency_seconds_bucket{route="a",le="+Inf"} 3.0',
+            'latency_seconds_sum{route="a"} 5.55',
+            'latency_seconds_count{route="a"} 3.0',
+        ])
+
+
+class MetricsMiddlewareTest(APITestCase):
+    def setUp(self):
+        registry.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        sensor = Sensor.objects.create(device=device, sensor_type='temperature', unit='celsius')
+        SensorData.objects.create(sensor=sensor, value=25.5)
+
+    def test_requests_are_recorded_per_route(self):
+        response = self.client.get(reverse('device-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        labels = ('GET', 'device-list')
+        self.assertEqual(http_requests.value(labels + (200,)), 1)
+        self.assertEqual(http_request_duration.count(labels), 1)
+        self.assertGreater(http_db_queries.value(labels), 0)
+        self.assertGreater(http_serializer_seconds.value(labels), 0)
+
+    def test_serializer_time_is_recorded_without_patching_drf(self):
+        response = self.client.get(reverse('sensordata-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(http_serializer_seconds.value(('GET', 'sensordata-list')), 0)
+        self.assertEqual(BaseSerializer.data.fget.__module__, 'rest_framework.serializers')
+
+    def test_unresolved_paths_share_one_label(self):
+        self.client.get('/no/such/path/')
+        self.client.get('/another/missing/path/')
+        self.assertEqual(http_requests.value(('GET', 'unmatched', 404)), 2)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('sensordata-list'))
+        self.client.force_login(User.objects.create_user(email='staff@example.com', password='x', is_staff=True))
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('smartanom_http_requests_total{method="GET",route="sensordata-list",status="200"} 1.0', body)
+        self.assertIn('smartanom_http_request_duration_seconds_bucket{method="GET",route="sensordata-list",le="+Inf"} 1.0',
+                      body)
+
+    @override_settings(METRICS={'ENABLED': True, 'BUCKETS': (1.0,), 'TOKEN': 's3cret', 'ALLOWED_IPS': ('10.0.0.5',)})
+    def test_metrics_endpoint_needs_staff_token_or_allowed_address(self):
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+        self.client.logout()
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code,
+                         status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS={'ENABLED': False, 'BUCKETS': (1.0,)})
+    def test_disabled_metrics_record_nothing(self):
+        self.client.get(reverse('device-list'))
+        self.assertEqual(http_requests.value(('GET', 'device-list', 200)), 0)
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class WebSocketMetricsTest(TestCase):
+    def setUp(self):
+        registry.clear()
+        self.application = WebSocketMetricsMiddleware(URLRouter(websocket_urlpatterns), websocket_urlpatterns)
+
+    async def test_messages_are_counted_per_consumer(self):
+        communicator = WebsocketCommunicator(self.application, '/ws/sensor-data/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+        self.assertEqual(websocket_open.value(('SensorDataConsumer',)), 1)
+
+        await communicator.send_json_to({'type': 'subscribe', 'sensor_ids': []})
+        await communicator.receive_json_from()  # subscribed
+        await communicator.disconnect()
+
+        self.assertEqual(websocket_connections.value(('SensorDataConsumer',)), 1)
+        self.assertEqual(websocket_open.value(('SensorDataConsumer',)), 0)
+        self.assertEqual(websocket_messages.value(('SensorDataConsumer', 'received')), 1)
+        self.assertEqual(websocket_messages.value(('SensorDataConsumer', 'sent')), 2)
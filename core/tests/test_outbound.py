@@ -0,0 +1,148 @@
+import asyncio
+import json
+from django.test import SimpleTestCase
+from core.outbound import SendQueue, merge_reading_frames
+
+
+class BlockedClient:
+    """Fake socket whose sends wait until ``release()``"""
+
+    def __init__(self):
+        self.frames = []
+        self.closed_with = None
+        self.gate = asyncio.Event()
+
+    async def send(self, text_data):
+        await self.gate.wait()
+        self.frames.append(json.loads(text_data))
+
+    async def close(self, code=None):
+        self.closed_with = code
+
+    def release(self):
+        self.gate.set()
+
+
+class SendQueueTest(SimpleTestCase):
+    def make_queue(self, client, **kwargs):
+        kwargs.setdefault('max_size', 2)
+        kwargs.setdefault('lag_budget', 60)
+        kwargs.setdefault('lag_grace', 60)
+        kwargs.setdefault('close_code', 4008)
+        return SendQueue(client.send, client.close, **kwargs)
+
+    def batch(self, *readings):
+        return {'type': 'sensor_data_batch', 'data': [{'sensor_id': sensor_id, 'value': value}
+                                                      for sensor_id, value in readings]}
+
+    async def test_frames_are_sent_in_order(self):
+        client = BlockedClient()
+        client.release()
+        queue = self.make_queue(client, policy='oldest', max_size=10)
+        for index in range(5):
+            await queue.put({'n': index})
+        await asyncio.sleep(0.01)
+        self.assertEqual([frame['n'] for frame in client.frames], list(range(5)))
+        self.assertEqual(queue.stats()['sent'], 5)
+        queue.stop()
+
+    async def test_oldest_policy_drops_oldest_frames(self):
+        client = BlockedClient()
+        queue = self.make_queue(client, policy='oldest')
+        for index in range(6):
+            await queue.put({'n': index})
+            await asyncio.sleep(0)
+        client.release()
+        await asyncio.sleep(0.01)
+        # Frame 0 was already being written when the rest queued up
+        self.assertEqual([frame['n'] for frame in client.frames], [0, 4, 5])
+        self.assertEqual(queue.stats()['dropped'], 3)
+        queue.stop()
+
+    async def test_conflate_policy_keeps_newest_reading_per_sensor(self):
+        client = BlockedClient()
+        queue = self.make_queue(client, policy='conflate', max_size=1)
+        await queue.put({'type': 'hello'})
+        await asyncio.sleep(0)
+        await queue.put(self.batch((1, 1.0), (2, 2.0)), key='batch', merge=merge_reading_frames)
+        await queue.put(self.batch((1, 3.0)), key='batch', merge=merge_reading_frames)
+        await queue.put(self.batch((3, 4.0)), key='batch', merge=merge_reading_frames)
+        self.assertEqual(queue.depth, 1)
+        client.release()
+        await asyncio.sleep(0.01)
+        self.assertEqual(client.frames[1]['data'], [
+            {'sensor_id': 2, 'value': 2.0}, {'sensor_id': 1, 'value': 3.0}, {'sensor_id': 3, 'value': 4.0}
+        ])
+        self.assertEqual(queue.stats()['conflated'], 2)
+        queue.stop()
+
+    async def test_conflate_policy_keeps_every_reading_until_full(self):
+        client = BlockedClient()
+        queue = self.make_queue(client, policy='conflate', max_size=100)
+        for index in range(4):
+            await queue.put({'type': 'sensor_reading_batch', 'data': [{'id': index}]},
+                            key='sensor_reading_batch', merge=merge_reading_frames)
+            await asyncio.sleep(0)
+        client.release()
+        await asyncio.sleep(0.01)
+        self.assertEqual([reading['id'] for frame in client.frames for reading in frame['data']], [0, 1, 2, 3])
+        self.assertEqual(queue.stats()['conflated'], 0)
+        queue.stop()
+
+    def test_sensor_stream_readings_merge_per_stream_sensor(self):
+        queued = {'type': 'sensor_reading_batch', 'data': [{'id': 1}, {'id': 2}]}
+        frame = {'type': 'sensor_reading_batch', 'data': [{'id': 3}]}
+        self.assertEqual(merge_reading_frames(queued, frame, stream_sensor_id=7)['data'], [{'id': 3}])
+
+    async def test_undroppable_frames_are_kept_when_full(self):
+        client = BlockedClient()
+        queue = self.make_queue(client, policy='conflate')
+        await queue.put({'type': 'hello'})
+        await asyncio.sleep(0)
+        await queue.put({'type': 'alert_batch', 'n': 1}, droppable=False)
+        for index in range(3):
+            await queue.put({'n': index})
+        client.release()
+        await asyncio.sleep(0.01)
+        self.assertEqual([frame.get('type', frame.get('n')) for frame in client.frames], ['hello', 'alert_batch', 2])
+        self.assertEqual(queue.stats()['dropped'], 2)
+        queue.stop()
+
+    async def test_queue_full_of_undroppable_frames_closes(self):
+        client = BlockedClient()
+        queue = self.make_queue(client, policy='oldest')
+        await queue.put({'type': 'hello'})
+        await asyncio.sleep(0)
+        await queue.put({'type': 'alert_batch', 'n': 1}, droppable=False)
+        await queue.put({'type': 'alert_batch', 'n': 2}, droppable=False)
+        # A droppable frame is dropped itself; another alert closes the client
+        await queue.put({'n': 0})
+        self.assertIsNone(client.closed_with)
+        await queue.put({'type': 'alert_batch', 'n': 3}, droppable=False)
+        self.assertEqual(client.closed_with, 4008)
+        queue.stop()
+
+    async def test_disconnect_policy_closes_when_full(self):
+        client = BlockedClient()
+        queue = self.make_queue(client, policy='disconnect')
+        for index in range(4):
+            await queue.put({'n': index})
+            await asyncio.sleep(0)
+        self.assertEqual(client.closed_with, 4008)
+        queue.stop()
+
+    async def test_client_over_lag_budget_is_closed(self):
+        client = BlockedClient()
+        queue = self.make_queue(client, policy='oldest', max_size=100, lag_budget=0.01, lag_grace=0.02)
+        await queue.put({'n': 0})
+        await asyncio.sleep(0)
+        await queue.put({'n': 1})
+        self.assertIsNone(client.closed_with)
+        await asyncio.sleep(0.02)
+        await queue.put({'n': 2})
+        self.assertIsNone(client.closed_with)
+        await asyncio.sleep(0.03)
+        await queue.put({'n': 3})
+        self.assertEqual(client.closed_with, 4008)
+        self.assertGreater(queue.stats()['max_lag'], 0.01)
+        queue.stop()
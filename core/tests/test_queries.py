@@ -0,0 +1,104 @@
+from datetime import date
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework import status
+from django.contrib.auth import get_user_model
+from core.latest import latest_values
+from core.models import Device, Hydroponic, QrCode, Sensor, SensorData
+
+User = get_user_model()
+
+
+class QueryCountTest(APITestCase):
+    """Read endpoints must cost the same number of queries for 1 row or 20"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+
+    def add_rows(self, count):
+        for index in range(count):
+            device = Device.objects.create(
+                user=self.user,
+                user_email=self.user.email,
+                device_name=f'Device {index}',
+                status='active'
+            )
+            sensor = Sensor.objects.create(device=device, sensor_type='temperature', unit='celsius')
+            Sensor.objects.create(device=self.device, sensor_type='ph', unit='ph')
+            SensorData.objects.create(sensor=sensor, value=index)
+            SensorData.objects.create(sensor=self.sensor, value=index)
+            QrCode.objects.create(device=device, qr_code_data=f'qr-{index}')
+            Hydroponic.objects.create(
+                device=self.device,
+                hydroponic_name=f'Tray {index}',
+                plant_type='lettuce',
+                start_date=date(2025, 1, 1),
+                location='Greenhouse'
+            )
+
+    def count_queries(self, url, params=None):
+        # Measure the cold path of the latest-value store
+        latest_values.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def assertConstantQueries(self, url, params=None):
+        self.add_rows(1)
+        small = self.count_queries(url, params)
+        self.add_rows(19)
+        self.assertEqual(self.count_queries(url, params), small)
+
+    def test_sensor_data_list(self):
+        self.assertConstantQueries(reverse('sensordata-list'), {'page_size': 100})
+
+    def test_sensor_data_by_sensor_type(self):
+        self.assertConstantQueries(reverse('sensordata-by-sensor-type'), {'type': 'temperature', 'page_size': 100})
+
+    def test_sensor_data_by_device(self):
+        self.assertConstantQueries(reverse('sensordata-by-device'), {'device_id': self.device.device_id})
+
+    def test_sensor_data_history(self):
+        self.assertConstantQueries(reverse('sensor-data-history', kwargs={'pk': self.sensor.pk}))
+
+    def test_sensor_latest_data(self):
+        self.assertConstantQueries(reverse('sensor-latest-data', kwargs={'pk': self.sensor.pk}))
+
+    def test_sensor_list(self):
+        self.assertConstantQueries(reverse('sensor-list'))
+
+    def test_qr_code_list(self):
+        self.assertConstantQueries(reverse('qrcode-list'))
+
+    def test_hydroponic_list(self):
+        self.assertConstantQueries(reverse('hydroponic-list'))
+
+    def test_device_sensors(self):
+        self.assertConstantQueries(reverse('device-sensors', kwargs={'pk': self.device.pk}))
+
+    def test_device_hydroponics(self):
+        self.assertConstantQueries(reverse('device-hydroponics', kwargs={'pk': self.device.pk}))
+
+    def test_sensor_data_list_loads_sensor_and_device_in_one_query(self):
+        self.add_rows(5)
+        # Session/user lookups are avoided by force_authenticate: one query for the page
+        self.assertEqual(self.count_queries(reverse('sensordata-list')), 1)
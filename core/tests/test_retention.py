@@ -0,0 +1,166 @@
+import io
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from core.latest import LatestValueStore, MemoryBackend, latest_values
+from core.models import Device, RetentionPolicy, Sensor, SensorData, SensorDataRollup
+from core.retention import day_cutoff, delete_in_batches, sensor_policies, tier_cutoffs
+
+User = get_user_model()
+
+
+class RetentionTest(TestCase):
+    def setUp(self):
+        latest_values.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.other_device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Other Device',
+            status='active'
+        )
+        self.temperature = Sensor.objects.create(device=self.device, sensor_type='temperature', unit='celsius')
+        self.ph = Sensor.objects.create(device=self.device, sensor_type='ph', unit='ph_units')
+        self.other_ph = Sensor.objects.create(device=self.other_device, sensor_type='ph', unit='ph_units')
+        self.now = timezone.now()
+
+    def add_readings(self, sensor, days_ago):
+        """One reading per entry of ``days_ago``, then rollups rebuilt from them"""
+        for days in days_ago:
+            reading = SensorData.objects.create(sensor=sensor, value=float(days))
+            SensorData.objects.filter(pk=reading.pk).update(created_at=self.now - timedelta(days=days))
+        SensorDataRollup.objects.all().delete()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+
+    def compact(self, *args):
+        out = io.StringIO()
+        call_command('compact_sensor_data', *args, stdout=out)
+        return out.getvalue()
+
+    def test_most_specific_policy_wins(self):
+        everything = RetentionPolicy.objects.create(raw_days=365)
+        ph = RetentionPolicy.objects.create(sensor_type='ph', raw_days=90)
+        device = RetentionPolicy.objects.create(device=self.device, raw_days=30)
+        device_ph = RetentionPolicy.objects.create(device=self.device, sensor_type='ph', raw_days=7)
+
+        governed = {policy.pk: sensor_ids for policy, sensor_ids in sensor_policies()}
+        self.assertEqual(governed, {
+            device.pk: [self.temperature.sensor_id],
+            device_ph.pk: [self.ph.sensor_id],
+            ph.pk: [self.other_ph.sensor_id],
+        })
+        self.assertNotIn(everything.pk, governed)
+
+    def test_unset_days_keep_a_tier_forever(self):
+        RetentionPolicy.objects.create(sensor_type='ph', raw_days=30, rollup_1m_days=365)
+        policies = sensor_policies()
+        self.assertEqual(tier_cutoffs(policies, 'raw', self.now),
+                         [(day_cutoff(self.now, 30), [self.ph.sensor_id, self.other_ph.sensor_id])])
+        self.assertEqual(tier_cutoffs(policies, '1h', self.now), [])
+
+    def test_raw_readings_are_deleted_and_rollups_kept(self):
+        RetentionPolicy.objects.create(sensor_type='ph', raw_days=30)
+        self.add_readings(self.ph, [1, 40, 50])
+        self.add_readings(self.temperature, [40])
+
+        output = self.compact()
+
+        self.assertIn('raw: deleted 2 rows', output)
+        self.assertEqual(list(SensorData.objects.filter(sensor=self.ph).values_list('value', flat=True)), [1.0])
+        self.assertEqual(SensorData.objects.filter(sensor=self.temperature).count(), 1)
+        self.assertEqual(SensorDataRollup.objects.get(sensor=self.ph, resolution='1d', bucket__lt=day_cutoff(
+            self.now, 45)).count, 1)
+        self.ph.refresh_from_db()
+        self.assertEqual(self.ph.compacted_until, day_cutoff(self.now, 30))
+
+    def test_compaction_invalidates_latest_values_of_other_processes(self):
+        RetentionPolicy.objects.create(sensor_type='ph', raw_days=30)
+        self.add_readings(self.ph, [40])
+        # A server process's store; the command runs with its own, sharing only the cache
+        server = LatestValueStore(MemoryBackend(cache=settings.SENSOR_LATEST_STORE['CACHE']))
+        self.assertEqual(server.latest_readings([self.ph.sensor_id])[self.ph.sensor_id]['value'], 40.0)
+
+        self.compact()
+
+        self.assertIsNone(server.latest_readings([self.ph.sensor_id])[self.ph.sensor_id])
+
+    def test_rollup_tiers_are_deleted(self):
+        RetentionPolicy.objects.create(raw_days=30, rollup_1m_days=30, rollup_1h_days=45)
+        self.add_readings(self.ph, [1, 40, 50])
+
+        self.compact()
+
+        remaining = sorted(SensorDataRollup.objects.filter(sensor=self.ph).values_list('resolution', flat=True))
+        # The new reading in every tier, plus both old days at 1d and the 40-day-old one at 1h
+        self.assertEqual(remaining, ['1d', '1d', '1d', '1h', '1h', '1m'])
+
+    def test_dry_run_deletes_nothing(self):
+        RetentionPolicy.objects.create(raw_days=30, rollup_1m_days=30)
+        self.add_readings(self.ph, [1, 40, 50])
+        rollups = SensorDataRollup.objects.count()
+
+        output = self.compact('--dry-run')
+
+        self.assertIn('raw: would delete 2 rows', output)
+        self.assertIn('1m: would delete 2 rows', output)
+        self.assertIn('1h: kept forever', output)
+        self.assertEqual(SensorData.objects.count(), 3)
+        self.assertEqual(SensorDataRollup.objects.count(), rollups)
+        self.ph.refresh_from_db()
+        self.assertIsNone(self.ph.compacted_until)
+
+    def test_no_policies_is_a_no_op(self):
+        self.add_readings(self.ph, [400])
+        self.assertIn('nothing to compact', self.compact())
+        self.assertEqual(SensorData.objects.count(), 1)
+
+    def test_rebuild_rollups_keeps_compacted_days(self):
+        RetentionPolicy.objects.create(sensor_type='ph', raw_days=30)
+        self.add_readings(self.ph, [1, 40])
+        self.add_readings(self.temperature, [40])
+        self.compact()
+        before = sorted(SensorDataRollup.objects.values_list('sensor_id', 'resolution', 'bucket', 'count'))
+
+        call_command('rebuild_rollups', stdout=io.StringIO())
+
+        after = sorted(SensorDataRollup.objects.values_list('sensor_id', 'resolution', 'bucket', 'count'))
+        self.assertEqual(after, before)
+
+    def test_dropped_partitions_mark_sensors_compacted(self):
+        RetentionPolicy.objects.create(raw_days=30)
+        self.add_readings(self.ph, [1, 40])
+        cutoff = day_cutoff(self.now, 30)
+
+        def drop_partition(name):
+            SensorData.objects.filter(created_at__lt=cutoff).delete()
+
+        with mock.patch('core.retention.expired_partitions', return_value=[('core_sensordata_p', None, cutoff)]), \
+                mock.patch('core.partitioning.partition_stats', return_value=(1, 8192)), \
+                mock.patch('core.partitioning.drop_partition', side_effect=drop_partition):
+            output = self.compact('--tier', 'raw')
+
+        self.assertIn('raw: dropped partition core_sensordata_p', output)
+        self.assertIn('raw: deleted 0 rows', output)
+        for sensor in (self.ph, self.temperature, self.other_ph):
+            sensor.refresh_from_db()
+            self.assertEqual(sensor.compacted_until, cutoff)
+
+    def test_delete_in_batches(self):
+        self.add_readings(self.ph, [1, 2, 3, 4, 5])
+        batches = list(delete_in_batches(SensorData.objects.filter(sensor=self.ph), batch_size=2))
+        self.assertEqual(batches, [2, 2, 1])
+        self.assertFalse(SensorData.objects.exists())
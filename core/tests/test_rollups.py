@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from core.ingest import ingest_readings
+from core.models import Device, Sensor, SensorData, SensorDataRollup
+from core.rollups import bucket_start, choose_resolution
+
+User = get_user_model()
+
+
+class RollupTestMixin:
+    def create_sensor(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='ph',
+            unit='ph_units'
+        )
+
+
+class SensorDataRollupTest(RollupTestMixin, TestCase):
+    def setUp(self):
+        self.create_sensor()
+
+    def test_bucket_start(self):
+        moment = datetime(2025, 9, 11, 15, 30, 45, 123, tzinfo=dt_timezone.utc)
+        self.assertEqual(bucket_start(moment, 60), datetime(2025, 9, 11, 15, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(bucket_start(moment, 86400), datetime(2025, 9, 11, tzinfo=dt_timezone.utc))
+
+    def test_choose_resolution(self):
+        until = datetime(2025, 9, 11, tzinfo=dt_timezone.utc)
+        self.assertEqual(choose_resolution(until - timedelta(hours=6), until, 500), '1m')
+        self.assertEqual(choose_resolution(until - timedelta(days=7), until, 500), '1h')
+        self.assertEqual(choose_resolution(until - timedelta(days=365), until, 500), '1d')
+        self.assertEqual(choose_resolution(until - timedelta(days=3650), until, 500), '1d')
+
+    def test_single_insert_updates_every_resolution(self):
+        SensorData.objects.create(sensor=self.sensor, value=6.0)
+        self.assertEqual(
+            sorted(SensorDataRollup.objects.values_list('resolution', flat=True)),
+            ['1d', '1h', '1m']
+        )
+
+    def test_rollup_merges_readings(self):
+        for value in (6.0, 5.0, 7.0):
+            SensorData.objects.create(sensor=self.sensor, value=value)
+        ingest_readings([{'sensor': self.sensor.sensor_id, 'value': 8.0}])
+
+        rollup = SensorDataRollup.objects.get(sensor=self.sensor, resolution='1d')
+        self.assertEqual(rollup.count, 4)
+        self.assertEqual(rollup.min_value, 5.0)
+        self.assertEqual(rollup.max_value, 8.0)
+        self.assertAlmostEqual(rollup.avg_value, 6.5)
+        self.assertEqual(rollup.last_value, 8.0)
+
+    def test_rebuild_rollups_matches_incremental(self):
+        for value in (6.0, 5.0, 7.0):
+            SensorData.objects.create(sensor=self.sensor, value=value)
+        expected = list(SensorDataRollup.objects.order_by('resolution').values_list(
+            'resolution', 'bucket', 'min_value', 'max_value', 'count', 'last_value'
+        ))
+
+        SensorDataRollup.objects.all().delete()
+        call_command('rebuild_rollups', stdout=open('/dev/null', 'w'))
+
+        rebuilt = list(SensorDataRollup.objects.order_by('resolution').values_list(
+            'resolution', 'bucket', 'min_value', 'max_value', 'count', 'last_value'
+        ))
+        self.assertEqual(rebuilt, expected)
+
+
+class DataHistoryResolutionAPITest(RollupTestMixin, APITestCase):
+    def setUp(self):
+        self.create_sensor()
+        self.client.force_authenticate(user=self.user)
+        for value in (6.0, 5.0, 7.0):
+            SensorData.objects.create(sensor=self.sensor, value=value)
+        self.url = reverse('sensor-data-history', kwargs={'pk': self.sensor.pk})
+
+    def test_raw_history_is_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 3)
+        self.assertIn('value', response.data[0])
+
+    def test_explicit_resolution(self):
+        response = self.client.get(self.url, {'resolution': '1h'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['resolution'], '1h')
+        self.assertEqual(response.data[0]['count'], 3)
+        self.assertEqual(response.data[0]['min'], 5.0)
+        self.assertEqual(response.data[0]['max'], 7.0)
+
+    def test_auto_resolution_fits_point_budget(self):
+        response = self.client.get(self.url, {'resolution': 'auto', 'points': 30})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['resolution'], '1h')
+
+    def test_edited_and_deleted_readings_are_rebuilt(self):
+        readings = list(SensorData.objects.filter(sensor=self.sensor).order_by('value'))
+        response = self.client.patch(reverse('sensordata-detail', args=[readings[0].pk]), {'value': 9.0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.delete(reverse('sensordata-detail', args=[readings[1].pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        for rollup in SensorDataRollup.objects.filter(sensor=self.sensor):
+            self.assertEqual((rollup.count, rollup.min_value, rollup.max_value), (2, 7.0, 9.0))
+            self.assertAlmostEqual(rollup.avg_value, 8.0)
+
+    def test_readings_moved_to_another_sensor_leave_their_buckets(self):
+        other = Sensor.objects.create(device=self.device, sensor_type='ec', unit='ec_units')
+        reading = SensorData.objects.filter(sensor=self.sensor).order_by('value').first()
+        response = self.client.patch(reverse('sensordata-detail', args=[reading.pk]), {'sensor': other.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(SensorDataRollup.objects.get(sensor=self.sensor, resolution='1d').min_value, 6.0)
+        self.assertEqual(SensorDataRollup.objects.get(sensor=other, resolution='1d').count, 1)
+
+    def test_auto_resolution_rejects_an_until_without_a_day_before_it(self):
+        response = self.client.get(self.url, {'resolution': 'auto', 'until': '0001-01-01T00:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'until': ['Out of range.']})
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'resolution': '5m'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'resolution': '1h', 'points': '0'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,124 @@
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+from django.urls import reverse
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+from django.contrib.auth import get_user_model
+from core import renderers
+from core.models import Device, Sensor, SensorData
+from core.renderers import FastJSONRenderer, ReprFloat, ValuesList
+from core.serializers import (
+    SensorDataSerializer, SensorDataValuesSerializer, SensorSerializer, SensorValuesSerializer
+)
+from core.views import SensorDataViewSet, SensorViewSet
+
+User = get_user_model()
+
+
+class ValuesSerializerTest(TestCase):
+    """The values path must produce exactly what the model serializers produce"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Serre\u2028«Nord»',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+        measured_at = datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        for value in (21.5, 0, -3.25, 1e16, 1.5e-5, 123456789.123):
+            SensorData.objects.create(sensor=self.sensor, value=value, measured_at=measured_at)
+        SensorData.objects.create(sensor=self.sensor, value=7)
+
+    def render_both(self, serializer_class, values_serializer_class, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        fast = FastJSONRenderer().render(
+            values_serializer_class(values_serializer_class.values(queryset), many=True).data
+        )
+        return expected, fast
+
+    def test_sensor_data_matches_model_serializer(self):
+        readings = SensorData.objects.all()
+        self.assertEqual(
+            SensorDataValuesSerializer(SensorDataValuesSerializer.values(readings), many=True).data,
+            SensorDataSerializer(readings, many=True).data
+        )
+        expected, fast = self.render_both(SensorDataSerializer, SensorDataValuesSerializer, readings)
+        self.assertEqual(fast, expected)
+
+    def test_sensor_matches_model_serializer(self):
+        expected, fast = self.render_both(SensorSerializer, SensorValuesSerializer, Sensor.objects.all())
+        self.assertEqual(fast, expected)
+
+    def test_stdlib_fallback_without_orjson(self):
+        readings = SensorData.objects.all()
+        with mock.patch.object(renderers, 'orjson', None):
+            expected, fast = self.render_both(SensorDataSerializer, SensorDataValuesSerializer, readings)
+        self.assertEqual(fast, expected)
+
+    def test_non_finite_values_fail_like_json_renderer(self):
+        with self.assertRaises(ValueError):
+            JSONRenderer().render([{'value': float('nan')}])
+        with self.assertRaises(ValueError):
+            FastJSONRenderer().render(ValuesList([{'value': ReprFloat('nan')}]))
+
+
+class ValuesEndpointTest(APITestCase):
+    """Responses must be byte-identical to the model serializer path"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+        for index in range(30):
+            SensorData.objects.create(sensor=self.sensor, value=index / 3)
+
+    def assertSameContent(self, view_class, url, params=None):
+        fast = self.client.get(url, params or {})
+        with mock.patch.object(view_class, 'values_actions', ()), \
+                mock.patch.object(view_class, 'renderer_classes', [JSONRenderer]):
+            slow = self.client.get(url, params or {})
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+
+    def test_sensor_data_list(self):
+        url = reverse('sensordata-list')
+        self.assertSameContent(SensorDataViewSet, url, {'page_size': 10})
+        next_url = self.client.get(url, {'page_size': 10}).json()['next']
+        self.assertSameContent(SensorDataViewSet, next_url)
+
+    def test_sensor_data_by_device(self):
+        self.assertSameContent(SensorDataViewSet, reverse('sensordata-by-device'),
+                               {'device_id': self.device.device_id})
+
+    def test_sensor_data_history(self):
+        self.assertSameContent(SensorViewSet, reverse('sensor-data-history', kwargs={'pk': self.sensor.pk}),
+                               {'limit': 5})
+
+    def test_sensor_list(self):
+        self.assertSameContent(SensorViewSet, reverse('sensor-list'))
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from core.models import Device, Sensor, SensorData
+from core.stats import bucket_count, bucket_starts, compute_stats, numpy_percentiles, sensor_stats
+
+User = get_user_model()
+
+HOUR = datetime(2025, 3, 1, 10, tzinfo=dt_timezone.utc)
+
+
+class StatsTestMixin:
+    def setUp(self):
+        caches[settings.SENSOR_STATS['CACHE']].clear()
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.temperature = Sensor.objects.create(device=self.device, sensor_type='temperature', unit='celsius')
+        self.ph = Sensor.objects.create(device=self.device, sensor_type='ph', unit='ph_units')
+
+    def add_readings(self, sensor, start, values, step=timedelta(minutes=1)):
+        for index, value in enumerate(values):
+            reading = SensorData.objects.create(sensor=sensor, value=value)
+            SensorData.objects.filter(pk=reading.pk).update(created_at=start + index * step)
+
+
+class SensorStatsTest(StatsTestMixin, TestCase):
+    def test_buckets(self):
+        self.add_readings(self.temperature, HOUR, [1.0, 2.0, 3.0, 4.0])
+        self.add_readings(self.temperature, HOUR + timedelta(hours=2), [10.0])
+
+        stats = sensor_stats([self.temperature.sensor_id], HOUR, HOUR + timedelta(hours=3), '1h', (50, 90))
+        first, last = stats[self.temperature.sensor_id]
+
+        self.assertEqual(first['bucket'], HOUR)
+        self.assertEqual({key: first[key] for key in ('min', 'max', 'avg', 'count')},
+                         {'min': 1.0, 'max': 4.0, 'avg': 2.5, 'count': 4})
+        self.assertAlmostEqual(first['stddev'], float(np.std([1.0, 2.0, 3.0, 4.0])))
+        self.assertAlmostEqual(first['p50'], 2.5)
+        self.assertAlmostEqual(first['p90'], 3.7)
+        self.assertEqual((last['bucket'], last['count'], last['p90']), (HOUR + timedelta(hours=2), 1, 10.0))
+
+    def test_bucket_count_matches_bucket_starts(self):
+        ranges = [(HOUR, HOUR + timedelta(hours=3)), (HOUR + timedelta(seconds=30), HOUR + timedelta(hours=1)),
+                  (HOUR, HOUR + timedelta(hours=2, microseconds=1)), (HOUR, HOUR + timedelta(seconds=1))]
+        for since, until in ranges:
+            for seconds in (60, 3600, 86400):
+                self.assertEqual(bucket_count(since, until, seconds), len(bucket_starts(since, until, seconds)))
+
+    def test_numpy_percentiles_match_numpy(self):
+        rng = np.random.default_rng(7)
+        rows = []
+        for sensor_id in (3, 5):
+            for minute in range(180):
+                rows.append((sensor_id, HOUR + timedelta(minutes=minute), float(rng.normal())))
+        start = int(HOUR.timestamp())
+
+        results = numpy_percentiles(rows, start, 3600, (5, 50, 99.5))
+
+        self.assertEqual(len(results), 6)
+        for (sensor_id, bucket), quantiles in results.items():
+            values = [value for row_sensor, created_at, value in rows
+                      if row_sensor == sensor_id and bucket <= created_at.timestamp() < bucket + 3600]
+            for percentile, key in ((5, 'p5'), (50, 'p50'), (99.5, 'p99.5')):
+                self.assertAlmostEqual(quantiles[key], float(np.percentile(values, percentile)))
+
+    def test_closed_buckets_are_cached(self):
+        self.add_readings(self.temperature, HOUR, [1.0, 2.0])
+        self.add_readings(self.temperature, HOUR + timedelta(hours=1), [5.0])
+        since, until = HOUR, HOUR + timedelta(hours=2)
+        now = HOUR + timedelta(hours=1, minutes=30)
+
+        with mock.patch('core.stats.compute_stats', wraps=compute_stats) as compute:
+            sensor_stats([self.temperature.sensor_id], since, until, '1h', now=now)
+            again = sensor_stats([self.temperature.sensor_id], since, until, '1h', now=now)
+
+        # The second call only computes the open bucket
+        self.assertEqual(compute.call_args_list[1].args[1], HOUR + timedelta(hours=1))
+        self.assertEqual([bucket['count'] for bucket in again[self.temperature.sensor_id]], [2, 1])
+
+        # Readings arriving in the open bucket are picked up
+        self.add_readings(self.temperature, HOUR + timedelta(hours=1, minutes=10), [7.0])
+        latest = sensor_stats([self.temperature.sensor_id], since, until, '1h', now=now)
+        self.assertEqual([bucket['count'] for bucket in latest[self.temperature.sensor_id]], [2, 2])
+
+    def test_empty_closed_buckets_are_cached(self):
+        now = HOUR + timedelta(days=1)
+        with self.assertNumQueries(1):
+            sensor_stats([self.ph.sensor_id], HOUR, HOUR + timedelta(hours=3), '1h', now=now)
+        with self.assertNumQueries(0):
+            stats = sensor_stats([self.ph.sensor_id], HOUR, HOUR + timedelta(hours=3), '1h', now=now)
+        self.assertEqual(stats, {self.ph.sensor_id: []})
+
+
+class StatsAPITest(StatsTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.user)
+        self.add_readings(self.temperature, HOUR, [1.0, 2.0, 3.0])
+        self.add_readings(self.ph, HOUR, [6.5, 7.0])
+        self.range = {'since': HOUR.isoformat(), 'until': (HOUR + timedelta(hours=1)).isoformat()}
+
+    def test_sensor_stats(self):
+        url = reverse('sensor-stats', args=[self.temperature.sensor_id])
+        response = self.client.get(url, {**self.range, 'bucket': '1m', 'percentiles': '50'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(bucket['bucket'], bucket['p50']) for bucket in response.json()], [
+            ('2025-03-01T10:00:00Z', 1.0), ('2025-03-01T10:01:00Z', 2.0), ('2025-03-01T10:02:00Z', 3.0),
+        ])
+
+    def test_device_stats(self):
+        response = self.client.get(reverse('device-stats', args=[self.device.device_id]), self.range)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(sensor['sensor_type'], [bucket['avg'] for bucket in sensor['buckets']])
+                          for sensor in response.json()],
+                         [('temperature', [2.0]), ('ph', [6.75])])
+
+    def test_invalid_parameters(self):
+        url = reverse('sensor-stats', args=[self.temperature.sensor_id])
+        for params in ({'bucket': '5m'}, {'percentiles': '50,101'}, {'percentiles': 'median'},
+                       {'since': '2025-03-02T00:00:00Z', 'until': '2025-03-01T00:00:00Z'},
+                       {'since': '2024-01-01T00:00:00Z', 'bucket': '1m'},
+                       {'since': '0001-01-01T00:00:00Z', 'bucket': '1m'},
+                       {'until': '0001-01-01T12:00:00Z'}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST, params)
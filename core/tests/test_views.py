@@ -1,4 +1,9 @@
+import csv
+import io
+import json
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
@@ -101,3 +106,232 @@ class SensorDataAPITest(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(float(response.data['value']), 25.5)
+
+
+class SensorDataBulkAPITest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+        self.url = reverse('sensordata-bulk')
+
+    def test_bulk_create_json_array(self):
+        rows = [
+            {'sensor': self.sensor.sensor_id, 'value': 20.0 + i, 'timestamp': '2025-09-11T15:30:00Z'}
+            for i in range(5)
+        ]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['accepted'], 5)
+        self.assertEqual(response.data['rejected'], 0)
+        self.assertEqual(SensorData.objects.count(), 5)
+        reading = SensorData.objects.get(data_id=response.data['results'][0]['data_id'])
+        self.assertEqual(reading.value, 20.0)
+        self.assertEqual(reading.measured_at.isoformat(), '2025-09-11T15:30:00+00:00')
+
+    def test_bulk_create_reports_rejected_rows(self):
+        rows = [
+            {'sensor': self.sensor.sensor_id, 'value': 21.5},
+            {'sensor': 9999, 'value': 1.0},
+            {'sensor': self.sensor.sensor_id, 'value': 'hot'},
+            {'sensor': self.sensor.sensor_id, 'value': 1.0, 'timestamp': 'yesterday'},
+            'not an object',
+        ]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual(response.data['rejected'], 4)
+        results = response.data['results']
+        self.assertEqual(results[0]['status'], 'accepted')
+        self.assertIn('sensor', results[1]['errors'])
+        self.assertIn('value', results[2]['errors'])
+        self.assertIn('timestamp', results[3]['errors'])
+        self.assertIn('non_field_errors', results[4]['errors'])
+        self.assertEqual(SensorData.objects.count(), 1)
+
+    def test_bulk_create_ndjson(self):
+        body = '\n'.join([
+            f'{{"sensor": {self.sensor.sensor_id}, "value": 1.5}}',
+            '',
+            f'{{"sensor": {self.sensor.sensor_id}, "value": 2.5}}',
+        ])
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['accepted'], 2)
+        self.assertEqual(SensorData.objects.count(), 2)
+
+    def test_bulk_create_rejects_non_list_body(self):
+        response = self.client.post(self.url, {'sensor': self.sensor.sensor_id, 'value': 1.0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_uses_constant_query_count(self):
+        rows = [{'sensor': self.sensor.sensor_id, 'value': float(i)} for i in range(50)]
+        with self.settings(SENSOR_DATA_BULK_CHUNK_SIZE=100):
+            with self.assertNumQueries(5):  # sensor lookup, savepoint, insert, rollup upsert, release
+                self.client.post(self.url, rows, format='json')
+
+
+class SensorDataKeysetPaginationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+        self.readings = [SensorData.objects.create(sensor=self.sensor, value=float(i)) for i in range(7)]
+        # Two readings share a timestamp to exercise the data_id tiebreaker
+        SensorData.objects.filter(data_id=self.readings[3].data_id).update(
+            created_at=self.readings[4].created_at
+        )
+        self.expected = list(SensorData.objects.values_list('data_id', flat=True))
+
+    def walk(self, url, params):
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item['data_id'] for item in response.data['results'])
+            if not response.data['next']:
+                return seen, response
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_every_reading_once_in_order(self):
+        seen, _ = self.walk(reverse('sensordata-list'), {'page_size': 3})
+        self.assertEqual(seen, self.expected)
+
+    def test_previous_link_returns_the_earlier_page(self):
+        first = self.client.get(reverse('sensordata-list'), {'page_size': 3})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [item['data_id'] for item in back.data['results']],
+            [item['data_id'] for item in first.data['results']]
+        )
+        self.assertIsNone(back.data['previous'])
+
+    def test_count_is_opt_in(self):
+        response = self.client.get(reverse('sensordata-list'))
+        self.assertNotIn('count', response.data)
+        response = self.client.get(reverse('sensordata-list'), {'count': 'true'})
+        self.assertEqual(response.data['count'], 7)
+
+    def test_by_device_and_by_sensor_type_are_paginated(self):
+        seen, _ = self.walk(reverse('sensordata-by-device'), {'device_id': self.device.device_id, 'page_size': 2})
+        self.assertEqual(seen, self.expected)
+        seen, _ = self.walk(reverse('sensordata-by-sensor-type'), {'type': 'temperature', 'page_size': 2})
+        self.assertEqual(seen, self.expected)
+
+    def test_since_and_until_filters(self):
+        middle = SensorData.objects.get(data_id=self.readings[5].data_id).created_at
+        response = self.client.get(reverse('sensordata-list'), {'since': middle.isoformat()})
+        self.assertEqual([item['data_id'] for item in response.data['results']], self.expected[:2])
+        response = self.client.get(reverse('sensordata-list'), {'until': middle.isoformat()})
+        self.assertEqual([item['data_id'] for item in response.data['results']], self.expected[2:])
+
+    def test_page_cost_does_not_depend_on_depth(self):
+        first = self.client.get(reverse('sensordata-list'), {'page_size': 2})
+        with CaptureQueriesContext(connection) as first_page:
+            self.client.get(reverse('sensordata-list'), {'page_size': 2})
+        with CaptureQueriesContext(connection) as deep_page:
+            self.client.get(first.data['next'])
+        self.assertEqual(len(first_page), len(deep_page))
+        self.assertFalse(any('COUNT(' in query['sql'] for query in deep_page.captured_queries))
+        self.assertFalse(any('OFFSET' in query['sql'] for query in deep_page.captured_queries))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('sensordata-list'), {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SensorDataExportTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+        for index in range(25):
+            SensorData.objects.create(sensor=self.sensor, value=index / 4)
+        self.expected = self.client.get(reverse('sensordata-list'), {'page_size': 100}).json()['results']
+
+    def export(self, url, params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_export(self):
+        with self.settings(SENSOR_DATA_EXPORT_CHUNK_SIZE=10):
+            body = self.export(reverse('sensordata-list'), {'format': 'csv'})
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([int(row['data_id']) for row in rows], [item['data_id'] for item in self.expected])
+        self.assertEqual(rows[0]['created_at'], self.expected[0]['created_at'])
+        self.assertEqual(rows[0]['measured_at'], '')
+
+    def test_ndjson_export_by_device(self):
+        body = self.export(reverse('sensordata-by-device'), {'device_id': self.device.device_id, 'format': 'ndjson'})
+        self.assertEqual([json.loads(line) for line in body.splitlines()], self.expected)
+
+    def test_export_is_negotiated_from_accept_header(self):
+        response = self.client.get(reverse('sensordata-list'), HTTP_ACCEPT='application/x-ndjson')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+
+    async def test_export_streams_chunks_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        with self.settings(SENSOR_DATA_EXPORT_CHUNK_SIZE=10):
+            response = await self.async_client.get(reverse('sensordata-list'), {'format': 'ndjson'})
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual([json.loads(line) for line in b''.join(chunks).splitlines()], self.expected)
+
+    def test_arrow_export(self):
+        try:
+            import pyarrow
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        with self.settings(SENSOR_DATA_EXPORT_CHUNK_SIZE=10):
+            body = self.export(reverse('sensordata-list'), {'format': 'arrow'})
+        table = pyarrow.ipc.open_stream(body).read_all()
+        self.assertEqual(table.column('data_id').to_pylist(), [item['data_id'] for item in self.expected])
+        self.assertEqual(table.column('value').to_pylist(), [item['value'] for item in self.expected])
+        self.assertEqual(str(table.schema.field('created_at').type), 'timestamp[us, tz=UTC]')
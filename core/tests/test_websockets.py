@@ -1,7 +1,19 @@
+import asyncio
+import threading
+from unittest import mock
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
 from channels.testing import WebsocketCommunicator
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.contrib.auth import get_user_model
+from core.binary_protocol import SUBPROTOCOL, decode_frame, encode_frame
 from core.consumers import SensorDataConsumer
+from core.dbpool import database_sync_to_async
+from core.device_status import LastSeenTracker, device_statuses, save_last_seen
+from core.fanout import FanoutDispatcher, ServerLoopMiddleware, set_server_loop
+from core.ingest import IngestBuffer
+from core.routing import websocket_urlpatterns
 from core.models import Device, Sensor, SensorData
 
 User = get_user_model()
@@ -47,3 +59,441 @@ class WebSocketTest(TestCase):
         self.assertIn('type', response)
         
         await communicator.disconnect()
+
+    async def test_sensor_data_consumer_acks_after_commit(self):
+        communicator = WebsocketCommunicator(SensorDataConsumer.as_asgi(), "/ws/sensor-data/")
+        await communicator.connect()
+        await communicator.receive_json_from()  # connection_established
+
+        await communicator.send_json_to({
+            'type': 'sensor_data',
+            'sensor_id': self.sensor.sensor_id,
+            'value': 25.5,
+            'ack': True,
+            'ref': 'frame-1'
+        })
+
+        ack = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(ack['type'], 'ack')
+        self.assertEqual(ack['ref'], 'frame-1')
+        self.assertEqual(ack['status'], 'accepted')
+        self.assertTrue(await SensorData.objects.filter(data_id=ack['id']).aexists())
+
+        broadcast = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(broadcast['type'], 'sensor_data_batch')
+        self.assertEqual([reading['value'] for reading in broadcast['data']], [25.5])
+
+        await communicator.disconnect()
+
+    async def test_sensor_data_consumer_acks_unknown_sensor_as_rejected(self):
+        communicator = WebsocketCommunicator(SensorDataConsumer.as_asgi(), "/ws/sensor-data/")
+        await communicator.connect()
+        await communicator.receive_json_from()  # connection_established
+
+        await communicator.send_json_to({
+            'type': 'sensor_data',
+            'sensor_id': 9999,
+            'value': 25.5,
+            'ack': True
+        })
+
+        ack = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(ack['status'], 'rejected')
+        self.assertIsNone(ack['id'])
+
+        await communicator.disconnect()
+
+
+class IngestBufferTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+
+    async def test_frames_are_flushed_as_one_batch(self):
+        buffer = IngestBuffer(max_batch_size=10, max_latency=0.05, max_queue_size=100)
+        results = await asyncio.gather(*[
+            buffer.submit(self.sensor.sensor_id, float(i), wait=True) for i in range(10)
+        ])
+
+        self.assertEqual([result['value'] for result in results], [float(i) for i in range(10)])
+        self.assertEqual(len({result['id'] for result in results}), 10)
+        self.assertEqual(await SensorData.objects.acount(), 10)
+
+    async def test_timestamp_is_stored_as_measured_at(self):
+        buffer = IngestBuffer(max_batch_size=10, max_latency=0.01, max_queue_size=100)
+        result = await buffer.submit(
+            self.sensor.sensor_id, 1.0, '2025-09-11T15:30:00Z', wait=True
+        )
+
+        reading = await SensorData.objects.aget(data_id=result['id'])
+        self.assertEqual(reading.measured_at.isoformat(), '2025-09-11T15:30:00+00:00')
+
+
+class FanoutDispatcherTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+
+    def payload(self, data_id, value):
+        return {
+            'id': data_id,
+            'sensor_id': self.sensor.sensor_id,
+            'sensor_type': 'temperature',
+            'device_id': self.device.device_id,
+            'device_name': 'Test Device',
+            'value': value,
+            'unit': 'celsius',
+            'timestamp': '2025-09-11T15:30:00+00:00',
+        }
+
+    async def test_payloads_are_coalesced_per_group(self):
+        channel_layer = get_channel_layer()
+        channels = {}
+        for group in ('sensor_data', f'device_{self.device.device_id}', f'sensor_{self.sensor.sensor_id}'):
+            channels[group] = await channel_layer.new_channel()
+            await channel_layer.group_add(group, channels[group])
+
+        dispatcher = FanoutDispatcher(interval=0.01, max_batch_size=2)
+        dispatcher.publish([self.payload(1, 1.0), None])
+        dispatcher.publish([self.payload(2, 2.0), self.payload(3, 3.0)])
+
+        first = await asyncio.wait_for(channel_layer.receive(channels['sensor_data']), 5)
+        second = await asyncio.wait_for(channel_layer.receive(channels['sensor_data']), 5)
+        self.assertEqual(first['type'], 'sensor_data_batch')
+        self.assertEqual([item['id'] for item in first['readings'] + second['readings']], [1, 2, 3])
+
+        device = await asyncio.wait_for(channel_layer.receive(channels[f'device_{self.device.device_id}']), 5)
+        self.assertEqual(device['type'], 'sensor_data_batch')
+        sensor = await asyncio.wait_for(channel_layer.receive(channels[f'sensor_{self.sensor.sensor_id}']), 5)
+        self.assertEqual(sensor['type'], 'sensor_reading_batch')
+        self.assertEqual(set(sensor['readings'][0]), {'id', 'value', 'timestamp', 'sensor_type', 'unit'})
+
+    def test_sync_saves_are_broadcast_after_commit_from_the_dispatcher_loop(self):
+        sent = []
+        done = threading.Event()
+
+        class RecordingLayer:
+            async def group_send(self, group, message):
+                sent.append((group, message))
+                if len(sent) == 3:
+                    done.set()
+
+        dispatcher = FanoutDispatcher(interval=0.01)
+        with mock.patch('core.fanout.get_channel_layer', return_value=RecordingLayer()), \
+                mock.patch('core.signals.fanout', dispatcher):
+            with self.captureOnCommitCallbacks() as callbacks:
+                SensorData.objects.create(sensor=self.sensor, value=1.0)
+                SensorData.objects.create(sensor=self.sensor, value=2.0)
+            self.assertEqual(sent, [])
+            for callback in callbacks:
+                callback()
+            self.assertTrue(done.wait(5))
+
+        self.assertEqual(len(sent), 3)
+        for group, message in sent:
+            self.assertEqual([item['value'] for item in message['readings']], [1.0, 2.0])
+
+    async def test_sync_callers_in_server_threads_use_the_server_loop(self):
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel()
+        await channel_layer.group_add('sensor_data', channel)
+        self.addCleanup(set_server_loop, None)
+
+        dispatcher = FanoutDispatcher(interval=0.01)
+
+        async def view(scope, receive, send):
+            await sync_to_async(dispatcher.publish, thread_sensitive=False)([self.payload(1, 1.0)])
+
+        await ServerLoopMiddleware(view)({'type': 'http'}, None, None)
+
+        message = await asyncio.wait_for(channel_layer.receive(channel), 5)
+        self.assertEqual([item['id'] for item in message['readings']], [1])
+        # The in-memory layer is only safe on one loop; no thread loop was started
+        self.assertIsNone(dispatcher._thread_loop)
+
+    async def test_sensor_consumer_forwards_batches_in_one_frame(self):
+        application = URLRouter(websocket_urlpatterns)
+        communicator = WebsocketCommunicator(application, f'/ws/sensor/{self.sensor.sensor_id}/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # sensor_connected
+
+        FanoutDispatcher(interval=0.01).publish([self.payload(1, 1.0), self.payload(2, 2.0)])
+
+        frame = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(frame['type'], 'sensor_reading_batch')
+        self.assertEqual([item['value'] for item in frame['data']], [1.0, 2.0])
+        await communicator.disconnect()
+
+
+class SensorDataSubscriptionTest(TestCase):
+    def reading(self, sensor_id, value, device_id=1, sensor_type='temperature'):
+        return {
+            'id': value,
+            'sensor_id': sensor_id,
+            'sensor_type': sensor_type,
+            'device_id': device_id,
+            'device_name': 'Test Device',
+            'value': value,
+            'unit': 'celsius',
+            'timestamp': '2025-09-11T15:30:00+00:00',
+        }
+
+    async def connect(self, subscription):
+        communicator = WebsocketCommunicator(SensorDataConsumer.as_asgi(), "/ws/sensor-data/")
+        await communicator.connect()
+        await communicator.receive_json_from()  # connection_established
+        await communicator.send_json_to({'type': 'subscribe', **subscription})
+        return communicator, await communicator.receive_json_from(timeout=5)
+
+    async def broadcast(self, *readings):
+        await get_channel_layer().group_send('sensor_data', {
+            'type': 'sensor_data_batch',
+            'readings': list(readings),
+        })
+
+    async def test_filters_are_applied_server_side(self):
+        communicator, reply = await self.connect({'sensor_ids': [1, 2], 'sensor_types': ['temperature']})
+        self.assertEqual(reply['type'], 'subscribed')
+        self.assertEqual(reply['subscription']['sensor_ids'], [1, 2])
+
+        await self.broadcast(self.reading(1, 1.0), self.reading(3, 2.0), self.reading(2, 3.0, sensor_type='ph'))
+        await self.broadcast(self.reading(2, 4.0))
+
+        frame = await communicator.receive_json_from(timeout=5)
+        self.assertEqual([item['value'] for item in frame['data']], [1.0])
+        frame = await communicator.receive_json_from(timeout=5)
+        self.assertEqual([item['value'] for item in frame['data']], [4.0])
+        await communicator.disconnect()
+
+    async def test_invalid_subscription_is_rejected(self):
+        communicator, reply = await self.connect({'sensor_types': ['plasma'], 'max_rate': 5})
+        self.assertEqual(reply['type'], 'error')
+        await communicator.disconnect()
+
+    async def test_rate_limited_latest_only_drops_superseded_values(self):
+        communicator, _ = await self.connect({'max_rate': 5, 'latest_only': True})
+
+        await self.broadcast(self.reading(1, 1.0))
+        frame = await communicator.receive_json_from(timeout=5)
+        self.assertEqual([item['value'] for item in frame['data']], [1.0])
+
+        await self.broadcast(self.reading(1, 2.0), self.reading(2, 5.0))
+        await self.broadcast(self.reading(1, 3.0))
+        await self.broadcast(self.reading(1, 4.0))
+        self.assertTrue(await communicator.receive_nothing(timeout=0.05))
+
+        frame = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(
+            [(item['sensor_id'], item['value']) for item in frame['data']],
+            [(2, 5.0), (1, 4.0)]
+        )
+        await communicator.disconnect()
+
+
+class BinaryProtocolTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        self.sensor = Sensor.objects.create(
+            device=self.device,
+            sensor_type='temperature',
+            unit='celsius'
+        )
+
+    def test_frame_round_trip(self):
+        frame = encode_frame([(1, 1757604600.0, 25.5), (2, None, -1.25)], seq=7, ack=True)
+        self.assertEqual(len(frame), 12 + 2 * 20)
+
+        seq, ack, records = decode_frame(frame)
+        self.assertEqual((seq, ack), (7, True))
+        self.assertEqual(records['sensor_id'].tolist(), [1, 2])
+        self.assertEqual(records['value'].tolist(), [25.5, -1.25])
+
+    def test_truncated_frame_is_rejected(self):
+        frame = encode_frame([(1, None, 25.5)])
+        with self.assertRaises(ValueError):
+            decode_frame(frame[:-1])
+        with self.assertRaises(ValueError):
+            decode_frame(b'XX' + frame[2:])
+
+    async def test_binary_frame_is_ingested_as_one_batch(self):
+        communicator = WebsocketCommunicator(
+            SensorDataConsumer.as_asgi(), "/ws/sensor-data/", subprotocols=[SUBPROTOCOL]
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, SUBPROTOCOL)
+        await communicator.receive_json_from()  # connection_established
+
+        await communicator.send_to(bytes_data=encode_frame([
+            (self.sensor.sensor_id, 1757604600.0, 25.5),
+            (self.sensor.sensor_id, None, 26.0),
+            (9999, None, 1.0),
+        ], seq=3, ack=True))
+
+        ack = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(ack, {'type': 'batch_ack', 'seq': 3, 'accepted': 2, 'rejected': 1})
+        readings = [reading async for reading in SensorData.objects.order_by('value')]
+        self.assertEqual([reading.value for reading in readings], [25.5, 26.0])
+        self.assertEqual(readings[0].measured_at.isoformat(), '2025-09-11T15:30:00+00:00')
+        self.assertIsNone(readings[1].measured_at)
+
+        broadcast = await communicator.receive_json_from(timeout=5)
+        self.assertEqual([reading['value'] for reading in broadcast['data']], [25.5, 26.0])
+        await communicator.disconnect()
+
+    async def test_records_with_bad_timestamps_are_rejected(self):
+        communicator = WebsocketCommunicator(
+            SensorDataConsumer.as_asgi(), "/ws/sensor-data/", subprotocols=[SUBPROTOCOL]
+        )
+        await communicator.connect()
+        await communicator.receive_json_from()  # connection_established
+
+        await communicator.send_to(bytes_data=encode_frame([
+            (self.sensor.sensor_id, float('inf'), 1.0),
+            (self.sensor.sensor_id, 1e300, 2.0),
+            (self.sensor.sensor_id, -1e20, 3.0),
+            (self.sensor.sensor_id, None, 4.0),
+        ], seq=4, ack=True))
+
+        ack = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(ack, {'type': 'batch_ack', 'seq': 4, 'accepted': 1, 'rejected': 3})
+        self.assertEqual([reading.value async for reading in SensorData.objects.all()], [4.0])
+        await communicator.disconnect()
+
+    async def test_binary_frame_requires_subprotocol(self):
+        communicator = WebsocketCommunicator(SensorDataConsumer.as_asgi(), "/ws/sensor-data/")
+        connected, subprotocol = await communicator.connect()
+        self.assertIsNone(subprotocol)
+        await communicator.receive_json_from()  # connection_established
+
+        await communicator.send_to(bytes_data=encode_frame([(self.sensor.sensor_id, None, 25.5)]))
+        reply = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(reply['type'], 'error')
+        self.assertEqual(await SensorData.objects.acount(), 0)
+        await communicator.disconnect()
+
+
+class ConsumerDatabasePoolTest(SimpleTestCase):
+    @staticmethod
+    def thread_name():
+        return threading.current_thread().name
+
+    async def test_default_uses_the_shared_thread(self):
+        name = await database_sync_to_async(self.thread_name)()
+        self.assertFalse(name.startswith('consumer-db'))
+
+    @override_settings(CONSUMER_DB_POOL={'MAX_WORKERS': 4})
+    async def test_sized_pool_runs_calls_concurrently(self):
+        barrier = threading.Barrier(4, timeout=5)
+
+        def wait_for_others():
+            barrier.wait()
+            return self.thread_name()
+
+        names = await asyncio.gather(*[database_sync_to_async(wait_for_others)() for _ in range(4)])
+        self.assertEqual(len(set(names)), 4)
+        self.assertTrue(all(name.startswith('consumer-db') for name in names))
+
+
+class DeviceStatusTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            name='Test User',
+            password='testpass123'
+        )
+        self.device = Device.objects.create(
+            user=self.user,
+            user_email=self.user.email,
+            device_name='Test Device',
+            status='active'
+        )
+        device_statuses.clear()
+
+    async def test_status_frame_updates_the_device(self):
+        application = URLRouter(websocket_urlpatterns)
+        communicator = WebsocketCommunicator(application, f"/ws/device/{self.device.device_id}/")
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # device_connected
+
+        await communicator.send_json_to({'type': 'device_status', 'status': 'maintenance'})
+        frame = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(frame['type'], 'device_status')
+        self.assertEqual(frame['status'], 'maintenance')
+        device = await Device.objects.aget(device_id=self.device.device_id)
+        self.assertEqual(device.status, 'maintenance')
+        await communicator.disconnect()
+
+    async def test_unchanged_status_is_not_written_or_broadcast(self):
+        application = URLRouter(websocket_urlpatterns)
+        communicator = WebsocketCommunicator(application, f"/ws/device/{self.device.device_id}/")
+        await communicator.connect()
+        await communicator.receive_json_from()  # device_connected
+
+        with mock.patch('core.device_status.Device.objects.filter', wraps=Device.objects.filter) as query:
+            for _ in range(4):
+                await communicator.send_json_to({'type': 'device_status', 'status': 'inactive'})
+            frame = await communicator.receive_json_from(timeout=5)
+            self.assertEqual(frame['status'], 'inactive')
+            self.assertTrue(await communicator.receive_nothing(timeout=0.1))
+        self.assertEqual(query.call_count, 1)
+        await communicator.disconnect()
+
+    async def test_rest_status_change_is_seen_by_the_cache(self):
+        await device_statuses.update(self.device.device_id, 'maintenance')
+        self.device.status = 'active'
+        await self.device.asave()
+
+        self.assertTrue(await device_statuses.update(self.device.device_id, 'maintenance'))
+        device = await Device.objects.aget(device_id=self.device.device_id)
+        self.assertEqual(device.status, 'maintenance')
+
+    async def test_last_seen_is_written_once_per_interval(self):
+        tracker = LastSeenTracker(interval=0.05)
+        with mock.patch('core.device_status.save_last_seen', wraps=save_last_seen) as save:
+            for _ in range(5):
+                tracker.touch(self.device.device_id)
+            await asyncio.sleep(0.2)
+        self.assertEqual(save.call_count, 1)
+        device = await Device.objects.aget(device_id=self.device.device_id)
+        self.assertIsNotNone(device.last_seen)
@@ -13,4 +13,5 @@ router.register(r'sensor-data', views.SensorDataViewSet)
 urlpatterns = [
     path('api/', include(router.urls)),
     path('websocket-test/', views.websocket_test_view, name='websocket_test'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
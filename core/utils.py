@@ -0,0 +1,31 @@
+"""
+Small helpers shared by the API, consumers and management commands
+"""
+from datetime import datetime, timezone as dt_timezone
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def parse_moment(value):
+    """
+    Parse an ISO 8601 datetime (or plain date) into an aware datetime.
+
+    Naive values are taken to be UTC. ``datetime`` objects are accepted as
+    they are. Returns None if ``value`` is not a valid date or datetime.
+    """
+    if isinstance(value, datetime):
+        return timezone.make_aware(value, dt_timezone.utc) if timezone.is_naive(value) else value
+    if not isinstance(value, str):
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            date = parse_date(value)
+            if date is None:
+                return None
+            moment = datetime(date.year, date.month, date.day)
+    except ValueError:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
@@ -1,14 +1,195 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from datetime import timedelta
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.shortcuts import render
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from .models import User, Device, QrCode, Hydroponic, Sensor, SensorData
 from .serializers import (
     UserSerializer, DeviceSerializer, QrCodeSerializer, 
     HydroponicSerializer, SensorSerializer, SensorDataSerializer,
-    SensorDataCreateSerializer
+    SensorDataCreateSerializer, SensorDataRollupSerializer, DownsampledPointSerializer,
+    SensorDataValuesSerializer, SensorValuesSerializer
 )
+from .dashboard import device_dashboards
+from .downsampling import METHODS, downsample
+from .http_cache import DEVICE_LAST_SEEN, CachedReadMixin, cached_response
+from .ingest import ingest_readings
+from .latest import latest_values
+from .metrics import SerializerTimingMixin, metrics_allowed, metrics_enabled, registry
+from .pagination import SensorDataKeysetPagination
+from .parsers import NDJSONParser
+from .renderers import EXPORT_RENDERER_CLASSES, FastJSONRenderer, StreamingRenderer, aiter_chunks
+from .rollups import RESOLUTIONS, bucket_start, choose_resolution, rebuild_buckets
+from .stats import bucket_count, sensor_stats
+from .utils import parse_moment
+
+
+# Query plans: the joins and columns each read action needs so serializers
+# never fall back to a lazy load per row
+SENSOR_DATA_READ_PLAN = {
+    'select_related': ['sensor__device'],
+    'only': ['data_id', 'sensor', 'value', 'measured_at', 'created_at',
+             'sensor__sensor_type', 'sensor__unit', 'sensor__device', 'sensor__device__device_name'],
+}
+
+SENSOR_READ_PLAN = {
+    'select_related': ['device'],
+    'only': ['sensor_id', 'device', 'sensor_type', 'unit', 'created_at', 'updated_at',
+             'device__device_name'],
+}
+
+QRCODE_READ_PLAN = {
+    'select_related': ['device'],
+    'only': ['qr_id', 'device', 'qr_code_data', 'created_at', 'updated_at', 'device__device_name'],
+}
+
+HYDROPONIC_READ_PLAN = {
+    'select_related': ['device'],
+    'only': ['hydroponic_id', 'device', 'hydroponic_name', 'plant_type', 'start_date', 'end_date',
+             'location', 'device__device_name'],
+}
+
+
+def apply_query_plan(queryset, plan):
+    """Apply a query plan's ``select_related`` and ``only`` to ``queryset``"""
+    if plan.get('select_related'):
+        queryset = queryset.select_related(*plan['select_related'])
+    if plan.get('only'):
+        queryset = queryset.only(*plan['only'])
+    return queryset
+
+
+class QueryPlanMixin:
+    """
+    Shape ``get_queryset()`` with the plan declared for the current action in
+    ``query_plans``. Actions without a plan (writes, mostly) get the plain
+    queryset.
+    """
+    query_plans = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        plan = self.query_plans.get(self.action)
+        if plan:
+            queryset = apply_query_plan(queryset, plan)
+        return queryset
+
+
+class ValuesReadMixin:
+    """
+    Serve the list-style actions in ``values_actions`` from ``.values()`` rows
+    through ``values_serializer_class`` instead of model instances. The JSON
+    is the same as ``serializer_class`` produces, built with much less work.
+    """
+    values_actions = ()
+    values_serializer_class = None
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.values_actions:
+            queryset = self.values_serializer_class.values(queryset)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.values_actions and kwargs.get('many'):
+            return self.values_serializer_class(*args, **kwargs)
+        return super().get_serializer(*args, **kwargs)
+
+
+def parse_datetime_param(request, name):
+    """Return an aware datetime from an ISO 8601 query parameter, or None if absent"""
+    raw = request.query_params.get(name)
+    if not raw:
+        return None
+    moment = parse_moment(raw)
+    if moment is None:
+        raise ValidationError({name: ['Datetime has wrong format. Use ISO 8601.']})
+    return moment
+
+
+def parse_positive_int_param(request, name, default):
+    """Return a positive integer query parameter, or ``default`` if absent"""
+    raw = request.query_params.get(name)
+    if not raw:
+        return default
+    if not raw.isdigit() or int(raw) < 1:
+        raise ValidationError({name: ['A positive integer is required.']})
+    return int(raw)
+
+
+def parse_dashboard_window(request):
+    """Return the dashboard's ``window`` in seconds, at most ``DEVICE_DASHBOARD['MAX_WINDOW']``"""
+    config = settings.DEVICE_DASHBOARD
+    window = parse_positive_int_param(request, 'window', config['STATS_WINDOW'])
+    if window > config['MAX_WINDOW']:
+        raise ValidationError({'window': [f"At most {config['MAX_WINDOW']} seconds."]})
+    return window
+
+
+def parse_points_param(request):
+    """Return the ``points`` budget, at most ``SENSOR_DATA_HISTORY_MAX_POINTS``"""
+    points = parse_positive_int_param(request, 'points', settings.SENSOR_DATA_HISTORY_POINTS)
+    if points > settings.SENSOR_DATA_HISTORY_MAX_POINTS:
+        raise ValidationError({'points': [f'At most {settings.SENSOR_DATA_HISTORY_MAX_POINTS}.']})
+    return points
+
+
+def downsampled_series(request, readings, since=None, until=None):
+    """Downsample ``readings`` per the ``points``/``method`` query parameters"""
+    method = request.query_params.get('method')
+    if method not in METHODS:
+        raise ValidationError({'method': [f"Must be one of {', '.join(METHODS)}."]})
+    points = parse_points_param(request)
+    series = downsample(readings, points, method, since, until)
+    return DownsampledPointSerializer(
+        [{'timestamp': timestamp, 'value': value} for timestamp, value in series], many=True
+    ).data
+
+
+def default_range(since, until):
+    """Return ``(since, until)``, defaulting to the day before ``until``, itself defaulting to now"""
+    until = until or timezone.now()
+    try:
+        since = since or until - timedelta(days=1)
+    except OverflowError:
+        raise ValidationError({'until': ['Out of range.']})
+    return since, until
+
+
+def parse_stats_params(request):
+    """Return ``(since, until, bucket, percentiles)`` from the ``stats`` query parameters"""
+    bucket = request.query_params.get('bucket', '1h')
+    if bucket not in RESOLUTIONS:
+        raise ValidationError({'bucket': [f"Must be one of {', '.join(RESOLUTIONS)}."]})
+    since, until = default_range(parse_datetime_param(request, 'since'), parse_datetime_param(request, 'until'))
+    if since >= until:
+        raise ValidationError({'since': ['Must be before until.']})
+    max_buckets = settings.SENSOR_STATS['MAX_BUCKETS']
+    if bucket_count(since, until, RESOLUTIONS[bucket]) > max_buckets:
+        raise ValidationError({'bucket': [f'The range spans more than {max_buckets} buckets; use a coarser one.']})
+
+    percentiles = []
+    for part in request.query_params.get('percentiles', '').split(','):
+        if not part:
+            continue
+        try:
+            percentile = float(part)
+        except ValueError:
+            percentile = -1
+        if not 0 <= percentile <= 100:
+            raise ValidationError({'percentiles': ['A comma-separated list of numbers from 0 to 100 is required.']})
+        percentiles.append(percentile)
+    return since, until, bucket, tuple(sorted(set(percentiles)))
 
 
 def websocket_test_view(request):
@@ -16,16 +197,27 @@ def websocket_test_view(request):
     return render(request, 'websocket_test.html')
 
 
-class UserViewSet(viewsets.ModelViewSet):
+def metrics_view(request):
+    """Serve this process's metrics in the Prometheus text format"""
+    if not metrics_enabled():
+        raise Http404
+    if not metrics_allowed(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain; charset=utf-8')
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class UserViewSet(SerializerTimingMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
 
-class DeviceViewSet(viewsets.ModelViewSet):
+class DeviceViewSet(CachedReadMixin, SerializerTimingMixin, viewsets.ModelViewSet):
     queryset = Device.objects.all()
     serializer_class = DeviceSerializer
+    cache_models = (Device, Sensor, Hydroponic, DEVICE_LAST_SEEN)
 
     @action(detail=True, methods=['get'])
+    @cached_response
     def sensors(self, request, pk=None):
         """Get all sensors for a specific device"""
         device = self.get_object()
@@ -34,6 +226,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
+    @cached_response
     def hydroponics(self, request, pk=None):
         """Get all hydroponic systems for a specific device"""
         device = self.get_object()
@@ -41,74 +234,302 @@ class DeviceViewSet(viewsets.ModelViewSet):
         serializer = HydroponicSerializer(hydroponics, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def dashboard(self, request, pk=None):
+        """Get a device with its hydroponics, sensors, latest readings and recent stats
+
+        ``window`` sets the stats window in seconds.
+        """
+        device = self.get_object()
+        window = parse_dashboard_window(request)
+        return Response(device_dashboards([device], window, timezone.now())[0])
 
-class QrCodeViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Get per-bucket reading stats for every sensor of a device
+
+        Takes the same parameters as ``/api/sensors/<id>/stats/``.
+        """
+        device = self.get_object()
+        since, until, bucket, percentiles = parse_stats_params(request)
+        sensors = list(device.sensors.order_by('sensor_id').values('sensor_id', 'sensor_type', 'unit'))
+        stats = sensor_stats([sensor['sensor_id'] for sensor in sensors], since, until, bucket, percentiles)
+        return Response([{**sensor, 'buckets': stats[sensor['sensor_id']]} for sensor in sensors])
+
+    @action(detail=False, methods=['get'], url_path='dashboard', url_name='dashboards')
+    def dashboards(self, request):
+        """Get the dashboards of the devices in ``ids`` (comma-separated) in one response"""
+        raw_ids = [part for part in request.query_params.get('ids', '').split(',') if part]
+        if not raw_ids:
+            return Response({'error': 'Please provide ids parameter'}, status=status.HTTP_400_BAD_REQUEST)
+        if not all(part.isdigit() for part in raw_ids):
+            raise ValidationError({'ids': ['A comma-separated list of device ids is required.']})
+        max_devices = settings.DEVICE_DASHBOARD['MAX_DEVICES']
+        if len(raw_ids) > max_devices:
+            raise ValidationError({'ids': [f'At most {max_devices} devices per request.']})
+        window = parse_dashboard_window(request)
+
+        devices = self.filter_queryset(self.get_queryset()).filter(
+            device_id__in=[int(part) for part in raw_ids]
+        ).order_by('device_id')
+        return Response(device_dashboards(devices, window, timezone.now()))
+
+
+class QrCodeViewSet(CachedReadMixin, QueryPlanMixin, SerializerTimingMixin, viewsets.ModelViewSet):
     queryset = QrCode.objects.all()
     serializer_class = QrCodeSerializer
+    cache_models = (QrCode, Device)
+    query_plans = {
+        'list': QRCODE_READ_PLAN,
+        'retrieve': QRCODE_READ_PLAN,
+    }
 
 
-class HydroponicViewSet(viewsets.ModelViewSet):
+class HydroponicViewSet(CachedReadMixin, QueryPlanMixin, SerializerTimingMixin, viewsets.ModelViewSet):
     queryset = Hydroponic.objects.all()
     serializer_class = HydroponicSerializer
+    cache_models = (Hydroponic, Device)
+    query_plans = {
+        'list': HYDROPONIC_READ_PLAN,
+        'retrieve': HYDROPONIC_READ_PLAN,
+    }
 
 
-class SensorViewSet(viewsets.ModelViewSet):
+class SensorViewSet(CachedReadMixin, ValuesReadMixin, QueryPlanMixin, SerializerTimingMixin, viewsets.ModelViewSet):
     queryset = Sensor.objects.all()
     serializer_class = SensorSerializer
+    cache_models = (Sensor, Device)
+    values_actions = ('list',)
+    values_serializer_class = SensorValuesSerializer
+    # Readings fetched through sensor.readings reuse this sensor (and its
+    # device) instead of loading them per row
+    query_plans = {
+        'list': SENSOR_READ_PLAN,
+        'retrieve': SENSOR_READ_PLAN,
+        'latest_data': SENSOR_READ_PLAN,
+        'data_history': SENSOR_READ_PLAN,
+        'stats': SENSOR_READ_PLAN,
+    }
 
     @action(detail=True, methods=['get'])
     def latest_data(self, request, pk=None):
         """Get the latest sensor reading"""
         sensor = self.get_object()
-        latest_reading = sensor.readings.first()
-        if latest_reading:
+        latest = latest_values.latest_readings([sensor.sensor_id])[sensor.sensor_id]
+        if latest:
+            latest_reading = SensorData(
+                data_id=latest['id'],
+                sensor=sensor,
+                value=latest['value'],
+                measured_at=parse_datetime(latest['measured_at']) if latest['measured_at'] else None,
+                created_at=parse_datetime(latest['created_at']),
+            )
             serializer = SensorDataSerializer(latest_reading)
             return Response(serializer.data)
         return Response({'message': 'No data available'}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Get reading stats per time bucket
+
+        ``bucket=1m|1h|1d`` (default 1h) buckets ``since``..``until`` (default
+        the last 24 hours); each bucket with readings has ``min``, ``max``,
+        ``avg``, ``count`` and ``stddev``, plus ``pNN`` for each of the
+        comma-separated ``percentiles``.
+        """
+        sensor = self.get_object()
+        since, until, bucket, percentiles = parse_stats_params(request)
+        return Response(sensor_stats([sensor.sensor_id], since, until, bucket, percentiles)[sensor.sensor_id])
+
     @action(detail=True, methods=['get'])
     def data_history(self, request, pk=None):
-        """Get sensor data history with optional filtering"""
+        """Get sensor data history with optional filtering
+
+        ``resolution=1m|1h|1d`` returns rollup buckets instead of raw readings;
+        ``resolution=auto`` picks the finest one that covers ``since``..``until``
+        in at most ``points`` buckets. ``method=lttb|minmax|avg`` instead
+        downsamples the raw readings to about ``points`` points.
+        """
         sensor = self.get_object()
-        readings = sensor.readings.all()
-        
+        since = parse_datetime_param(request, 'since')
+        until = parse_datetime_param(request, 'until')
+
+        if 'method' in request.query_params:
+            readings = sensor.readings.all()
+            if since:
+                readings = readings.filter(created_at__gte=since)
+            if until:
+                readings = readings.filter(created_at__lt=until)
+            return Response(downsampled_series(request, readings, since, until))
+
+        resolution = request.query_params.get('resolution', 'raw')
+        if resolution != 'raw':
+            points = parse_points_param(request)
+            if resolution == 'auto':
+                since, until = default_range(since, until)
+                resolution = choose_resolution(since, until, points)
+            elif resolution not in RESOLUTIONS:
+                return Response({'error': f"resolution must be one of raw, auto, {', '.join(RESOLUTIONS)}"},
+                               status=status.HTTP_400_BAD_REQUEST)
+
+            rollups = sensor.rollups.filter(resolution=resolution)
+            if since:
+                rollups = rollups.filter(bucket__gte=bucket_start(since, RESOLUTIONS[resolution]))
+            if until:
+                rollups = rollups.filter(bucket__lt=until)
+            serializer = SensorDataRollupSerializer(rollups[:points], many=True)
+            return Response(serializer.data)
+
+        readings = SensorDataValuesSerializer.values(sensor.readings.all())
+        if since:
+            readings = readings.filter(created_at__gte=since)
+        if until:
+            readings = readings.filter(created_at__lt=until)
+
         # Optional query parameters for filtering
         limit = request.query_params.get('limit', None)
         if limit:
             readings = readings[:int(limit)]
             
-        serializer = SensorDataSerializer(readings, many=True)
+        serializer = SensorDataValuesSerializer(readings, many=True)
         return Response(serializer.data)
 
 
-class SensorDataViewSet(viewsets.ModelViewSet):
+class SensorDataViewSet(ValuesReadMixin, QueryPlanMixin, SerializerTimingMixin, viewsets.ModelViewSet):
     queryset = SensorData.objects.all()
     serializer_class = SensorDataSerializer
+    pagination_class = SensorDataKeysetPagination
+    values_actions = ('list', 'by_sensor_type', 'by_device')
+    values_serializer_class = SensorDataValuesSerializer
+    # ?format=csv|ndjson|arrow (or the matching Accept header) streams the
+    # whole listing instead of one page
+    renderer_classes = ValuesReadMixin.renderer_classes + EXPORT_RENDERER_CLASSES
+    query_plans = {
+        'list': SENSOR_DATA_READ_PLAN,
+        'retrieve': SENSOR_DATA_READ_PLAN,
+        'by_sensor_type': SENSOR_DATA_READ_PLAN,
+        'by_device': SENSOR_DATA_READ_PLAN,
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'by_sensor_type', 'by_device'):
+            since = parse_datetime_param(self.request, 'since')
+            until = parse_datetime_param(self.request, 'until')
+            if since:
+                queryset = queryset.filter(created_at__gte=since)
+            if until:
+                queryset = queryset.filter(created_at__lt=until)
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'create':
             return SensorDataCreateSerializer
         return SensorDataSerializer
 
+    def perform_update(self, serializer):
+        before = (serializer.instance.sensor_id, serializer.instance.created_at)
+        reading = serializer.save()
+        rebuild_buckets([before, (reading.sensor_id, reading.created_at)])
+
+    def perform_destroy(self, instance):
+        sensor_id = instance.sensor_id
+        instance.delete()
+        rebuild_buckets([(sensor_id, instance.created_at)])
+        transaction.on_commit(lambda: latest_values.invalidate_sensor(sensor_id))
+
+    def is_export(self):
+        return isinstance(getattr(self.request, 'accepted_renderer', None), StreamingRenderer)
+
+    def export(self, queryset):
+        """Stream every reading in ``queryset`` in the negotiated export format
+
+        Rows are fetched with ``iterator()`` (a server-side cursor on
+        PostgreSQL) and encoded one chunk at a time, so memory use does not
+        grow with the size of the export. Under ASGI the chunks are handed
+        to the server through an async iterator; Django would otherwise
+        collect a sync stream in full before sending it.
+        """
+        renderer = self.request.accepted_renderer
+        chunk_size = settings.SENSOR_DATA_EXPORT_CHUNK_SIZE
+        rows = queryset.order_by('-created_at', '-data_id').iterator(chunk_size=chunk_size)
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        content = renderer.stream(rows, self.values_serializer_class, chunk_size)
+        if isinstance(self.request._request, ASGIRequest):
+            content = aiter_chunks(content)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="sensor-data.{renderer.filename_extension}"'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if self.is_export():
+            return self.export(self.filter_queryset(self.get_queryset()))
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """Create many sensor readings from a JSON array or NDJSON body"""
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'error': 'Expected a list of sensor readings'},
+                           status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > settings.SENSOR_DATA_BULK_MAX_ROWS:
+            return Response({'error': f'At most {settings.SENSOR_DATA_BULK_MAX_ROWS} readings per request'},
+                           status=status.HTTP_400_BAD_REQUEST)
+
+        results = ingest_readings(rows)
+        accepted = sum(1 for result in results if result['status'] == 'accepted')
+        return Response({
+            'accepted': accepted,
+            'rejected': len(results) - accepted,
+            'results': results,
+        }, status=status.HTTP_201_CREATED if accepted else status.HTTP_400_BAD_REQUEST)
+
     @action(detail=False, methods=['get'])
     def by_sensor_type(self, request):
         """Get sensor data filtered by sensor type"""
         sensor_type = request.query_params.get('type', None)
         if sensor_type:
-            data = SensorData.objects.filter(sensor__sensor_type=sensor_type)
-            serializer = SensorDataSerializer(data, many=True)
-            return Response(serializer.data)
+            data = self.get_queryset().filter(sensor__sensor_type=sensor_type)
+            page = self.paginate_queryset(data)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         return Response({'error': 'Please provide sensor type parameter'}, 
                        status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['get'])
     def by_device(self, request):
-        """Get sensor data filtered by device"""
+        """Get sensor data filtered by device
+
+        With ``method=lttb|minmax|avg`` returns one downsampled series of
+        about ``points`` points per sensor instead of raw readings.
+        ``format=csv|ndjson|arrow`` streams all matching readings.
+        """
         device_id = request.query_params.get('device_id', None)
         if device_id:
-            data = SensorData.objects.filter(sensor__device_id=device_id)
-            serializer = SensorDataSerializer(data, many=True)
-            return Response(serializer.data)
+            data = self.get_queryset().filter(sensor__device_id=device_id)
+
+            if 'method' in request.query_params:
+                since = parse_datetime_param(request, 'since')
+                until = parse_datetime_param(request, 'until')
+                series = []
+                for sensor in Sensor.objects.filter(device_id=device_id).order_by('sensor_id'):
+                    series.append({
+                        'sensor_id': sensor.sensor_id,
+                        'sensor_type': sensor.sensor_type,
+                        'unit': sensor.unit,
+                        'points': downsampled_series(request, data.filter(sensor=sensor), since, until),
+                    })
+                return Response(series)
+
+            if self.is_export():
+                return self.export(data)
+
+            page = self.paginate_queryset(data)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         return Response({'error': 'Please provide device_id parameter'}, 
                        status=status.HTTP_400_BAD_REQUEST)
 
@@ -130,7 +551,10 @@ class SensorDataViewSet(viewsets.ModelViewSet):
                     'format': {
                         'type': 'sensor_data',
                         'sensor_id': 'integer',
-                        'value': 'float'
+                        'value': 'float',
+                        'timestamp': 'ISO string (optional)',
+                        'ack': 'boolean (optional)',
+                        'ref': 'string (optional, echoed in the ack)'
                     }
                 },
                 'ping': {
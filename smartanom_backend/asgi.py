@@ -9,17 +9,23 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from core.routing import websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartanom_backend.settings')
 
-application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+# Set up Django before anything imports models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from core.fanout import ServerLoopMiddleware  # noqa: E402
+from core.metrics import with_metrics  # noqa: E402
+from core.routing import websocket_urlpatterns  # noqa: E402
+
+application = ServerLoopMiddleware(with_metrics(ProtocolTypeRouter({
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
     ),
-})
+}), websocket_urlpatterns))
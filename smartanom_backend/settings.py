@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -177,3 +178,185 @@ CHANNEL_LAYERS = {
         # },
     },
 }
+
+# Sensor data ingestion
+# Maximum rows accepted by one POST to /api/sensor-data/bulk/ and the
+# number of rows written per INSERT statement.
+SENSOR_DATA_BULK_MAX_ROWS = 10000
+SENSOR_DATA_BULK_CHUNK_SIZE = 1000
+
+# Rows fetched from the database cursor per chunk when streaming a CSV,
+# NDJSON or Arrow export of sensor readings
+SENSOR_DATA_EXPORT_CHUNK_SIZE = 2000
+
+# Write-behind buffer for readings received over WebSockets: a batch is
+# flushed with one bulk_create once MAX_BATCH_SIZE rows are queued or
+# MAX_LATENCY seconds have passed; senders wait while MAX_QUEUE_SIZE rows
+# are pending.
+SENSOR_INGEST_BUFFER = {
+    'MAX_BATCH_SIZE': 500,
+    'MAX_LATENCY': 0.05,
+    'MAX_QUEUE_SIZE': 10000,
+}
+
+# Threads running the WebSocket consumers' database work (snapshots, ingest
+# batches). None keeps Channels' default of one shared thread; a number runs
+# that work on a pool of that many threads, each holding its own database
+# connection, so keep it below the database's connection limit.
+CONSUMER_DB_POOL = {
+    'MAX_WORKERS': None,
+}
+
+# device_status frames: a status equal to the cached one is not written
+# again for STATUS_TTL seconds. Device.last_seen is written in batches at
+# most every LAST_SEEN_INTERVAL seconds per device; None turns it off.
+DEVICE_STATUS = {
+    'STATUS_TTL': 60,
+    'LAST_SEEN_INTERVAL': 30,
+}
+
+# WebSocket fan-out of new readings: broadcasts are coalesced per group and
+# sent as one batch frame every INTERVAL seconds, at most MAX_BATCH_SIZE
+# readings per frame.
+SENSOR_FANOUT = {
+    'INTERVAL': 0.05,
+    'MAX_BATCH_SIZE': 500,
+}
+
+# Limits for ws/sensor-data/ subscriptions: the highest max_rate (frames per
+# second) a client may ask for, and how many readings are held for a
+# rate-limited client before the oldest are dropped.
+SENSOR_SUBSCRIPTION = {
+    'MAX_RATE': 50,
+    'MAX_PENDING': 1000,
+}
+
+# Outbound queue of every WebSocket connection. When MAX_SIZE frames are
+# waiting, POLICY applies: 'oldest' drops the oldest frame, 'conflate' merges
+# reading batches keeping the newest reading per sensor, 'disconnect' closes
+# the socket. Clients whose oldest unsent frame stays older than LAG_BUDGET
+# seconds for LAG_GRACE seconds are closed with CLOSE_CODE.
+WEBSOCKET_SEND_QUEUE = {
+    'MAX_SIZE': 100,
+    'POLICY': 'conflate',
+    'LAG_BUDGET': 5.0,
+    'LAG_GRACE': 10.0,
+    'CLOSE_CODE': 4008,
+}
+
+# LRU cache of sensor/device metadata used when ingesting and broadcasting.
+# Entries expire after TTL seconds, which bounds how long a change made by
+# another worker goes unseen.
+SENSOR_METADATA_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+}
+
+# Latest reading per sensor, served to WebSocket clients on connect and by
+# /api/sensors/<id>/latest_data/. BACKEND 'memory' keeps a copy per process
+# whose entries expire after TTL seconds. Its invalidations also bump a
+# generation in CACHES[CACHE], which makes every process drop its copy on
+# its next read; that only reaches other workers and management commands
+# (compact_sensor_data) if that cache is shared, so with a per-process cache
+# an edit or delete made elsewhere goes unseen for up to TTL seconds.
+# 'redis' shares one copy through LOCATION (e.g. 'redis://127.0.0.1:6379/1').
+SENSOR_LATEST_STORE = {
+    'BACKEND': 'memory',
+    'LOCATION': None,
+    'TTL': 300,
+    'CACHE': 'api',
+    # For Redis:
+    # 'BACKEND': 'redis',
+    # 'LOCATION': 'redis://127.0.0.1:6379/1',
+    'KEY_PREFIX': 'smartanom:latest:',
+}
+
+# Caches. 'api' holds the versions and bodies behind the ETags of the
+# device, sensor, hydroponic and QR code endpoints (see API_CACHE); 'stats'
+# holds the stats of finished time buckets (see SENSOR_STATS), one entry
+# per sensor and bucket, apart so they cannot evict the ETag versions.
+# locmem is per process, so with more than one worker use a shared backend,
+# or a change seen by one worker leaves the others serving stale responses.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'smartanom-api',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+        # For Redis (or anything that speaks its protocol):
+        # 'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        # 'LOCATION': 'redis://127.0.0.1:6379/2',
+    },
+    'stats': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'smartanom-stats',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# Conditional GET for the slow-changing list and detail endpoints: responses
+# carry an ETag and Last-Modified, repeat polls get a 304, and bodies are
+# kept in CACHES[CACHE] for TIMEOUT seconds.
+API_CACHE = {
+    'ENABLED': True,
+    'CACHE': 'api',
+    'TIMEOUT': 300,
+}
+
+# compact_sensor_data deletes expired readings and rollups (see the
+# RetentionPolicy model) BATCH_SIZE rows per statement, sleeping
+# BATCH_PAUSE seconds between batches to leave room for writers.
+SENSOR_DATA_RETENTION = {
+    'BATCH_SIZE': 2000,
+    'BATCH_PAUSE': 0.0,
+}
+
+# Per-route HTTP latency, query and serializer time, and WebSocket message
+# counts per consumer, served in the Prometheus text format at /metrics.
+# ENABLED False removes the middleware, the ASGI wrapper and the endpoint.
+# BUCKETS are the latency histogram's upper bounds in seconds. Only staff
+# users, requests with "Authorization: Bearer <TOKEN>" and requests from
+# ALLOWED_IPS may read /metrics; behind a proxy every request may share its
+# address, so prefer the token there.
+METRICS = {
+    'ENABLED': True,
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    'TOKEN': None,
+    'ALLOWED_IPS': (),
+}
+
+# /api/devices/<id>/dashboard/ and /api/devices/dashboard/?ids=...: stats
+# cover the last STATS_WINDOW seconds unless ?window= asks otherwise (at
+# most MAX_WINDOW), and one request may ask for at most MAX_DEVICES devices.
+DEVICE_DASHBOARD = {
+    'STATS_WINDOW': 3600,
+    'MAX_WINDOW': 366 * 86400,
+    'MAX_DEVICES': 50,
+}
+
+# /api/sensors/<id>/stats/ and /api/devices/<id>/stats/: one request covers
+# at most MAX_BUCKETS buckets. Stats of buckets that ended SETTLE seconds ago
+# are kept in CACHES[CACHE] for TIMEOUT seconds, so repeat calls only
+# compute the open buckets.
+SENSOR_STATS = {
+    'MAX_BUCKETS': 1440,
+    'CACHE': 'stats',
+    'TIMEOUT': 86400,
+    'SETTLE': 10,
+}
+
+# Threshold alerting on the ingest path (see the AlertRule model): each
+# process evaluates the readings it ingests and reloads the rules every
+# RELOAD_INTERVAL seconds; a change made in the same process applies at once.
+ALERTS = {
+    'ENABLED': True,
+    'RELOAD_INTERVAL': 30,
+}
+
+# Default point budget for data_history rollups (resolution=auto picks the
+# finest rollup that fits the requested range in this many buckets) and for
+# downsampled series; a larger ?points= than MAX_POINTS is rejected with 400
+SENSOR_DATA_HISTORY_POINTS = 500
+SENSOR_DATA_HISTORY_MAX_POINTS = 10000